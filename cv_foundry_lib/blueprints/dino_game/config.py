@@ -32,6 +32,18 @@ SYNTHESIS_CONFIG = {
     "FORCE_DINO": True,
     "MAX_OBSTACLES_PER_IMAGE": 3,
     "SCALE_RANGE": (0.8, 1.2),
+    # 资产背景移除的颜色容差，以及去背景后资产的磁盘缓存目录
+    "MASK_TOLERANCE": 25,
+    "ASSET_CACHE_DIR": OUTPUTS_DIR / "cache" / "assets" / BLUEPRINT_DIR.name,
+    # 蓝图级基础随机种子：每张图片的种子都由它派生，保证并行合成结果可复现
+    "SEED": 42,
+    # 并行合成时每个任务分片包含的图片数
+    "SHARD_SIZE": 256,
+    # 精灵缩放比例的量化步长，以及预缩放精灵 LRU 缓存的容量上限
+    "SPRITE_SCALE_STEP": 0.02,
+    "SPRITE_CACHE_SIZE": 512,
+    # 输出格式: 'yolo' (每个样本一个PNG+TXT) 或 'packed' (可内存映射的分片 + 列式标签索引)
+    "OUTPUT_FORMAT": "yolo",
     # [新] 输出路径现在由配置驱动
     "OUTPUT_DATASET_DIR": OUTPUTS_DIR / "datasets" / BLUEPRINT_DIR.name
 }
@@ -45,14 +57,65 @@ MODEL_CONFIG = {
 TRAINER_CONFIG = {
     "EPOCHS": 50,
     "BATCH_SIZE": 16,
+    # 整数为正方形输入；[高, 宽] 为矩形输入 (rect 训练 + 矩形导出)，宽高比应接近实际截图区域以减少灰边填充。
+    # 注意 rect 训练会关闭 Mosaic/MixUp 增强，可先用 `--step benchmark-shapes` 对比后再决定
     "IMG_SIZE": 320,
+    # `--step benchmark-shapes` 比较的输入尺寸，第一个为基准
+    "SHAPE_BENCHMARK": [320, [160, 640]],
+    # 数据加载: 'prepare' 步骤把数据集预缩放到训练分辨率并写成可内存映射的分片，存在有效缓存时训练自动读取它
+    "USE_PREPARED_DATA": True,
+    "PREPARE_WORKERS": 0, # 预处理的并行线程数，0 表示使用全部CPU核
+    "WORKERS": 8, # DataLoader 工作进程数 (纯CPU训练时数据增强也在这些进程中完成)
+    "CACHE": False, # Ultralytics 图像缓存: False / 'ram' (整个数据集缩放后常驻内存) / 'disk'
+    # 按类别均衡的权重对训练集有放回采样 (权重来自标签索引，稀有类别的图片被抽中的概率更高)，可先用 `--step stats` 查看类别分布
+    "BALANCED_SAMPLING": False,
+    # 训练过程控制: 中断 (崩溃、被抢占) 后重新运行同一步骤时从最后一个检查点继续；
+    # 验证集 mAP 连续 PATIENCE 个epoch没有提升时提前停止 (0 表示关闭)；累计训练时间将超出 TIME_BUDGET_HOURS 时停止 (None 表示不限)。
+    # PATIENCE / TIME_BUDGET_HOURS 可在 FINETUNE_CONFIG / MIXED_CONFIG 中单独覆盖
+    "RESUME": True,
+    "PATIENCE": 15,
+    "TIME_BUDGET_HOURS": None,
     "OUTPUT_MODELS_DIR": OUTPUTS_DIR / "models",
+    # 预训练数据来源: 'disk' 读取 synthesize 步骤的输出; 'stream' 在训练时即时合成，无需 synthesize
+    "PRETRAIN_DATA_SOURCE": "disk",
     
     # [新] 为微调阶段添加专门的配置
     "FINETUNE_CONFIG": {
         "EPOCHS": 75, # 微调时，我们可以增加轮次以更好地学习真实数据特征
         "BATCH_SIZE": 8 # 使用更小的批量，让模型更精细地学习每一张宝贵的真实图片
     },
+    # 混合训练 (`--step mixed`): 从基础模型出发，一次训练中同时采样合成与真实训练集，取代 pretrain → finetune 两次完整训练
+    "MIXED_CONFIG": {
+        "EPOCHS": 40,
+        "BATCH_SIZE": 16,
+        "IMAGES_PER_EPOCH": 0, # 每个epoch有放回采样的图片数，0 表示合成与真实训练集的图片总数
+        # 真实样本占比计划: [[训练进度 0~1, 真实样本占比], ...] 分段线性插值，前期以合成数据为主，后期逐步转向真实数据
+        "REAL_RATIO_SCHEDULE": [[0.0, 0.2], [1.0, 0.8]],
+        # 报告中的目标精度 (真实 valid 划分上的 mAP50-95)，None 表示以两阶段微调模型的精度为目标
+        "TARGET_MAP50_95": None,
+    },
     # [新] 定义真实数据集的位置
     "REAL_DATASET_DIR": INPUTS_DIR / "real_world_data" / "annotated_data"
-}
\ No newline at end of file
+}
+
+# --- 5. 导出配置 (Export Config) ---
+EXPORT_CONFIG = {
+    "OPSET": 12,
+    "SIMPLIFY": False, # 继续禁用简化器以规避潜在的内存错误
+    # 额外生成的量化变体: 'int8' (用真实训练图片静态校准) 和/或 'fp16'，为空则只导出 FP32
+    "QUANTIZE": [],
+    "CALIBRATION_IMAGES": 100,
+    # 生成变体后在真实数据的 test 划分上比较各变体的CPU延迟和mAP，写出对比表
+    "QUANT_REPORT": True,
+    "BENCHMARK_RUNS": 50,
+}
+
+# --- 6. 运行时调优配置 (Tune Config) ---
+TUNE_CONFIG = {
+    # 参与比较的算子内线程数，为空则根据本机CPU核数自动选择 (1、2、4、半数核、全部核)
+    "THREADS": [],
+    # 额外比较的输入分辨率 (如 [256, 224])，为空则只调优导出分辨率；降低分辨率后 mAP50-95 下降超过 MAX_MAP_DROP 的不会被选用
+    "INPUT_SIZES": [],
+    "MAX_MAP_DROP": 0.01,
+    "BENCHMARK_RUNS": 30,
+}
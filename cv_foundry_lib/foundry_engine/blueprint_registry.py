@@ -0,0 +1,71 @@
+# cv_foundry/foundry_engine/blueprint_registry.py
+
+import importlib
+from pathlib import Path
+from types import ModuleType
+
+# 注意：本模块只依赖标准库，列出和校验蓝图时不会导入 torch/ultralytics 等重量级依赖。
+
+BLUEPRINTS_DIR = Path(__file__).resolve().parents[1] / "blueprints"
+
+# 每个蓝图 config.py 必须提供的顶层属性，以及各配置字典中必须存在的键
+REQUIRED_ATTRS = ["BLUEPRINT_DIR", "OUTPUTS_DIR", "ASSETS_PATH", "CLASSES",
+                  "SYNTHESIS_CONFIG", "MODEL_CONFIG", "TRAINER_CONFIG"]
+REQUIRED_KEYS = {
+    "SYNTHESIS_CONFIG": ["NUM_TRAIN_IMAGES", "NUM_VAL_IMAGES", "IMAGE_WIDTH", "IMAGE_HEIGHT",
+                         "MAX_OBSTACLES_PER_IMAGE", "SCALE_RANGE", "OUTPUT_DATASET_DIR"],
+    "MODEL_CONFIG": ["BASE_MODEL"],
+    "TRAINER_CONFIG": ["EPOCHS", "BATCH_SIZE", "IMG_SIZE", "OUTPUT_MODELS_DIR",
+                       "FINETUNE_CONFIG", "REAL_DATASET_DIR"],
+}
+
+
+def discover() -> dict:
+    """扫描 blueprints/*/config.py，返回 {蓝图名: config.py 路径}，不导入任何蓝图。"""
+    if not BLUEPRINTS_DIR.is_dir():
+        return {}
+    return {
+        path.parent.name: path
+        for path in sorted(BLUEPRINTS_DIR.glob("*/config.py"))
+        if not path.parent.name.startswith(("_", "."))
+    }
+
+
+def load(name: str) -> ModuleType:
+    """
+    导入指定蓝图的配置模块。
+    蓝图不存在时返回 None；蓝图存在但导入出错时，异常会原样抛出，而不是被误报为“找不到蓝图”。
+    """
+    if name not in discover():
+        return None
+    return importlib.import_module(f"blueprints.{name}.config")
+
+
+def validate(config_module: ModuleType) -> list:
+    """检查蓝图配置的完整性，返回问题描述列表 (为空表示校验通过)。"""
+    problems = [f"缺少顶层配置 '{attr}'" for attr in REQUIRED_ATTRS if not hasattr(config_module, attr)]
+    for section, keys in REQUIRED_KEYS.items():
+        cfg = getattr(config_module, section, None)
+        if not isinstance(cfg, dict):
+            continue
+        problems += [f"{section} 缺少键 '{key}'" for key in keys if key not in cfg]
+
+    classes = getattr(config_module, "CLASSES", None)
+    if isinstance(classes, dict) and sorted(classes.values()) != list(range(len(classes))):
+        problems.append("CLASSES 的类别ID必须是从0开始的连续整数")
+    assets_path = getattr(config_module, "ASSETS_PATH", None)
+    if assets_path is not None and not Path(assets_path).is_dir():
+        problems.append(f"资产目录不存在: {assets_path}")
+    return problems
+
+
+def describe_all() -> list:
+    """导入并校验所有蓝图，返回 [(蓝图名, 问题列表)]，导入失败也会作为问题报告。"""
+    results = []
+    for name in discover():
+        try:
+            problems = validate(load(name))
+        except Exception as e:
+            problems = [f"导入 config.py 失败: {e}"]
+        results.append((name, problems))
+    return results
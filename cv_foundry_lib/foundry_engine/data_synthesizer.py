@@ -1,55 +1,83 @@
 # cv_foundry/foundry_engine/data_synthesizer.py (黄金标准 V2.0 - 重构版)
 
+import hashlib
 import os
 import random
+import shutil
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from pathlib import Path
 from typing import Type
 
+import numpy as np
 from PIL import Image, ImageChops
 from tqdm import tqdm
 
+from . import packed_dataset, synthesis_manifest
+from .sprite_compositor import SpriteCompositor
 
-def _create_mask_from_single_color_bg(img: Image.Image, tolerance: int = 25) -> Image.Image:
+# 资产背景移除的默认颜色容差 (可在蓝图 SYNTHESIS_CONFIG["MASK_TOLERANCE"] 中覆盖)
+DEFAULT_MASK_TOLERANCE = 25
+
+
+def _create_mask_from_single_color_bg(img: Image.Image, tolerance: int = DEFAULT_MASK_TOLERANCE) -> Image.Image:
     """从单一颜色背景的图像创建蒙版（对绿幕、灰幕、黑幕都有效）。"""
-    # 将图像转换为带Alpha通道的格式，以防万一
-    img_rgba = img.convert("RGBA")
-    
+    # 将图像转换为带Alpha通道的格式，以防万一；用int16避免uint8相减时溢出
+    pixels = np.asarray(img.convert("RGBA"), dtype=np.int16)
+
     # 自动识别背景色：我们假设左上角第一个像素就是背景色
-    bg_pixel = img_rgba.getpixel((0, 0))
-    
-    # 创建一个与图像大小相同的全透明蒙版
-    mask = Image.new('L', img_rgba.size, 0)
-    
-    # 遍历所有像素
-    for x in range(img_rgba.width):
-        for y in range(img_rgba.height):
-            p = img_rgba.getpixel((x, y))
-            
-            # 计算当前像素与背景色的差异
-            is_background = all(abs(p[i] - bg_pixel[i]) <= tolerance for i in range(3))
+    bg_pixel = pixels[0, 0, :3]
+
+    # 一次性计算所有像素与背景色的差异：RGB三个通道都在容差内才算背景
+    is_background = (np.abs(pixels[..., :3] - bg_pixel) <= tolerance).all(axis=-1)
+
+    # 非背景像素在蒙版上为不透明 (255)，背景为全透明 (0)
+    mask = np.where(is_background, 0, 255).astype(np.uint8)
+    return Image.fromarray(mask)
 
-            # 如果像素不是背景色，就在蒙版对应位置画一个不透明的点
-            if not is_background:
-                mask.putpixel((x, y), 255) # 255代表不透明
-    return mask
+
+def _load_processed_asset(asset_file: Path, tolerance: int, cache_dir: Path) -> tuple:
+    """
+    加载单个资产并移除背景，结果以RGBA PNG的形式缓存到磁盘。
+    缓存键由资产文件内容的哈希和容差共同决定，资产被修改后会自动失效。
+    返回 (RGBA图像, 是否命中缓存)。
+    """
+    digest = hashlib.sha256(asset_file.read_bytes()).hexdigest()[:16]
+    cache_path = cache_dir / f"{asset_file.stem}_{digest}_tol{tolerance}.png"
+
+    if cache_path.exists():
+        try:
+            with Image.open(cache_path) as cached:
+                return cached.convert("RGBA"), True
+        except Exception as e:
+            print(f"[警告] 资产缓存 '{cache_path.name}' 已损坏，将重新生成: {e}")
+
+    img_rgba = Image.open(asset_file).convert("RGBA")
+    mask = _create_mask_from_single_color_bg(img_rgba, tolerance)
+    img_rgba.putalpha(mask)
+
+    # 先写临时文件再原子替换，避免中断时留下半个缓存文件
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_suffix(".tmp")
+    img_rgba.save(tmp_path, format="PNG")
+    os.replace(tmp_path, cache_path)
+    return img_rgba, False
 
 
 def _get_asset_images(config_module: Type) -> dict:
-    """加载所有视觉资产并移除背景。"""
+    """加载所有视觉资产并移除背景（带磁盘缓存）。"""
     assets_path = config_module.ASSETS_PATH
+    cfg = config_module.SYNTHESIS_CONFIG
+    tolerance = cfg.get("MASK_TOLERANCE", DEFAULT_MASK_TOLERANCE)
+    cache_dir = cfg.get("ASSET_CACHE_DIR", assets_path / ".cache")
     asset_images = {cls: [] for cls in config_module.CLASSES.keys()}
+    cache_hits = 0
 
-    for asset_file in assets_path.glob("*.png"):
+    for asset_file in sorted(assets_path.glob("*.png")):
         class_name = asset_file.name.split("-")[0]
         if class_name in asset_images:
             try:
-                img_rgba = Image.open(asset_file).convert("RGBA")
-                
-                # [修改] 调用我们全新的、更智能的蒙版创建函数
-                mask = _create_mask_from_single_color_bg(img_rgba)
-                
-                img_rgba.putalpha(mask)
-
+                img_rgba, from_cache = _load_processed_asset(asset_file, tolerance, cache_dir)
+                cache_hits += from_cache
                 asset_images[class_name].append(img_rgba)
             except Exception as e:
                 print(f"[警告] 无法加载或处理资产 '{asset_file.name}': {e}")
@@ -58,91 +86,244 @@ def _get_asset_images(config_module: Type) -> dict:
     if loaded_count == 0:
         print("[严重错误] 未能成功加载任何有效资产！请检查文件名和文件内容。")
     else:
-        print(f"成功加载并处理了 {loaded_count} 个视觉资产。")
+        print(f"成功加载并处理了 {loaded_count} 个视觉资产 (其中 {cache_hits} 个来自缓存)。")
     return asset_images
 
-def _generate_dataset(num_images: int, output_dir: Path, config_module: Type, asset_images: dict):
+def _derive_seed(base_seed: int, split: str, index: int) -> int:
+    """由蓝图级基础种子、数据集划分和图片索引派生出该图片专属的随机种子。"""
+    key = f"{base_seed}:{split}:{index}".encode()
+    return int.from_bytes(hashlib.sha256(key).digest()[:8], "little")
+
+
+def _build_compositor(cfg: dict, asset_images: dict) -> SpriteCompositor:
+    """根据合成配置创建并预热精灵合成器。"""
+    compositor = SpriteCompositor(
+        asset_images,
+        scale_step=cfg.get("SPRITE_SCALE_STEP", 0.02),
+        max_cache_entries=cfg.get("SPRITE_CACHE_SIZE", 512),
+    )
+    compositor.prewarm(cfg["SCALE_RANGE"])
+    return compositor
+
+
+def _render_sample(rng: random.Random, cfg: dict, classes: dict, compositor: SpriteCompositor) -> tuple:
     """
-    生成指定数量的图片和标签到指定的输出目录。
+    使用给定的随机数生成器合成一张画布。
+    返回 (RGB画布数组, 标注列表)，标注为 (class_id, 归一化cx, cy, w, h) 元组。
+    只依赖传入的 rng，因此同一种子总是得到完全相同的结果。
+    注意：画布是合成器复用的缓冲区，下一次调用前需要保存或拷贝。
     """
+    canvas_w, canvas_h = cfg["IMAGE_WIDTH"], cfg["IMAGE_HEIGHT"]
+    canvas = compositor.new_canvas(canvas_w, canvas_h)
+    annotations = []
+
+    # [逻辑简化] 移除原有的FORCE_DINO的复杂逻辑，我们可以在更高层次保证
+    # 或者在循环内部进行更简单的处理。
+    # 此处为了清晰，我们暂时简化为随机生成。
+
+    num_obstacles = rng.randint(1, cfg["MAX_OBSTACLES_PER_IMAGE"])
+    if not compositor.has_assets():
+        return canvas, annotations
+
+    for _ in range(num_obstacles):
+        class_name = rng.choice(list(classes.keys()))
+        num_variants = compositor.num_variants(class_name)
+        if not num_variants:
+            continue
+
+        # 缩放比例会被量化到 SPRITE_SCALE_STEP 档位，以命中预缩放精灵缓存
+        asset_idx = rng.randrange(num_variants)
+        scale = rng.uniform(*cfg["SCALE_RANGE"])
+        sprite = compositor.get_sprite(class_name, asset_idx, scale)
+        new_h, new_w = sprite[0].shape[:2]
+
+        paste_x = rng.randint(0, canvas_w - new_w)
+        # 简化逻辑，假设所有物体都在地面上
+        paste_y = canvas_h - new_h
+
+        compositor.blend(canvas, sprite, paste_x, paste_y)
+
+        class_id = classes[class_name]
+        center_x = paste_x + new_w / 2
+        center_y = paste_y + new_h / 2
+        annotations.append((class_id, center_x / canvas_w, center_y / canvas_h, new_w / canvas_w, new_h / canvas_h))
+
+    return canvas, annotations
+
+
+def _format_annotations(annotations: list) -> str:
+    """将标注元组转换为YOLO格式的标签文本。"""
+    return "\n".join(f"{cid} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}" for cid, cx, cy, w, h in annotations)
+
+
+# 子进程中的合成状态，由 _init_worker 在进程池启动时注入，避免每个分片重复传输资产
+_WORKER_STATE = {}
+
+
+def _init_worker(cfg: dict, classes: dict, asset_images: dict, base_seed: int):
+    """进程池初始化函数：把合成所需的只读状态保存到子进程的全局变量中，并为该进程建立精灵缓存。"""
+    _WORKER_STATE.update(
+        cfg=cfg, classes=classes, base_seed=base_seed,
+        compositor=_build_compositor(cfg, asset_images),
+    )
+
+
+def _render_shard(split: str, shard_id: int, start: int, stop: int, output_dir: Path, packed: bool) -> tuple:
+    """
+    渲染 [start, stop) 区间内的图片并写入磁盘。
+    - YOLO 格式: 每张图片写出 synth_{i}.png / synth_{i}.txt。
+    - 打包格式: 整个分片写成一个 .npy 文件，标签以元数据形式返回，由主进程汇总为列式索引。
+    所有输出写完后再写分片记录，中断后重跑时据此跳过已完成的分片。
+    返回 (处理的图片数量, 打包元数据或None)。
+    """
+    cfg, classes = _WORKER_STATE["cfg"], _WORKER_STATE["classes"]
+    compositor, base_seed = _WORKER_STATE["compositor"], _WORKER_STATE["base_seed"]
     img_dir = output_dir / "images"
     lbl_dir = output_dir / "labels"
-    img_dir.mkdir(parents=True, exist_ok=True)
-    lbl_dir.mkdir(parents=True, exist_ok=True)
+    written, packed_images, packed_annotations = [], [], []
+
+    for i in range(start, stop):
+        rng = random.Random(_derive_seed(base_seed, split, i))
+        canvas, annotations = _render_sample(rng, cfg, classes, compositor)
+        if not annotations:
+            continue
+        written.append(i)
+        if packed:
+            # 打包分片中存储 BGR 图像，训练端可直接使用而无需再转换
+            packed_images.append(canvas[..., ::-1].copy())
+            packed_annotations.append(annotations)
+        else:
+            Image.fromarray(canvas).save(img_dir / f"synth_{i}.png")
+            with open(lbl_dir / f"synth_{i}.txt", "w") as f:
+                f.write(_format_annotations(annotations))
+
+    meta = None
+    if packed:
+        image_shape = (cfg["IMAGE_HEIGHT"], cfg["IMAGE_WIDTH"], 3)
+        name = packed_dataset.write_shard(output_dir, shard_id, packed_images, image_shape)
+        meta = {"shard": name, "sample_ids": written, "annotations": packed_annotations}
+    synthesis_manifest.write_shard_record(output_dir, shard_id, {
+        "start": start, "stop": stop, "outputs": written, "packed": meta,
+    })
+    return stop - start, meta
 
+
+def _remove_shard_outputs(output_dir: Path, shard_id: int, record: dict):
+    """删除一个过期分片 (例如样本数量减少后多出的分片) 的全部输出及其记录。"""
+    if record.get("packed"):
+        (output_dir / record["packed"]["shard"]).unlink(missing_ok=True)
+    else:
+        for i in record.get("outputs", []):
+            (output_dir / "images" / f"synth_{i}.png").unlink(missing_ok=True)
+            (output_dir / "labels" / f"synth_{i}.txt").unlink(missing_ok=True)
+    synthesis_manifest.remove_shard_record(output_dir, shard_id)
+
+
+def _generate_dataset(num_images: int, output_dir: Path, config_module: Type, asset_images: dict, workers: int = 1):
+    """
+    生成指定数量的图片和标签到指定的输出目录。
+    索引区间被切分为固定大小的分片，每张图片使用由基础种子派生的独立种子，
+    因此无论使用多少个工作进程，输出都完全一致。
+    已有完整记录且边界不变的分片会被跳过，因此样本数增加时只生成缺失的部分，中断后也能继续。
+    """
     cfg = config_module.SYNTHESIS_CONFIG
-    canvas_w, canvas_h = cfg["IMAGE_WIDTH"], cfg["IMAGE_HEIGHT"]
+    packed = cfg.get("OUTPUT_FORMAT", "yolo") == "packed"
+    if packed:
+        output_dir.mkdir(parents=True, exist_ok=True)
+    else:
+        (output_dir / "images").mkdir(parents=True, exist_ok=True)
+        (output_dir / "labels").mkdir(parents=True, exist_ok=True)
 
-    print(f"开始生成 {num_images} 张图片到 '{output_dir.name}' 目录...")
-    for i in tqdm(range(num_images), desc=f"合成 {output_dir.name} 数据集"):
-        canvas = Image.new("RGB", (canvas_w, canvas_h), (255, 255, 255))
-        annotations = []
-        
-        # [逻辑简化] 移除原有的FORCE_DINO的复杂逻辑，我们可以在更高层次保证
-        # 或者在循环内部进行更简单的处理。
-        # 此处为了清晰，我们暂时简化为随机生成。
-        
-        num_obstacles = random.randint(1, cfg["MAX_OBSTACLES_PER_IMAGE"])
-        if not any(asset_images.values()):
-            continue
-            
-        for _ in range(num_obstacles):
-            class_name = random.choice(list(config_module.CLASSES.keys()))
-            if not asset_images.get(class_name):
-                continue
-            
-            asset_rgba = random.choice(asset_images[class_name]).copy()
-            scale = random.uniform(*cfg["SCALE_RANGE"])
-            new_w = int(asset_rgba.width * scale)
-            new_h = int(asset_rgba.height * scale)
-            asset_resized = asset_rgba.resize((new_w, new_h), Image.Resampling.LANCZOS)
-            
-            paste_x = random.randint(0, canvas_w - new_w)
-            # 简化逻辑，假设所有物体都在地面上
-            paste_y = canvas_h - new_h
-            
-            canvas.paste(asset_resized, (paste_x, paste_y), asset_resized)
-
-            class_id = config_module.CLASSES[class_name]
-            center_x = paste_x + new_w / 2
-            center_y = paste_y + new_h / 2
-            norm_cx = center_x / canvas_w
-            norm_cy = center_y / canvas_h
-            norm_w = new_w / canvas_w
-            norm_h = new_h / canvas_h
-            annotations.append(f"{class_id} {norm_cx:.6f} {norm_cy:.6f} {norm_w:.6f} {norm_h:.6f}")
-        
-        if annotations:
-            img_path = img_dir / f"synth_{i}.png"
-            lbl_path = lbl_dir / f"synth_{i}.txt"
-            canvas.save(img_path)
-            with open(lbl_path, "w") as f:
-                f.write("\n".join(annotations))
+    base_seed = cfg.get("SEED", 0)
+    shard_size = cfg.get("SHARD_SIZE", 256)
+    split = output_dir.name
+    shards = [(start, min(start + shard_size, num_images)) for start in range(0, num_images, shard_size)]
+    init_args = (cfg, config_module.CLASSES, asset_images, base_seed)
+
+    # 对照已完成分片的记录：边界一致的直接复用，其余 (如末尾分片变长、分片被移除) 视为过期
+    shard_metas = []
+    done = set()
+    for shard_id, record in synthesis_manifest.load_shard_records(output_dir).items():
+        if shard_id < len(shards) and (record["start"], record["stop"]) == shards[shard_id]:
+            done.add(shard_id)
+            shard_metas.append(record.get("packed"))
+        else:
+            _remove_shard_outputs(output_dir, shard_id, record)
+    pending = [(shard_id, start, stop) for shard_id, (start, stop) in enumerate(shards) if shard_id not in done]
+    pending_images = sum(stop - start for _, start, stop in pending)
+
+    print(f"开始生成 {pending_images}/{num_images} 张图片到 '{split}' 目录 "
+          f"(工作进程: {workers}, 待生成分片: {len(pending)}, 已完成分片: {len(done)})...")
+    with tqdm(total=pending_images, desc=f"合成 {split} 数据集", disable=not pending) as pbar:
+        if workers <= 1:
+            if pending:
+                _init_worker(*init_args)
+            for shard_id, start, stop in pending:
+                count, meta = _render_shard(split, shard_id, start, stop, output_dir, packed)
+                shard_metas.append(meta)
+                pbar.update(count)
+        elif pending:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=init_args) as pool:
+                futures = [
+                    pool.submit(_render_shard, split, shard_id, start, stop, output_dir, packed)
+                    for shard_id, start, stop in pending
+                ]
+                for future in as_completed(futures):
+                    count, meta = future.result()
+                    shard_metas.append(meta)
+                    pbar.update(count)
+
+    if packed:
+        packed_dataset.write_index(output_dir, shard_metas, (cfg["IMAGE_HEIGHT"], cfg["IMAGE_WIDTH"], 3))
 
 # run 函数需要重大重构，以使用新的配置
-def run(config_module: Type):
-    """[重构] 数据合成引擎的主入口。"""
+def run(config_module: Type, workers: int = 1, force: bool = False):
+    """
+    [重构] 数据合成引擎的主入口。workers > 1 时使用进程池并行合成。
+    合成结果由数据集根目录下的 manifest.json 描述 (配置哈希、资产哈希、种子、各划分样本数)：
+    输入未变化时直接跳过；样本数变化时只增删差异部分；输入变化或 force=True 时从头生成。
+    返回数据集根目录 (合成失败时抛出异常)。
+    """
     print("\n--- 启动数据合成引擎 (Data Synthesizer)  ---")
     
-    asset_images = _get_asset_images(config_module)
-    
     # 从配置中获取所有需要的信息
     cfg = config_module.SYNTHESIS_CONFIG
-    dataset_root = cfg["OUTPUT_DATASET_DIR"]
-    
-    # 为训练集和验证集调用生成函数
-    _generate_dataset(
-        num_images=cfg["NUM_TRAIN_IMAGES"], 
-        output_dir=dataset_root / "train", 
-        config_module=config_module, 
-        asset_images=asset_images
-    )
-    
-    _generate_dataset(
-        num_images=cfg["NUM_VAL_IMAGES"], 
-        output_dir=dataset_root / "val", 
-        config_module=config_module, 
-        asset_images=asset_images
-    )
+    manifest_root = cfg["OUTPUT_DATASET_DIR"]
+    dataset_root = manifest_root
+    # 打包格式写入 <数据集根目录>/packed/<划分>，与YOLO目录结构互不干扰
+    if cfg.get("OUTPUT_FORMAT", "yolo") == "packed":
+        dataset_root = dataset_root / "packed"
+    split_sizes = {"train": cfg["NUM_TRAIN_IMAGES"], "val": cfg["NUM_VAL_IMAGES"]}
+
+    fingerprint = synthesis_manifest.compute_fingerprint(config_module)
+    manifest = synthesis_manifest.load_manifest(manifest_root)
+    if not force and synthesis_manifest.fingerprint_matches(manifest, fingerprint):
+        if manifest.get("splits") == {split: {"num_images": n, "complete": True} for split, n in split_sizes.items()}:
+            print(f"✅ 合成数据集已是最新 (配置、资产与种子均未变化)，跳过生成: '{dataset_root}'")
+            return dataset_root
+    else:
+        # 输入发生变化 (或没有清单)：旧输出全部作废，清理后从头生成
+        for stale_dir in (manifest_root / "train", manifest_root / "val", manifest_root / "packed"):
+            if stale_dir.exists():
+                print(f"合成输入已变化，清理旧输出: {stale_dir}")
+                shutil.rmtree(stale_dir)
+
+    manifest = dict(fingerprint, splits={split: {"num_images": n, "complete": False} for split, n in split_sizes.items()})
+    synthesis_manifest.save_manifest(manifest_root, manifest)
+
+    asset_images = _get_asset_images(config_module)
+
+    # 为训练集和验证集调用生成函数，每完成一个划分就更新清单
+    for split, num_images in split_sizes.items():
+        _generate_dataset(
+            num_images=num_images,
+            output_dir=dataset_root / split,
+            config_module=config_module,
+            asset_images=asset_images,
+            workers=workers
+        )
+        manifest["splits"][split]["complete"] = True
+        synthesis_manifest.save_manifest(manifest_root, manifest)
     
-    print(f"\n✅ 数据合成引擎运行完毕！数据集已生成至 '{dataset_root}'")
\ No newline at end of file
+    print(f"\n✅ 数据合成引擎运行完毕！数据集已生成至 '{dataset_root}'")
+    return dataset_root
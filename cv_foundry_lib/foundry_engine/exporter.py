@@ -5,8 +5,12 @@ from typing import Type
 
 from ultralytics import YOLO
 
-def run(config_module: Type, source_model: str = 'finetune'): # 默认导出微调模型
-    """ 模型导出引擎主入口。"""
+def run(config_module: Type, source_model: str = 'finetune', img_size=None, quantize: bool = True): # 默认导出微调模型
+    """
+    模型导出引擎主入口。
+    输入尺寸取自 TRAINER_CONFIG["IMG_SIZE"] (整数为正方形，[高, 宽] 为矩形)，img_size 可覆盖它。
+    返回导出的 ONNX 路径，失败时返回 None。
+    """
     print(f"\n--- 启动模型导出引擎 (Exporting from '{source_model}') ---")
     
     blueprint_name = config_module.BLUEPRINT_DIR.name
@@ -25,17 +29,20 @@ def run(config_module: Type, source_model: str = 'finetune'): # 默认导出微
         model = YOLO(pt_model_path)
         print(f"成功加载已训练的模型: {pt_model_path.name}")
         
-        # --- 核心导出逻辑 (保持不变) ---
-        # 我们继续禁用简化器以规避潜在的内存错误
+        # --- 核心导出逻辑 ---
+        # 默认继续禁用简化器以规避潜在的内存错误
+        export_cfg = getattr(config_module, "EXPORT_CONFIG", {})
         print("\n--- 开始导出为ONNX格式 (已禁用简化器以规避Bug) ---")
         
         # [路径更新] ultralytics 会自动将导出的 onnx 文件
         # 存放在与 .pt 模型相同的目录中。
         # 所以我们无需特殊指定输出路径。
+        img_size = img_size if img_size is not None else config_module.TRAINER_CONFIG["IMG_SIZE"]
         onnx_path = model.export(
             format="onnx", 
-            opset=12, 
-            simplify=False
+            imgsz=img_size if isinstance(img_size, int) else list(img_size),
+            opset=export_cfg.get("OPSET", 12),
+            simplify=export_cfg.get("SIMPLIFY", False)
         )
         print(f"\n✅ 模型成功导出！")
         
@@ -43,5 +50,19 @@ def run(config_module: Type, source_model: str = 'finetune'): # 默认导出微
         # onnx_path 的值通常是 '_outputs/models/dino_game.onnx'
         print(f"  > ONNX模型已保存至: {Path(onnx_path).resolve()}")
 
+        # --- 可选: 生成 INT8/FP16 量化变体并在 test 划分上比较延迟与精度 ---
+        variants = export_cfg.get("QUANTIZE", []) if quantize else []
+        if variants:
+            from . import quantizer
+            print(f"\n--- 开始生成量化变体: {variants} ---")
+            quantizer.run(config_module, Path(onnx_path), variants)
+            # 配置要求的量化变体必须全部生成 (如缺少 INT8 校准图片时)，否则视为导出失败
+            missing = [v for v in variants if v in ("int8", "fp16") and not quantizer.variant_path(onnx_path, v).exists()]
+            if missing:
+                print(f"[致命错误] 未能生成量化变体 {missing}，请检查上面的警告，或从 EXPORT_CONFIG['QUANTIZE'] 中移除它们。")
+                return None
+        return Path(onnx_path)
+
     except Exception as e:
-        print(f"\n[致命错误] 模型导出过程中发生错误: {e}")
\ No newline at end of file
+        print(f"\n[致命错误] 模型导出过程中发生错误: {e}")
+        return None
\ No newline at end of file
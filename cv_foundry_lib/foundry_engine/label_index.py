@@ -0,0 +1,352 @@
+# cv_foundry/foundry_engine/label_index.py
+
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Type
+
+import numpy as np
+import yaml
+
+from . import packed_dataset
+
+# 标签索引把一个数据集划分的全部 labels/*.txt 解析成一个列式数组文件 (与打包数据集的 index.npz 列名一致):
+#   <OUTPUTS_DIR>/cache/labels/<蓝图>/<数据集>_<划分>.npz
+# 每张图片一行: img_name, img_label_mtime/img_label_size (标签文件的修改时间与大小，-1 表示没有标签文件), img_malformed
+# 每个标注框一行: box_image (所属图片行号), box_cls, box_xywh (归一化 cx, cy, w, h)
+# 重新索引时只解析修改时间或大小发生变化的标签文件。打包格式的数据集本身已有列式索引，直接读取。
+INDEX_VERSION = 1
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+# 每个解析任务包含的标签文件数 (每个文件都很小，按块分发以摊薄进程间通信的开销)
+PARSE_CHUNK = 256
+
+
+def _parse_label_file(path: str) -> tuple:
+    """解析一个YOLO标签文件，返回 ((N, 5) 数组 [类别, cx, cy, w, h], 无法解析的行数)。与 read_yolo_labels 不同，坏行只计数不报错。"""
+    rows, malformed = [], 0
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.split()
+            if not fields:
+                continue
+            try:
+                row = [float(v) for v in fields[:5]]
+            except ValueError:
+                malformed += 1
+                continue
+            if len(row) < 5:
+                malformed += 1
+                continue
+            rows.append(row)
+    return (np.array(rows, dtype=np.float64) if rows else np.zeros((0, 5), dtype=np.float64)), malformed
+
+
+def _parse_chunk(paths: list) -> list:
+    return [_parse_label_file(path) for path in paths]
+
+
+class LabelIndex:
+    """一个数据集划分的列式标签索引，提供按类别、按图片的快速查询。"""
+
+    def __init__(self, names: list, box_image: np.ndarray, box_cls: np.ndarray, box_xywh: np.ndarray,
+                 has_label: np.ndarray = None, malformed: np.ndarray = None, orphans: list = (),
+                 image_shape: tuple = None):
+        self.names = list(names)
+        self.box_image = box_image
+        self.box_cls = box_cls
+        self.box_xywh = box_xywh
+        self.has_label = has_label if has_label is not None else np.ones(len(self.names), dtype=bool)
+        self.malformed = malformed if malformed is not None else np.zeros(len(self.names), dtype=np.int32)
+        self.orphans = list(orphans)  # 没有对应图片的标签文件 (训练时会被忽略)
+        self.image_shape = image_shape  # 打包数据集的图片尺寸 (高, 宽, 通道)，YOLO目录不记录
+        self.box_count = np.bincount(box_image, minlength=len(self.names))
+        # box_image 按图片行号升序排列，可以用二分查找得到每张图片的标注区间
+        self._box_start = np.searchsorted(box_image, np.arange(len(self.names) + 1))
+        self._rows = {Path(name).stem: i for i, name in enumerate(self.names)}
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def row(self, name: str):
+        """按文件名 (可带路径与扩展名) 查找图片行号，找不到时返回 None。"""
+        return self._rows.get(Path(name).stem)
+
+    def boxes(self, i: int) -> tuple:
+        """返回第 i 张图片的 (类别数组, 归一化xywh数组)。"""
+        s, e = self._box_start[i], self._box_start[i + 1]
+        return self.box_cls[s:e], self.box_xywh[s:e]
+
+    def images_with_class(self, cid: int) -> list:
+        """包含类别 cid 的所有图片名。"""
+        return [self.names[i] for i in np.unique(self.box_image[self.box_cls == cid])]
+
+    def empty_images(self) -> list:
+        """没有任何标注框的图片名 (包括缺少标签文件的图片)。"""
+        return [self.names[i] for i in np.flatnonzero(self.box_count == 0)]
+
+    def class_counts(self, num_classes: int) -> np.ndarray:
+        """每个类别的标注框数量 (越界的类别ID不计入)。"""
+        valid = (self.box_cls >= 0) & (self.box_cls < num_classes)
+        return np.bincount(self.box_cls[valid], minlength=num_classes)
+
+
+def _index_path(config_module: Type, name: str, split: str) -> Path:
+    return Path(config_module.OUTPUTS_DIR) / "cache" / "labels" / config_module.BLUEPRINT_DIR.name / f"{name}_{split}.npz"
+
+
+def _load_cached(path: Path) -> dict:
+    """读取已有的标签索引，返回 {图片名: (标签修改时间, 标签大小, 标注数组, 坏行数)}；不存在或版本不符时返回空字典。"""
+    try:
+        with np.load(path) as index:
+            if int(index["version"]) != INDEX_VERSION:
+                return {}
+            names = [str(n) for n in index["img_name"]]
+            rows = np.column_stack([index["box_cls"], index["box_xywh"]])
+            starts = np.searchsorted(index["box_image"], np.arange(len(names) + 1))
+            return {name: (int(index["img_label_mtime"][i]), int(index["img_label_size"][i]),
+                           rows[starts[i]:starts[i + 1]], int(index["img_malformed"][i]))
+                    for i, name in enumerate(names)}
+    except (OSError, ValueError, KeyError):
+        return {}
+
+
+def build_split(split_dir: Path, cache_path: Path, workers: int = 0) -> LabelIndex:
+    """
+    为一个YOLO目录划分 (<split>/images + <split>/labels) 建立或增量更新标签索引。
+    只有修改时间或大小变化的标签文件会被重新解析，解析在多个进程中并行进行。
+    """
+    split_dir = Path(split_dir)
+    label_dir = split_dir / "labels"
+    images = sorted(p.name for p in (split_dir / "images").iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    stems = {Path(name).stem for name in images}
+    orphans = sorted(p.name for p in label_dir.glob("*.txt") if p.stem not in stems) if label_dir.is_dir() else []
+
+    cached = _load_cached(cache_path)
+    entries, stale = {}, []
+    for name in images:
+        label_path = label_dir / f"{Path(name).stem}.txt"
+        try:
+            st = label_path.stat()
+            mtime, size = st.st_mtime_ns, st.st_size
+        except OSError:
+            entries[name] = (-1, -1, np.zeros((0, 5)), 0)
+            continue
+        old = cached.get(name)
+        if old is not None and old[0] == mtime and old[1] == size:
+            entries[name] = old
+        else:
+            entries[name] = (mtime, size, None, 0)
+            stale.append(name)
+
+    if stale:
+        paths = [str(label_dir / f"{Path(name).stem}.txt") for name in stale]
+        chunks = [paths[i:i + PARSE_CHUNK] for i in range(0, len(paths), PARSE_CHUNK)]
+        workers = min(workers or os.cpu_count() or 1, len(chunks))
+        if workers > 1:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                parsed = [result for chunk in pool.map(_parse_chunk, chunks) for result in chunk]
+        else:
+            parsed = _parse_chunk(paths)
+        for name, (rows, malformed) in zip(stale, parsed):
+            mtime, size, _, _ = entries[name]
+            entries[name] = (mtime, size, rows, malformed)
+
+    # 写出新的列式索引 (先写临时文件再原子替换)
+    box_image = np.concatenate([np.full(len(entries[n][2]), i, dtype=np.int32) for i, n in enumerate(images)]
+                               or [np.zeros(0, dtype=np.int32)])
+    rows = np.concatenate([entries[n][2] for n in images] or [np.zeros((0, 5))]).reshape(-1, 5)
+    columns = {
+        "version": np.array(INDEX_VERSION),
+        "img_name": np.array(images, dtype=str),
+        "img_label_mtime": np.array([entries[n][0] for n in images], dtype=np.int64),
+        "img_label_size": np.array([entries[n][1] for n in images], dtype=np.int64),
+        "img_malformed": np.array([entries[n][3] for n in images], dtype=np.int32),
+        "orphan_labels": np.array(orphans, dtype=str),
+        "box_image": box_image,
+        "box_cls": rows[:, 0].astype(np.int16),
+        "box_xywh": rows[:, 1:],
+    }
+    cache_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = cache_path.with_name(cache_path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **columns)
+    os.replace(tmp_path, cache_path)
+
+    index = LabelIndex(images, columns["box_image"], columns["box_cls"], columns["box_xywh"],
+                       has_label=columns["img_label_size"] >= 0, malformed=columns["img_malformed"], orphans=orphans)
+    index.reparsed = len(stale)
+    return index
+
+
+def from_packed(split_dir: Path) -> LabelIndex:
+    """打包数据集 (或 prepare 缓存) 的一个划分：标签已是列式索引，无需解析。"""
+    reader = packed_dataset.PackedDatasetReader(split_dir)
+    names = reader.names if reader.names is not None else [f"synth_{int(sid)}.png" for sid in reader.sample_ids]
+    index = LabelIndex(names, reader.box_image, reader.box_cls.astype(np.int16), reader.box_xywh,
+                       image_shape=reader.image_shape)
+    index.reparsed = 0
+    return index
+
+
+def dataset_splits(root: Path, packed: bool) -> list:
+    """数据集根目录下的所有划分名 (YOLO目录为含 images/ 的子目录，打包格式为含 index.npz 的子目录)。"""
+    marker = packed_dataset.INDEX_FILE if packed else "images"
+    return sorted(p.name for p in Path(root).iterdir() if p.is_dir() and (p / marker).exists())
+
+
+def load(config_module: Type, name: str, split: str, workers: int = 0) -> LabelIndex:
+    """
+    返回数据集 name ('synthetic' / 'real') 的划分 split 的标签索引 (必要时增量更新)，数据集或划分不存在时返回 None。
+    """
+    from .preparer import sources
+
+    source = sources(config_module).get(name)
+    if source is None:
+        return None
+    root, packed = source
+    split_dir = Path(root) / split
+    if packed:
+        return from_packed(split_dir) if (split_dir / packed_dataset.INDEX_FILE).exists() else None
+    if not (split_dir / "images").is_dir():
+        return None
+    return build_split(split_dir, _index_path(config_module, name, split), workers)
+
+
+def sampling_weights(index: LabelIndex, num_classes: int) -> np.ndarray:
+    """
+    类别均衡的图片采样权重 (与 Ultralytics YOLOWeightedDataset 的做法一致)：
+    每个类别的权重为 总框数 / 该类别框数，图片的权重为其所有框的类别权重的平均值，没有标注框的图片权重为 1。
+    """
+    counts = index.class_counts(num_classes).astype(np.float64)
+    class_weights = np.where(counts > 0, counts.sum() / np.maximum(counts, 1), 1.0)
+    valid = (index.box_cls >= 0) & (index.box_cls < num_classes)
+    totals = np.bincount(index.box_image[valid], weights=class_weights[index.box_cls[valid]], minlength=len(index))
+    numbers = np.bincount(index.box_image[valid], minlength=len(index))
+    return np.where(numbers > 0, totals / np.maximum(numbers, 1), 1.0)
+
+
+def _percentiles(values: np.ndarray) -> dict:
+    if not len(values):
+        return {}
+    p5, p50, p95 = np.percentile(values, [5, 50, 95])
+    return {"min": float(values.min()), "p5": float(p5), "p50": float(p50), "p95": float(p95), "max": float(values.max())}
+
+
+def summarize(index: LabelIndex, class_names: list) -> dict:
+    """一个划分的统计摘要：类别分布、框尺寸分布、空图片、缺失/多余的标签文件，以及与 CLASSES 不一致的类别ID。"""
+    num_classes = len(class_names)
+    cls = index.box_cls.astype(np.int64)
+    w, h = index.box_xywh[:, 2], index.box_xywh[:, 3]
+    unknown = np.unique(cls[(cls < 0) | (cls >= num_classes)], return_counts=True)
+    per_class = {}
+    for cid, class_name in enumerate(class_names):
+        mask = cls == cid
+        per_class[class_name] = {"boxes": int(mask.sum()), "images": int(len(np.unique(index.box_image[mask]))),
+                                 "width": _percentiles(w[mask]), "height": _percentiles(h[mask])}
+    out_of_range = ((index.box_xywh[:, :2] - index.box_xywh[:, 2:] / 2 < -1e-3).any(axis=1)
+                    | (index.box_xywh[:, :2] + index.box_xywh[:, 2:] / 2 > 1 + 1e-3).any(axis=1))
+    return {
+        "images": len(index),
+        "boxes": int(len(cls)),
+        "empty_images": int((index.box_count == 0).sum()),
+        "missing_labels": int((~index.has_label).sum()),
+        "orphan_labels": len(index.orphans),
+        "malformed_lines": int(index.malformed.sum()),
+        "degenerate_boxes": int(((w <= 0) | (h <= 0)).sum()),
+        "out_of_bounds_boxes": int(out_of_range.sum()),
+        "unknown_class_ids": {int(c): int(n) for c, n in zip(*unknown)},
+        "unused_classes": [name for name, stats in per_class.items() if stats["boxes"] == 0],
+        "boxes_per_image": _percentiles(index.box_count.astype(np.float64)),
+        "classes": per_class,
+        "image_shape": list(index.image_shape) if index.image_shape else None,
+    }
+
+
+def _yaml_class_names(root: Path):
+    """数据集自带的 data.yaml (如 Roboflow 导出) 中的类别名，没有时返回 None。"""
+    try:
+        with open(Path(root) / "data.yaml", "r", encoding="utf-8") as f:
+            names = (yaml.safe_load(f) or {}).get("names")
+    except (OSError, yaml.YAMLError):
+        return None
+    if isinstance(names, dict):
+        names = [names[k] for k in sorted(names)]
+    return list(names) if names is not None else None
+
+
+def problems(summary: dict) -> list:
+    """从统计摘要中提取会影响训练的问题，供训练前提示。"""
+    found = []
+    if summary["unknown_class_ids"]:
+        found.append(f"存在 CLASSES 之外的类别ID {summary['unknown_class_ids']} (ID: 框数)")
+    if summary["unused_classes"]:
+        found.append(f"类别 {summary['unused_classes']} 没有任何标注框")
+    if summary["malformed_lines"]:
+        found.append(f"{summary['malformed_lines']} 行标签无法解析")
+    if summary["missing_labels"]:
+        found.append(f"{summary['missing_labels']} 张图片缺少标签文件 (将作为背景图片)")
+    if summary["orphan_labels"]:
+        found.append(f"{summary['orphan_labels']} 个标签文件没有对应的图片")
+    if summary["degenerate_boxes"] or summary["out_of_bounds_boxes"]:
+        found.append(f"{summary['degenerate_boxes']} 个宽或高为0的框，{summary['out_of_bounds_boxes']} 个超出图片边界的框")
+    return found
+
+
+def _format_sizes(p: dict) -> str:
+    return f"{p['p5']:.3f}/{p['p50']:.3f}/{p['p95']:.3f}" if p else "-"
+
+
+def _format_split(name: str, split: str, summary: dict) -> str:
+    lines = [f"### {name} / {split}: {summary['images']} 张图片，{summary['boxes']} 个框，"
+             f"{summary['empty_images']} 张空图片",
+             "",
+             "| 类别 | 框数 | 占比 | 图片数 | 宽 p5/p50/p95 | 高 p5/p50/p95 |",
+             "|---|---|---|---|---|---|"]
+    for class_name, stats in summary["classes"].items():
+        share = stats["boxes"] / summary["boxes"] if summary["boxes"] else 0.0
+        lines.append(f"| {class_name} | {stats['boxes']} | {share:.1%} | {stats['images']} "
+                     f"| {_format_sizes(stats['width'])} | {_format_sizes(stats['height'])} |")
+    lines += [f"- ⚠️ {problem}" for problem in problems(summary)]
+    return "\n".join(lines)
+
+
+def run(config_module: Type, workers: int = 0) -> Path:
+    """
+    标签统计引擎主入口。
+    为合成数据集与真实数据集的每个划分建立 (或增量更新) 列式标签索引，输出类别分布、框尺寸分布、空图片，
+    以及与蓝图 CLASSES 不一致之处。报告写入 <OUTPUTS_DIR>/cache/labels/<蓝图>/label_stats.md / .json。
+    """
+    print("\n--- 启动标签统计引擎 ---")
+    from .preparer import sources
+
+    class_names = list(config_module.CLASSES.keys())
+    found = sources(config_module)
+    if not found:
+        print("[致命错误] 没有找到任何数据集 (合成数据集尚未生成，真实数据集也不存在)。")
+        return None
+
+    report, sections = {}, []
+    for name, (root, packed) in found.items():
+        yaml_names = None if packed else _yaml_class_names(root)
+        if yaml_names is not None and yaml_names != class_names:
+            sections.append(f"- ⚠️ {name} 数据集 data.yaml 的类别 {yaml_names} 与蓝图 CLASSES {class_names} 不一致")
+        report[name] = {"root": str(root), "data_yaml_names": yaml_names, "splits": {}}
+        for split in dataset_splits(root, packed):
+            index = load(config_module, name, split, workers)
+            summary = summarize(index, class_names)
+            summary["reparsed_label_files"] = index.reparsed
+            report[name]["splits"][split] = summary
+            sections.append(_format_split(name, split, summary))
+            print(f"  > {name}/{split}: {len(index)} 张图片，重新解析 {index.reparsed} 个标签文件")
+
+    output_dir = _index_path(config_module, "", "").parent
+    output_dir.mkdir(parents=True, exist_ok=True)
+    report_md = output_dir / "label_stats.md"
+    text = "\n\n".join(sections)
+    report_md.write_text(f"# {config_module.BLUEPRINT_DIR.name} 标签统计\n\n{text}\n", encoding="utf-8")
+    with open(output_dir / "label_stats.json", "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n{text}\n")
+    print(f"  > 统计报告已保存至: {report_md}")
+    return report_md
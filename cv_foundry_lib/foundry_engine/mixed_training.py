@@ -0,0 +1,229 @@
+# cv_foundry/foundry_engine/mixed_training.py
+
+import json
+import os
+from pathlib import Path
+from typing import Type
+
+import numpy as np
+import torch
+import yaml
+from ultralytics.data import build_dataloader
+from ultralytics.data.build import PIN_MEMORY, InfiniteDataLoader, seed_worker
+from ultralytics.utils.torch_utils import torch_distributed_zero_first
+
+from .training_control import read_results
+
+# 混合训练：一次训练同时从合成训练集与真实训练集中采样，真实样本所占比例按 REAL_RATIO_SCHEDULE 随训练进度变化，
+# 验证集为真实数据的 valid 划分。取代 pretrain (全量合成) → finetune (全量真实) 两次完整训练。
+
+
+def real_ratio(schedule: list, progress: float) -> float:
+    """
+    比例计划为 [[训练进度, 真实样本占比], ...] 的分段线性插值，训练进度 0 为第一个epoch，1 为最后一个epoch。
+    例如 [[0, 0.2], [1, 0.8]] 表示真实样本占比从 20% 线性增加到 80%。
+    """
+    points = sorted(schedule)
+    return float(np.interp(progress, [p for p, _ in points], [r for _, r in points]))
+
+
+class MixedSampler(torch.utils.data.Sampler):
+    """
+    按当前epoch的真实样本占比有放回采样的采样器。
+    epoch 由训练器在每个epoch开始时更新；概率按块重新计算，因此 DataLoader 预取的少量批次可能仍使用上一个epoch的占比。
+    """
+
+    def __init__(self, is_real: np.ndarray, weights: np.ndarray, schedule: list, epochs: int, num_samples: int,
+                 seed: int = 0, block: int = 256):
+        self.is_real = np.asarray(is_real, dtype=bool)
+        self.weights = np.asarray(weights, dtype=np.float64)
+        self.schedule = schedule
+        self.epochs = epochs
+        self.epoch = 0
+        self.num_samples = num_samples
+        self.block = block
+        self.rng = np.random.default_rng(seed)
+
+    def __len__(self) -> int:
+        return self.num_samples
+
+    def ratio(self) -> float:
+        return real_ratio(self.schedule, self.epoch / max(self.epochs - 1, 1))
+
+    def probabilities(self) -> np.ndarray:
+        """每个来源内部按权重 (类别均衡或均匀) 分配，两个来源的总概率分别为 真实占比 与 1 - 真实占比。"""
+        ratio = self.ratio()
+        probs = np.zeros_like(self.weights)
+        for mask, share in ((self.is_real, ratio), (~self.is_real, 1.0 - ratio)):
+            total = self.weights[mask].sum()
+            if total > 0:
+                probs[mask] = self.weights[mask] / total * share
+        return probs / probs.sum()
+
+    def __iter__(self):
+        remaining = self.num_samples
+        while remaining > 0:
+            size = min(self.block, remaining)
+            yield from self.rng.choice(len(self.weights), size=size, p=self.probabilities()).tolist()
+            remaining -= size
+
+
+def _val_dir(dataset_root: Path) -> str:
+    return "valid/images" if (dataset_root / "valid").is_dir() else "val/images"
+
+
+def create_mixed_dataset_yaml(config_module: Type) -> Path:
+    """
+    生成混合训练的 dataset.yaml：训练集为 [合成 train, 真实 train]，验证集与测试集来自真实数据集。
+    合成数据集必须是YOLO目录格式 (打包格式请先执行 unpack 步骤)，否则返回 None。
+    """
+    synth_root = Path(config_module.SYNTHESIS_CONFIG["OUTPUT_DATASET_DIR"])
+    real_root = Path(config_module.TRAINER_CONFIG["REAL_DATASET_DIR"])
+    if not (synth_root / "train" / "images").is_dir():
+        print(f"[致命错误] 找不到YOLO格式的合成训练集: {synth_root / 'train' / 'images'}")
+        print("请先执行 'synthesize' 步骤 (打包格式的数据集请再执行 'unpack' 步骤)。")
+        return None
+    if not (real_root / "train" / "images").is_dir():
+        print(f"[致命错误] 找不到真实训练集: {real_root / 'train' / 'images'}")
+        return None
+
+    yaml_content = {
+        'path': str(real_root.resolve()),
+        'train': [str((synth_root / "train" / "images").resolve()), 'train/images'],
+        'val': _val_dir(real_root),
+        'names': {i: name for i, name in enumerate(config_module.CLASSES.keys())}
+    }
+    if (real_root / "test").is_dir():
+        yaml_content['test'] = 'test/images'
+    yaml_path = synth_root / "dataset_mixed.yaml"
+    with open(yaml_path, 'w') as f:
+        yaml.dump(yaml_content, f, sort_keys=False)
+
+    print(f"动态生成混合数据集配置文件: {yaml_path}")
+    return yaml_path
+
+
+def build_mixed_trainer(config_module: Type, base: type, weights: dict) -> type:
+    """
+    构造按比例计划混合采样的训练器 (base 的子类)。weights 为 {图片文件名去掉扩展名: 来源内的采样权重}，为空时来源内均匀采样。
+    """
+    mixed_cfg = config_module.TRAINER_CONFIG["MIXED_CONFIG"]
+    real_images = (Path(config_module.TRAINER_CONFIG["REAL_DATASET_DIR"]) / "train" / "images").resolve()
+    seed = config_module.SYNTHESIS_CONFIG.get("SEED", 0)
+
+    class MixedTrainer(base):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            self.mixed_sampler = None
+            self.add_callback("on_train_epoch_start", _update_sampler)
+
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode != "train" or rank != -1:
+                return super().get_dataloader(dataset_path, batch_size, rank, mode)
+            with torch_distributed_zero_first(rank):
+                dataset = self.build_dataset(dataset_path, mode, batch_size)
+            if getattr(dataset, "rect", False) and len({tuple(s) for s in dataset.batch_shapes}) > 1:
+                raise ValueError("合成图片与真实图片的宽高比不同，mixed 模式无法与矩形 (rect) 训练同时使用")
+            is_real = np.array([Path(f).resolve().parent == real_images for f in dataset.im_files])
+            if not is_real.any() or is_real.all():
+                print("[警告] 训练集中缺少合成或真实图片，比例计划不生效。")
+                return build_dataloader(dataset, batch_size, self.args.workers, True, rank)
+            image_weights = np.array([weights.get(Path(f).stem, 1.0) for f in dataset.im_files])
+            num_samples = mixed_cfg.get("IMAGES_PER_EPOCH", 0) or len(dataset)
+            self.mixed_sampler = MixedSampler(is_real, image_weights, mixed_cfg["REAL_RATIO_SCHEDULE"],
+                                              self.epochs, num_samples, seed=seed)
+            print(f"混合训练集: 合成 {int((~is_real).sum())} 张 + 真实 {int(is_real.sum())} 张，"
+                  f"每个epoch采样 {num_samples} 张")
+            generator = torch.Generator()
+            generator.manual_seed(6148914691236517205)  # 与 Ultralytics build_dataloader 使用相同的种子
+            return InfiniteDataLoader(
+                dataset=dataset,
+                batch_size=min(batch_size, num_samples),
+                num_workers=min(os.cpu_count() // max(torch.cuda.device_count(), 1), self.args.workers),
+                sampler=self.mixed_sampler,
+                pin_memory=PIN_MEMORY,
+                collate_fn=getattr(dataset, "collate_fn", None),
+                worker_init_fn=seed_worker,
+                generator=generator,
+            )
+
+    return MixedTrainer
+
+
+def _update_sampler(trainer):
+    if trainer.mixed_sampler is not None:
+        trainer.mixed_sampler.epoch = trainer.epoch
+        trainer.mixed_sampler.epochs = trainer.epochs
+
+
+def _finetune_target(config_module: Type, dataset_yaml: Path, imgsz: int):
+    """两阶段基线 (微调模型) 在真实 valid 划分上的 mAP50-95，没有微调模型时返回 None。"""
+    from ultralytics import YOLO
+
+    trainer_cfg = config_module.TRAINER_CONFIG
+    finetune_pt = Path(trainer_cfg["OUTPUT_MODELS_DIR"]) / f"{config_module.BLUEPRINT_DIR.name}_finetune.pt"
+    if not finetune_pt.exists():
+        return None
+    print(f"\n正在评估两阶段基线模型 {finetune_pt.name} 作为目标精度...")
+    metrics = YOLO(str(finetune_pt)).val(data=str(dataset_yaml), split="val", imgsz=imgsz, plots=False,
+                                        project=str(trainer_cfg["OUTPUT_MODELS_DIR"]),
+                                        name=f"{config_module.BLUEPRINT_DIR.name}_mixed_target_val", exist_ok=True)
+    return float(metrics.box.map)
+
+
+def write_report(config_module: Type, results_dir: Path, dataset_yaml: Path, imgsz: int, epochs: int) -> Path:
+    """
+    混合训练报告：每个epoch的真实样本占比与真实 valid 划分上的 mAP，达到目标 mAP50-95 所用的时间，
+    以及与两阶段 (预训练 + 微调) 基线总训练时间的对比。写入 <蓝图>_mixed_report.md / .json。
+    epochs 为配置的epoch数：采样器按它计算训练进度，提前停止时实际完成的epoch数更少，占比仍须按配置的epoch数还原。
+    """
+    trainer_cfg = config_module.TRAINER_CONFIG
+    mixed_cfg = trainer_cfg["MIXED_CONFIG"]
+    blueprint_name = config_module.BLUEPRINT_DIR.name
+    models_dir = Path(trainer_cfg["OUTPUT_MODELS_DIR"])
+    rows = read_results(Path(results_dir) / "results.csv")
+    if not rows:
+        print(f"[警告] 找不到混合训练的 results.csv ({results_dir})，无法生成报告。")
+        return None
+
+    target, target_source = mixed_cfg.get("TARGET_MAP50_95"), "配置 TARGET_MAP50_95"
+    if target is None:
+        target, target_source = _finetune_target(config_module, dataset_yaml, imgsz), f"{blueprint_name}_finetune.pt"
+    history = []
+    for row in rows:
+        epoch = int(row["epoch"])
+        history.append({"epoch": epoch, "real_ratio": real_ratio(mixed_cfg["REAL_RATIO_SCHEDULE"],
+                                                                 (epoch - 1) / max(epochs - 1, 1)),
+                        "seconds": row.get("time"), "map50": row["metrics/mAP50(B)"],
+                        "map50_95": row["metrics/mAP50-95(B)"]})
+    reached = next((h for h in history if target is not None and h["map50_95"] >= target), None)
+    baseline = {mode: (read_results(models_dir / f"{blueprint_name}_{mode}_results" / "results.csv") or [{}])[-1].get("time")
+                for mode in ("pretrain", "finetune")}
+    baseline_total = sum(baseline.values()) if all(baseline.values()) else None
+
+    lines = [f"# {blueprint_name} 混合训练报告 (评估集: 真实 valid)", "",
+             f"- 真实样本占比计划: {mixed_cfg['REAL_RATIO_SCHEDULE']}",
+             f"- 目标 mAP50-95: " + (f"{target:.4f} (来源: {target_source})" if target is not None else "未设置 (没有微调模型可作基线)")]
+    if reached:
+        lines.append(f"- ✅ 第 {reached['epoch']} 个epoch达到目标，用时 {reached['seconds'] / 60:.1f} 分钟")
+    elif target is not None:
+        lines.append(f"- ❌ {len(history)} 个epoch内未达到目标 (最佳 {max(h['map50_95'] for h in history):.4f})")
+    if baseline_total:
+        lines.append(f"- 两阶段基线总训练时间: 预训练 {baseline['pretrain'] / 60:.1f} + 微调 {baseline['finetune'] / 60:.1f} "
+                     f"= {baseline_total / 60:.1f} 分钟")
+        if reached:
+            lines.append(f"- 混合训练达到目标所用时间为基线的 {reached['seconds'] / baseline_total:.0%}")
+    lines += ["", "| epoch | 真实占比 | 累计用时 (分钟) | mAP50 | mAP50-95 |", "|---|---|---|---|---|"]
+    for h in history:
+        minutes = f"{h['seconds'] / 60:.1f}" if h["seconds"] is not None else "-"
+        mark = " ✅" if reached and h["epoch"] == reached["epoch"] else ""
+        lines.append(f"| {h['epoch']} | {h['real_ratio']:.0%} | {minutes} | {h['map50']:.4f} | {h['map50_95']:.4f}{mark} |")
+
+    report_md = models_dir / f"{blueprint_name}_mixed_report.md"
+    report_md.write_text("\n".join(lines) + "\n", encoding="utf-8")
+    with open(report_md.with_suffix(".json"), "w", encoding="utf-8") as f:
+        json.dump({"target_map50_95": target, "target_source": target_source, "reached": reached,
+                   "baseline_seconds": baseline, "history": history}, f, ensure_ascii=False, indent=2)
+    print("\n" + "\n".join(lines[:lines.index("", 2)]))
+    print(f"  > 混合训练报告已保存至: {report_md}")
+    return report_md
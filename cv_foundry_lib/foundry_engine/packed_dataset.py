@@ -0,0 +1,153 @@
+# cv_foundry/foundry_engine/packed_dataset.py
+
+import os
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+# 打包格式的目录结构 (每个数据集划分一个目录):
+#   <packed_root>/<split>/shard_00000.npy   形状为 (N, H, W, 3) 的 uint8 BGR 图像，可内存映射
+#   <packed_root>/<split>/index.npz         所有标签的列式索引 (见 write_index)
+INDEX_FILE = "index.npz"
+
+
+def shard_name(shard_id: int) -> str:
+    return f"shard_{shard_id:05d}.npy"
+
+
+def write_shard(split_dir: Path, shard_id: int, images: list, image_shape: tuple) -> str:
+    """把一个分片内的所有图像 (BGR) 写入单个 .npy 文件，先写临时文件再原子替换。"""
+    split_dir.mkdir(parents=True, exist_ok=True)
+    data = np.stack(images) if images else np.zeros((0, *image_shape), dtype=np.uint8)
+    name = shard_name(shard_id)
+    tmp_path = split_dir / f"{name}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, data)
+    os.replace(tmp_path, split_dir / name)
+    return name
+
+
+def read_yolo_labels(label_path: Path) -> np.ndarray:
+    """读取一个YOLO格式标签文件，返回 (N, 5) 数组 [类别, cx, cy, w, h]，文件不存在或为空时返回空数组。"""
+    label_path = Path(label_path)
+    rows = label_path.read_text().split("\n") if label_path.exists() else []
+    rows = [row.split()[:5] for row in rows if row.strip()]
+    return np.array(rows, dtype=np.float32) if rows else np.zeros((0, 5), dtype=np.float32)
+
+
+def write_index(split_dir: Path, shard_metas: list, image_shape: tuple):
+    """
+    汇总所有分片的元数据，写出列式标签索引。
+    shard_metas 中每一项为 {"shard": 文件名, "sample_ids": [...], "annotations": [[(cid, cx, cy, w, h), ...], ...]}，
+    可选的 "names" 为每张图片的原始文件名 (由真实数据集打包时使用)。
+    索引列:
+      - 每张图片一行: img_shard (分片序号), img_offset (分片内偏移), img_sample_id (原始合成索引)，可选 img_name
+      - 每个标注框一行: box_image (所属图片行号), box_cls, box_xywh (归一化 cx, cy, w, h)
+    """
+    shard_metas = sorted(shard_metas, key=lambda m: m["shard"])
+    img_shard, img_offset, img_sample_id, img_name = [], [], [], []
+    box_image, box_cls, box_xywh = [], [], []
+    with_names = bool(shard_metas) and all("names" in meta for meta in shard_metas)
+
+    for shard_idx, meta in enumerate(shard_metas):
+        for offset, (sample_id, annotations) in enumerate(zip(meta["sample_ids"], meta["annotations"])):
+            row = len(img_sample_id)
+            img_shard.append(shard_idx)
+            img_offset.append(offset)
+            img_sample_id.append(sample_id)
+            for cid, cx, cy, w, h in annotations:
+                box_image.append(row)
+                box_cls.append(cid)
+                box_xywh.append((cx, cy, w, h))
+        if with_names:
+            img_name.extend(meta["names"])
+
+    extra = {"img_name": np.array(img_name, dtype=str)} if with_names else {}
+    tmp_path = split_dir / f"{INDEX_FILE}.tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(
+            f,
+            **extra,
+            shard_files=np.array([m["shard"] for m in shard_metas], dtype=str),
+            image_shape=np.array(image_shape, dtype=np.int64),
+            img_shard=np.array(img_shard, dtype=np.int32),
+            img_offset=np.array(img_offset, dtype=np.int32),
+            img_sample_id=np.array(img_sample_id, dtype=np.int64),
+            box_image=np.array(box_image, dtype=np.int32),
+            box_cls=np.array(box_cls, dtype=np.int16),
+            box_xywh=np.array(box_xywh, dtype=np.float64).reshape(-1, 4),
+        )
+    os.replace(tmp_path, split_dir / INDEX_FILE)
+
+
+class PackedDatasetReader:
+    """
+    打包数据集单个划分的只读访问器。
+    分片文件以内存映射方式按需打开；对象被 pickle 到 DataLoader 子进程时不会携带映射本身。
+    """
+
+    def __init__(self, split_dir: Path):
+        self.split_dir = Path(split_dir)
+        with np.load(self.split_dir / INDEX_FILE) as index:
+            self.shard_files = [str(name) for name in index["shard_files"]]
+            self.image_shape = tuple(int(v) for v in index["image_shape"])
+            self.img_shard = index["img_shard"]
+            self.img_offset = index["img_offset"]
+            self.sample_ids = index["img_sample_id"]
+            self.box_image = index["box_image"]
+            self.box_cls = index["box_cls"]
+            self.box_xywh = index["box_xywh"]
+            self.names = [str(name) for name in index["img_name"]] if "img_name" in index.files else None
+        # box_image 按图片行号升序排列，可以用二分查找得到每张图片的标注区间
+        rows = np.arange(len(self.sample_ids))
+        self._box_start = np.searchsorted(self.box_image, rows, side="left")
+        self._box_end = np.searchsorted(self.box_image, rows, side="right")
+        self._shards = {}
+
+    def __len__(self) -> int:
+        return len(self.sample_ids)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shards"] = {}
+        return state
+
+    def _shard(self, shard_idx: int) -> np.ndarray:
+        shard = self._shards.get(shard_idx)
+        if shard is None:
+            shard = np.load(self.split_dir / self.shard_files[shard_idx], mmap_mode="r")
+            self._shards[shard_idx] = shard
+        return shard
+
+    def image(self, i: int) -> np.ndarray:
+        """返回第 i 张图片 (BGR, 只读内存映射视图)。"""
+        return self._shard(self.img_shard[i])[self.img_offset[i]]
+
+    def labels(self, i: int) -> tuple:
+        """返回第 i 张图片的 (类别数组, 归一化xywh数组)。"""
+        s, e = self._box_start[i], self._box_end[i]
+        return self.box_cls[s:e], self.box_xywh[s:e]
+
+
+def unpack_to_yolo(packed_root: Path, output_root: Path, splits: tuple = ("train", "val")):
+    """把打包格式的数据集还原为标准的 YOLO 目录结构 (images/*.png + labels/*.txt)。"""
+    for split in splits:
+        split_dir = Path(packed_root) / split
+        if not (split_dir / INDEX_FILE).exists():
+            print(f"[警告] 找不到打包数据集划分 '{split_dir}'，已跳过。")
+            continue
+        reader = PackedDatasetReader(split_dir)
+        img_dir = Path(output_root) / split / "images"
+        lbl_dir = Path(output_root) / split / "labels"
+        img_dir.mkdir(parents=True, exist_ok=True)
+        lbl_dir.mkdir(parents=True, exist_ok=True)
+
+        for i in tqdm(range(len(reader)), desc=f"还原 {split} 数据集"):
+            sample_id = int(reader.sample_ids[i])
+            Image.fromarray(np.ascontiguousarray(reader.image(i)[..., ::-1])).save(img_dir / f"synth_{sample_id}.png")
+            cls, xywh = reader.labels(i)
+            with open(lbl_dir / f"synth_{sample_id}.txt", "w") as f:
+                f.write("\n".join(f"{c} {cx:.6f} {cy:.6f} {w:.6f} {h:.6f}" for c, (cx, cy, w, h) in zip(cls, xywh)))
+    print(f"✅ 打包数据集已还原为YOLO目录结构: {output_root}")
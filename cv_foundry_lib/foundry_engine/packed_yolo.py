@@ -0,0 +1,122 @@
+# cv_foundry/foundry_engine/packed_yolo.py
+
+import math
+from pathlib import Path
+from typing import Type
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from .packed_dataset import PackedDatasetReader
+
+
+class PackedYOLODataset(YOLODataset):
+    """直接从打包分片读取图像、从列式索引读取标签的YOLO数据集。"""
+
+    def __init__(self, *args, split_dir: Path, **kwargs):
+        # 必须在父类 __init__ 之前打开索引，因为父类会调用 get_img_files / get_labels
+        self.reader = PackedDatasetReader(split_dir)
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        """返回虚拟文件名 (与YOLO格式下的文件名一致)，仅用于日志和评估时的标识。"""
+        if self.reader.names is not None:
+            return list(self.reader.names)
+        return [f"synth_{int(sid)}.png" for sid in self.reader.sample_ids]
+
+    def get_labels(self):
+        """标签全部来自列式索引，无需逐个读取文本文件。"""
+        shape = self.reader.image_shape[:2]
+        labels = []
+        for i, im_file in enumerate(self.im_files):
+            cls, xywh = self.reader.labels(i)
+            labels.append({
+                "im_file": im_file,
+                "shape": shape,
+                "cls": cls.astype(np.float32).reshape(-1, 1),
+                "bboxes": xywh.astype(np.float32),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        return labels
+
+    def load_image(self, i: int, rect_mode: bool = True):
+        """从内存映射分片中取出图像，其余缩放与缓冲逻辑与 BaseDataset.load_image 保持一致。"""
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+
+        im = self.reader.image(i)
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+            else:
+                im = np.array(im)  # 内存映射是只读的，后续增强需要可写副本
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        else:
+            im = np.array(im)
+
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+def create_packed_dataset_yaml(packed_root: Path, config_module: Type) -> Path:
+    """为打包数据集生成 dataset.yaml (路径指向各划分的分片目录，仅用于通过 Ultralytics 的路径校验)。"""
+    yaml_content = {
+        'path': str(packed_root.resolve()),
+        'train': 'train',
+        'val': 'val',
+        'names': {i: name for i, name in enumerate(config_module.CLASSES.keys())}
+    }
+    yaml_path = packed_root / "dataset.yaml"
+    with open(yaml_path, 'w') as f:
+        yaml.dump(yaml_content, f, sort_keys=False)
+
+    print(f"动态生成打包数据集配置文件: {yaml_path}")
+    return yaml_path
+
+
+def build_packed_trainer(packed_root: Path) -> type:
+    """构造一个从打包分片读取数据的 DetectionTrainer 子类，供 model.train(trainer=...) 使用。"""
+
+    class PackedTrainer(DetectionTrainer):
+        """训练集与验证集均来自打包分片的检测训练器。"""
+
+        def build_dataset(self, img_path, mode="train", batch=None):
+            gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            is_train = mode == "train"
+            return PackedYOLODataset(
+                img_path=img_path,
+                imgsz=self.args.imgsz,
+                batch_size=batch,
+                augment=is_train,
+                hyp=self.args,
+                rect=self.args.rect or not is_train,
+                cache="ram" if self.args.cache in (True, "ram") else None,  # 分片本身即是磁盘缓存
+                single_cls=self.args.single_cls or False,
+                stride=gs,
+                pad=0.0 if is_train else 0.5,
+                prefix=colorstr(f"{mode} (packed): "),
+                task=self.args.task,
+                classes=self.args.classes,
+                data=self.data,
+                split_dir=packed_root / ("train" if is_train else "val"),
+            )
+
+    return PackedTrainer
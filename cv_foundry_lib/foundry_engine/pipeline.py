@@ -0,0 +1,322 @@
+# cv_foundry/foundry_engine/pipeline.py
+
+import hashlib
+import json
+import os
+import platform
+from pathlib import Path
+from typing import Callable, Type
+
+# 注意：本模块只依赖标准库，重量级引擎 (ultralytics/torch) 只在阶段真正执行时才导入。
+
+STAGE_ORDER = ['synthesize', 'prepare', 'pretrain', 'finetune', 'export', 'tune']
+
+# 只用于真实数据集指纹的文件类型 (排除 Ultralytics 写入的 *.cache 和动态生成的 dataset.yaml)
+_DATASET_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp", ".txt"}
+# 只影响数据读取速度或对照实验、不影响训练结果的训练器配置项，不参与 pretrain 的输入键
+_NON_TRAINING_KEYS = {"FINETUNE_CONFIG", "MIXED_CONFIG", "REAL_DATASET_DIR", "SHAPE_BENCHMARK",
+                      "USE_PREPARED_DATA", "PREPARE_WORKERS", "WORKERS", "CACHE", "RESUME"}
+
+
+def _hash_json(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def file_fingerprint(path: Path):
+    """文件内容的哈希 (用于模型等产物)，文件不存在时返回 None。"""
+    path = Path(path)
+    if not path.is_file():
+        return None
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def dataset_fingerprint(root: Path):
+    """基于文件列表、大小和修改时间的数据集指纹，避免对成千上万张图片做内容哈希。"""
+    root = Path(root)
+    if not root.is_dir():
+        return None
+    entries = []
+    for dirpath, _, filenames in os.walk(root):
+        for name in filenames:
+            path = Path(dirpath) / name
+            if path.suffix.lower() in _DATASET_SUFFIXES:
+                st = path.stat()
+                entries.append((path.relative_to(root).as_posix(), st.st_size, st.st_mtime_ns))
+    return _hash_json(sorted(entries))
+
+
+class Stage:
+    """
+    流水线中的一个阶段。
+    - inputs():  返回决定该阶段结果的全部输入 (配置片段、上游产物指纹等)，用于计算输入键。
+    - outputs(): 返回该阶段产物的路径列表。
+    - execute(): 真正执行阶段的函数 (在其内部才导入重量级引擎)，返回是否成功。
+    """
+
+    def __init__(self, name: str, deps: list, inputs: Callable, outputs: Callable, execute: Callable):
+        self.name = name
+        self.deps = deps
+        self.inputs = inputs
+        self.outputs = outputs
+        self.execute = execute
+
+
+class Pipeline:
+    """一个按依赖顺序执行、并跳过产物已是最新的阶段的小型流水线引擎。"""
+
+    def __init__(self, stages: list, state_path: Path):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = Path(state_path)
+
+    def _load_state(self) -> dict:
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_state(self, state: dict):
+        self.state_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.state_path.with_suffix(".tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def resolve(self, targets: list) -> list:
+        """按拓扑顺序返回需要考虑的阶段 (只包含请求的阶段；依赖若未请求则视为外部已就绪)。"""
+        ordered, visiting = [], set()
+
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError(f"流水线阶段存在循环依赖: {name}")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                if dep in targets:
+                    visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+
+        for name in targets:
+            visit(name)
+        return ordered
+
+    def is_up_to_date(self, stage: Stage, input_key: str, state: dict) -> bool:
+        record = state.get(stage.name)
+        if not record or record.get("input_key") != input_key:
+            return False
+        for path in stage.outputs():
+            if file_fingerprint(path) != record.get("outputs", {}).get(str(path)):
+                return False
+        return True
+
+    def plan(self, targets: list, force: bool = False) -> list:
+        """
+        不执行任何阶段，返回解析后的执行计划 [(阶段名, 是否执行, 原因)]，是否执行为 True / False / None (视上游而定)。
+        与 run() 的规则一致：每个阶段按自己的输入键判断，上游阶段重新执行只有在其产物变化时才会改变下游的输入键，
+        因此输入未变、但上游将执行的阶段标记为 None。
+        """
+        state = self._load_state()
+        planned, may_change = [], set()
+        for name in self.resolve(targets):
+            stage = self.stages[name]
+            if force:
+                planned.append((name, True, "--force"))
+            elif not self.is_up_to_date(stage, _hash_json(stage.inputs()), state):
+                planned.append((name, True, "没有执行记录" if name not in state else "输入或产物已变化"))
+            elif any(dep in may_change for dep in stage.deps):
+                planned.append((name, None, "输入未变化，上游阶段将执行，其产物变化时本阶段才会执行"))
+            else:
+                planned.append((name, False, "输入与产物均未变化"))
+            if planned[-1][1] is not False:
+                may_change.add(name)
+        return planned
+
+    def run(self, targets: list, force: bool = False) -> bool:
+        """执行目标阶段。返回 True 表示所有阶段均成功 (或已是最新)。"""
+        state = self._load_state()
+        for name in self.resolve(targets):
+            stage = self.stages[name]
+            input_key = _hash_json(stage.inputs())
+            if not force and self.is_up_to_date(stage, input_key, state):
+                print(f"\n⏭️  阶段 '{name}' 的输入与产物均未变化，跳过 (使用 --force 强制重新执行)。")
+                continue
+
+            print(f"\n▶️  执行阶段 '{name}'")
+            # 先删除旧的执行记录：阶段失败或被中断时，磁盘上残留的旧产物不能被当作本次执行的结果
+            if state.pop(name, None) is not None:
+                self._save_state(state)
+            try:
+                succeeded = stage.execute()
+            except Exception as e:
+                print(f"[致命错误] 阶段 '{name}' 执行时发生错误: {e}")
+                succeeded = False
+            if not succeeded:
+                print(f"[致命错误] 阶段 '{name}' 执行失败，流水线已中止。")
+                return False
+
+            outputs = {str(path): file_fingerprint(path) for path in stage.outputs()}
+            missing = [path for path, fp in outputs.items() if fp is None]
+            if missing:
+                print(f"[致命错误] 阶段 '{name}' 执行后缺少产物: {missing}，流水线已中止。")
+                return False
+            # 输入键在执行后重新计算：部分输入可能在执行过程中才出现 (如首次运行时自动下载的基础模型)
+            state[name] = {"input_key": _hash_json(stage.inputs()), "outputs": outputs}
+            self._save_state(state)
+        return True
+
+
+def build_pipeline(config_module: Type, workers: int = 1, stream: bool = False, force: bool = False) -> Pipeline:
+    """根据蓝图配置构建 synthesize → prepare → pretrain → finetune → export → tune 流水线。"""
+    synth_cfg = config_module.SYNTHESIS_CONFIG
+    trainer_cfg = config_module.TRAINER_CONFIG
+    model_cfg = config_module.MODEL_CONFIG
+    blueprint_name = config_module.BLUEPRINT_DIR.name
+    models_dir = Path(trainer_cfg["OUTPUT_MODELS_DIR"])
+    dataset_root = Path(synth_cfg["OUTPUT_DATASET_DIR"])
+    pretrain_pt = models_dir / f"{blueprint_name}_pretrain.pt"
+    mixed_pt = models_dir / f"{blueprint_name}_mixed.pt"
+    finetune_pt = models_dir / f"{blueprint_name}_finetune.pt"
+    finetune_onnx = models_dir / f"{blueprint_name}_finetune.onnx"
+
+    def synth_fingerprint():
+        from . import synthesis_manifest
+        return synthesis_manifest.compute_fingerprint(config_module)
+
+    # --- synthesize ---
+    def synthesize_inputs():
+        return {"fingerprint": synth_fingerprint(),
+                "counts": (synth_cfg["NUM_TRAIN_IMAGES"], synth_cfg["NUM_VAL_IMAGES"])}
+
+    def synthesize_execute():
+        from . import data_synthesizer
+        return data_synthesizer.run(config_module, workers=workers, force=force) is not None
+
+    # --- prepare ---
+    def prepare_inputs():
+        from . import preparer
+        return {
+            "img_size": trainer_cfg["IMG_SIZE"],
+            "sources": {name: preparer.source_fingerprint(root, packed)
+                        for name, (root, packed) in preparer.sources(config_module).items()},
+        }
+
+    def prepare_outputs():
+        from . import preparer
+        return preparer.manifest_paths(config_module)
+
+    def prepare_execute():
+        from . import preparer
+        return preparer.run(config_module, force=force) is not None
+
+    # --- pretrain ---
+    def pretrain_inputs():
+        if stream:
+            data = {"stream": synthesize_inputs()}
+        else:
+            data = {"manifest": file_fingerprint(dataset_root / "manifest.json")}
+        return {
+            "trainer": {k: v for k, v in trainer_cfg.items() if k not in _NON_TRAINING_KEYS},
+            "model": model_cfg,
+            "base_model": file_fingerprint(model_cfg["BASE_MODEL"]),
+            "classes": config_module.CLASSES,
+            "data": data,
+        }
+
+    def pretrain_execute():
+        from . import trainer
+        return trainer.run(config_module, training_mode='pretrain', data_source='stream' if stream else None) is not None
+
+    # --- finetune ---
+    def finetune_inputs():
+        return {
+            "finetune": trainer_cfg["FINETUNE_CONFIG"],
+            "img_size": trainer_cfg["IMG_SIZE"],
+            "balanced_sampling": trainer_cfg.get("BALANCED_SAMPLING", False),
+            "stopping": [trainer_cfg.get("PATIENCE"), trainer_cfg.get("TIME_BUDGET_HOURS")],
+            "classes": config_module.CLASSES,
+            "real_dataset": dataset_fingerprint(trainer_cfg["REAL_DATASET_DIR"]),
+            "pretrain_model": file_fingerprint(pretrain_pt),
+        }
+
+    def finetune_execute():
+        from . import trainer
+        return trainer.run(config_module, training_mode='finetune') is not None
+
+    # --- mixed (可选，不属于 'all'：一次混合训练取代 pretrain → finetune) ---
+    def mixed_inputs():
+        return {
+            "mixed": trainer_cfg["MIXED_CONFIG"],
+            "img_size": trainer_cfg["IMG_SIZE"],
+            "balanced_sampling": trainer_cfg.get("BALANCED_SAMPLING", False),
+            "stopping": [trainer_cfg.get("PATIENCE"), trainer_cfg.get("TIME_BUDGET_HOURS")],
+            "model": model_cfg,
+            "base_model": file_fingerprint(model_cfg["BASE_MODEL"]),
+            "classes": config_module.CLASSES,
+            "manifest": file_fingerprint(dataset_root / "manifest.json"),
+            "real_dataset": dataset_fingerprint(trainer_cfg["REAL_DATASET_DIR"]),
+        }
+
+    def mixed_execute():
+        from . import trainer
+        return trainer.run(config_module, training_mode='mixed') is not None
+
+    # --- export ---
+    export_cfg = getattr(config_module, "EXPORT_CONFIG", {})
+    export_variants = [v for v in export_cfg.get("QUANTIZE", []) if v in ("int8", "fp16")]
+
+    def export_inputs():
+        data = {
+            "export": export_cfg,
+            "img_size": trainer_cfg["IMG_SIZE"],
+            "finetune_model": file_fingerprint(finetune_pt),
+        }
+        if export_variants:
+            # INT8 校准与量化对比报告都依赖真实数据集
+            data["real_dataset"] = dataset_fingerprint(trainer_cfg["REAL_DATASET_DIR"])
+        return data
+
+    def export_outputs():
+        return [finetune_onnx] + [finetune_onnx.with_name(f"{finetune_onnx.stem}_{v}.onnx") for v in export_variants]
+
+    def export_execute():
+        from . import exporter
+        return exporter.run(config_module, source_model='finetune') is not None
+
+    # --- tune ---
+    tune_cfg = getattr(config_module, "TUNE_CONFIG", {})
+
+    def tune_inputs():
+        data = {
+            "tune": tune_cfg,
+            "model": file_fingerprint(finetune_onnx),
+            # 调优结果只对测量它的机器有效，换一台机器运行时需要重新调优
+            "host": [platform.machine(), platform.processor(), os.cpu_count()],
+        }
+        if tune_cfg.get("INPUT_SIZES"):
+            # 其他分辨率的候选模型从 .pt 重新导出，并在真实数据的 test 划分上校验精度
+            data["export"] = export_cfg
+            data["finetune_model"] = file_fingerprint(finetune_pt)
+            data["real_dataset"] = dataset_fingerprint(trainer_cfg["REAL_DATASET_DIR"])
+        return data
+
+    def tune_execute():
+        from . import tuner
+        return tuner.run(config_module, source_model='finetune') is not None
+
+    stages = [
+        Stage('synthesize', [], synthesize_inputs, lambda: [dataset_root / "manifest.json"], synthesize_execute),
+        Stage('prepare', [] if stream else ['synthesize'], prepare_inputs, prepare_outputs, prepare_execute),
+        Stage('pretrain', [] if stream else ['synthesize'], pretrain_inputs, lambda: [pretrain_pt], pretrain_execute),
+        Stage('finetune', ['pretrain'], finetune_inputs, lambda: [finetune_pt], finetune_execute),
+        Stage('mixed', ['synthesize'], mixed_inputs, lambda: [mixed_pt], mixed_execute),
+        Stage('export', ['finetune'], export_inputs, export_outputs, export_execute),
+        Stage('tune', ['export'], tune_inputs, lambda: [models_dir / f"{finetune_onnx.stem}_profile.json"], tune_execute),
+    ]
+    state_path = Path(config_module.OUTPUTS_DIR) / "pipeline_state" / f"{blueprint_name}.json"
+    return Pipeline(stages, state_path)
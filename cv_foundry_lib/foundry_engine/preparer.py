@@ -0,0 +1,229 @@
+# cv_foundry/foundry_engine/preparer.py
+
+import json
+import math
+import os
+import shutil
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Type
+
+# 注意：本模块在流水线计算 prepare 阶段的输入键与产物时被导入 (包括 --dry-run)，
+# cv2/numpy/tqdm 与 packed_dataset 只在真正解码、写入图片的函数内导入，sources/source_fingerprint/manifest_paths 只依赖标准库。
+from .pipeline import _hash_json, dataset_fingerprint, file_fingerprint
+
+# 预处理缓存的目录结构 (复用打包数据集格式，训练时由 packed_yolo 直接读取):
+#   <OUTPUTS_DIR>/prepared/<蓝图>/<数据集>_<imgsz>/<train|val>/shard_*.npy + index.npz
+#   <OUTPUTS_DIR>/prepared/<蓝图>/<数据集>_<imgsz>/prepare_manifest.json   (最后写出，存在即代表缓存完整)
+# 无法写成定长分片的数据集 (缩放后尺寸不一致) 同样写出清单，但带有 "skipped" 原因，训练时直接读取原始图片。
+MANIFEST_FILE = "prepare_manifest.json"
+PREPARE_VERSION = 1
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+# 打包数据集各划分的标签索引文件名，与 packed_dataset.INDEX_FILE 相同 (这里不导入 packed_dataset，以免加载 numpy)
+PACKED_INDEX_FILE = "index.npz"
+# 源数据集中的划分目录 → 缓存中的划分名 (Roboflow 导出的验证集目录叫 valid)
+SPLIT_DIRS = {"train": "train", "val": "val", "valid": "val"}
+
+
+def _train_imgsz(img_size) -> int:
+    """与 trainer.resolve_img_size 一致：矩形输入 [高, 宽] 以长边作为训练 imgsz。"""
+    return img_size if isinstance(img_size, int) else max(img_size)
+
+
+def sources(config_module: Type) -> dict:
+    """需要预处理的数据集: {名称: (根目录, 是否为打包格式)}，只包含磁盘上已存在的数据集。"""
+    dataset_root = Path(config_module.SYNTHESIS_CONFIG["OUTPUT_DATASET_DIR"])
+    found = {}
+    if config_module.SYNTHESIS_CONFIG.get("OUTPUT_FORMAT") == "packed":
+        if (dataset_root / "packed").is_dir():
+            found["synthetic"] = (dataset_root / "packed", True)
+    elif (dataset_root / "train" / "images").is_dir():
+        found["synthetic"] = (dataset_root, False)
+    real_root = Path(config_module.TRAINER_CONFIG["REAL_DATASET_DIR"])
+    if (real_root / "train" / "images").is_dir():
+        found["real"] = (real_root, False)
+    return found
+
+
+def source_fingerprint(root: Path, packed: bool) -> str:
+    """源数据集的指纹：打包格式取各划分标签索引的内容哈希，YOLO目录取文件列表/大小/修改时间。"""
+    if packed:
+        return _hash_json({split.name: file_fingerprint(split / PACKED_INDEX_FILE)
+                           for split in sorted(Path(root).iterdir()) if split.is_dir()})
+    return dataset_fingerprint(root)
+
+
+def cache_root(config_module: Type, name: str, imgsz: int) -> Path:
+    return Path(config_module.OUTPUTS_DIR) / "prepared" / config_module.BLUEPRINT_DIR.name / f"{name}_{imgsz}"
+
+
+def manifest_paths(config_module: Type) -> list:
+    """当前配置下各数据集缓存的清单文件路径 (流水线 prepare 阶段的产物，无法预处理的数据集也有标记为跳过的清单)。"""
+    imgsz = _train_imgsz(config_module.TRAINER_CONFIG["IMG_SIZE"])
+    return [cache_root(config_module, name, imgsz) / MANIFEST_FILE for name in sources(config_module)]
+
+
+def _current_manifest(config_module: Type, name: str, imgsz: int):
+    """返回数据集 name 在 imgsz 下与源数据一致的清单 (包括标记为跳过的)，否则返回 None。"""
+    source = sources(config_module).get(name)
+    if source is None:
+        return None
+    try:
+        with open(cache_root(config_module, name, imgsz) / MANIFEST_FILE, "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if (manifest.get("version") != PREPARE_VERSION or manifest.get("imgsz") != imgsz
+            or manifest.get("source") != source_fingerprint(*source)):
+        return None
+    return manifest
+
+
+def lookup(config_module: Type, name: str, imgsz: int):
+    """若数据集 name 在 imgsz 下的预处理缓存存在且与源数据一致，返回缓存根目录，否则返回 None。"""
+    manifest = _current_manifest(config_module, name, imgsz)
+    if manifest is None or manifest.get("skipped"):
+        return None
+    return cache_root(config_module, name, imgsz)
+
+
+def _resize(im, imgsz: int, augment: bool):
+    """与 Ultralytics BaseDataset.load_image 完全一致的长边缩放，缓存只改变读取速度，不改变训练数据。"""
+    import cv2
+
+    h0, w0 = im.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r != 1:
+        w, h = (min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz))
+        interp = cv2.INTER_LINEAR if (augment or r > 1) else cv2.INTER_AREA
+        im = cv2.resize(im, (w, h), interpolation=interp)
+    return im
+
+
+def _yolo_items(split_dir: Path) -> list:
+    """YOLO目录中的一个划分: [(文件名, 读取函数, 标注列表)]。"""
+    import cv2
+
+    from . import packed_dataset
+
+    label_dir = split_dir / "labels"
+    items = []
+    for path in sorted(p for p in (split_dir / "images").iterdir() if p.suffix.lower() in IMAGE_SUFFIXES):
+        labels = packed_dataset.read_yolo_labels(label_dir / f"{path.stem}.txt")
+        annotations = [(int(row[0]), *map(float, row[1:])) for row in labels]
+        items.append((path.name, lambda path=path: cv2.imread(str(path)), annotations))
+    return items
+
+
+def _packed_items(split_dir: Path) -> list:
+    """打包数据集中的一个划分: [(文件名, 读取函数, 标注列表)]。"""
+    from . import packed_dataset
+
+    reader = packed_dataset.PackedDatasetReader(split_dir)
+    items = []
+    for i in range(len(reader)):
+        cls, xywh = reader.labels(i)
+        annotations = [(int(c), *map(float, box)) for c, box in zip(cls, xywh)]
+        items.append((f"synth_{int(reader.sample_ids[i])}.png", lambda i=i: reader.image(i), annotations))
+    return items
+
+
+def _prepare_split(items: list, output_dir: Path, imgsz: int, augment: bool, pool: ThreadPoolExecutor,
+                   shard_size: int) -> dict:
+    """并行解码并缩放一个划分的所有图片，按分片写入缓存。同一划分内缩放后的尺寸必须一致。"""
+    from tqdm import tqdm
+
+    from . import packed_dataset
+
+    def load(item):
+        name, read, _ = item
+        im = read()
+        if im is None:
+            raise ValueError(f"无法读取图片 {name}")
+        return _resize(im, imgsz, augment)
+
+    shard_metas, image_shape, total_bytes = [], None, 0
+    for shard_id, start in enumerate(tqdm(range(0, len(items), shard_size), desc=f"预处理 {output_dir.name}")):
+        chunk = items[start:start + shard_size]
+        images = list(pool.map(load, chunk))  # cv2 的解码与缩放会释放GIL，线程池即可并行
+        shapes = {im.shape for im in images} | ({image_shape} if image_shape else set())
+        if len(shapes) > 1:
+            raise ValueError(f"缩放后的图片尺寸不一致 {sorted(shapes)}，无法写入定长分片")
+        image_shape = images[0].shape
+        name = packed_dataset.write_shard(output_dir, shard_id, images, image_shape)
+        total_bytes += (output_dir / name).stat().st_size
+        shard_metas.append({"shard": name, "sample_ids": list(range(start, start + len(chunk))),
+                            "annotations": [annotations for _, _, annotations in chunk],
+                            "names": [name for name, _, _ in chunk]})
+    packed_dataset.write_index(output_dir, shard_metas, image_shape)
+    return {"images": len(items), "image_shape": list(image_shape), "bytes": total_bytes}
+
+
+def _write_manifest(output_root: Path, manifest: dict):
+    output_root.mkdir(parents=True, exist_ok=True)
+    with open(output_root / MANIFEST_FILE, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+
+
+def run(config_module: Type, force: bool = False) -> dict:
+    """
+    数据预处理引擎主入口。
+    把合成数据集与真实数据集按训练分辨率 (TRAINER_CONFIG["IMG_SIZE"] 的长边) 一次性并行解码、缩放，
+    写成可内存映射的定长分片；训练时直接读取缩放好的像素，不再每个epoch解码全尺寸PNG/JPG。
+    源数据或 IMG_SIZE 变化后缓存自动失效。返回 {数据集名: 缓存根目录}。
+    无法预处理的数据集写出标记为跳过的清单 (源数据不变时不再重试)，不出现在返回值中。
+    """
+    print("\n--- 启动数据预处理引擎 ---")
+    trainer_cfg = config_module.TRAINER_CONFIG
+    imgsz = _train_imgsz(trainer_cfg["IMG_SIZE"])
+    workers = trainer_cfg.get("PREPARE_WORKERS", 0) or os.cpu_count() or 1
+    shard_size = config_module.SYNTHESIS_CONFIG.get("SHARD_SIZE", 256)
+
+    found = sources(config_module)
+    if not found:
+        print("[警告] 没有找到任何需要预处理的数据集 (合成数据集尚未生成，真实数据集也不存在)。")
+    prepared = {}
+    for name, (root, packed) in found.items():
+        output_root = cache_root(config_module, name, imgsz)
+        current = None if force else _current_manifest(config_module, name, imgsz)
+        if current is not None and current.get("skipped"):
+            print(f"⏭️  {name} 数据集此前无法预处理 ({current['skipped']})，源数据未变化，跳过。")
+            continue
+        if current is not None:
+            print(f"⏭️  {name} 数据集在 imgsz={imgsz} 下的缓存已是最新: {output_root}")
+            prepared[name] = output_root
+            continue
+
+        print(f"\n正在预处理 {name} 数据集 ({root}) → imgsz={imgsz}，{workers} 个线程...")
+        (output_root / MANIFEST_FILE).unlink(missing_ok=True)
+        source = source_fingerprint(root, packed)
+        start = time.time()
+        splits = {}
+        try:
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                for split_dir_name, split in SPLIT_DIRS.items():
+                    split_dir = Path(root) / split_dir_name
+                    if packed and (split_dir / PACKED_INDEX_FILE).exists():
+                        items = _packed_items(split_dir)
+                    elif not packed and (split_dir / "images").is_dir():
+                        items = _yolo_items(split_dir)
+                    else:
+                        continue
+                    splits[split] = _prepare_split(items, output_root / split, imgsz, split == "train", pool, shard_size)
+        except ValueError as e:
+            print(f"[警告] {name} 数据集预处理失败，训练时将直接读取原始图片: {e}")
+            # 仍然写出清单 (标记为跳过)：prepare 阶段的产物与源数据一一对应，失败的数据集不会使流水线中止
+            for split in SPLIT_DIRS.values():
+                shutil.rmtree(output_root / split, ignore_errors=True)
+            _write_manifest(output_root, {"version": PREPARE_VERSION, "imgsz": imgsz, "source": source,
+                                          "skipped": str(e)})
+            continue
+
+        _write_manifest(output_root, {"version": PREPARE_VERSION, "imgsz": imgsz, "source": source, "splits": splits})
+        elapsed = time.time() - start
+        count = sum(s["images"] for s in splits.values())
+        size_mb = sum(s["bytes"] for s in splits.values()) / 2**20
+        print(f"✅ {name}: {count} 张图片，用时 {elapsed:.1f} 秒，缓存 {size_mb:.1f} MB → {output_root}")
+        prepared[name] = output_root
+    return prepared
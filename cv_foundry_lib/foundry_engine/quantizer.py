@@ -0,0 +1,285 @@
+# cv_foundry/foundry_engine/quantizer.py
+
+import json
+import time
+from pathlib import Path
+from typing import Type
+
+import cv2
+import numpy as np
+
+from .packed_dataset import read_yolo_labels
+
+# 注意：onnxruntime.quantization / onnxruntime.transformers 只在真正生成对应变体时才导入。
+
+IMAGE_SUFFIXES = {".jpg", ".jpeg", ".png", ".bmp"}
+# 只量化卷积：YOLOv8 检测头末端的框解码 (Sigmoid/Mul/Add/Concat) 保持 FP32，避免坐标精度损失
+INT8_OP_TYPES = ["Conv"]
+
+
+def variant_path(fp32_path: Path, variant: str) -> Path:
+    """各精度变体的文件路径：fp32 即原始导出文件，其余为 <原文件名>_<变体>.onnx。"""
+    fp32_path = Path(fp32_path)
+    return fp32_path if variant == "fp32" else fp32_path.with_name(f"{fp32_path.stem}_{variant}.onnx")
+
+
+def _letterbox_layout(h: int, w: int, input_h: int, input_w: int):
+    """返回 (缩放比例, 缩放后宽, 缩放后高, 左填充, 上填充)，输入可以是正方形也可以是矩形。"""
+    scale = min(input_h / h, input_w / w)
+    new_w, new_h = round(w * scale), round(h * scale)
+    return scale, new_w, new_h, (input_w - new_w) // 2, (input_h - new_h) // 2
+
+
+def letterbox(image: np.ndarray, input_h: int, input_w: int) -> np.ndarray:
+    """与 Ultralytics 推理一致的等比缩放 + 居中灰边填充，返回 (1, 3, H, W) 的 float32 张量。"""
+    _, new_w, new_h, pad_x, pad_y = _letterbox_layout(*image.shape[:2], input_h, input_w)
+    canvas = np.full((input_h, input_w, 3), 114, dtype=np.uint8)
+    canvas[pad_y:pad_y + new_h, pad_x:pad_x + new_w] = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    return (canvas[..., ::-1].transpose(2, 0, 1)[None] / 255.0).astype(np.float32)
+
+
+def _list_images(images_dir: Path, limit: int = 0) -> list:
+    if not images_dir.is_dir():
+        return []
+    paths = sorted(p for p in images_dir.iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    return paths[:limit] if limit else paths
+
+
+def _input_shape(onnx_path: Path):
+    import onnxruntime as ort
+    session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    return model_input.name, model_input.shape[2], model_input.shape[3]
+
+
+def quantize_int8(fp32_path: Path, output_path: Path, calibration_images: list) -> Path:
+    """用真实图片做静态校准，生成 QDQ 格式的 INT8 模型 (权重按通道量化)。"""
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    input_name, input_h, input_w = _input_shape(fp32_path)
+
+    class _Reader(CalibrationDataReader):
+        def __init__(self):
+            self._paths = iter(calibration_images)
+
+        def get_next(self):
+            for path in self._paths:
+                image = cv2.imread(str(path))
+                if image is not None:
+                    return {input_name: letterbox(image, input_h, input_w)}
+            return None
+
+    # 量化前先做形状推断与图优化，量化器才能正确识别各个算子
+    prepared_path = output_path.with_name(f"{output_path.stem}_prep.onnx")
+    quant_pre_process(str(fp32_path), str(prepared_path), skip_symbolic_shape=True)
+    try:
+        quantize_static(
+            str(prepared_path), str(output_path), _Reader(),
+            quant_format=QuantFormat.QDQ,
+            op_types_to_quantize=INT8_OP_TYPES,
+            per_channel=True,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+        )
+    finally:
+        prepared_path.unlink(missing_ok=True)
+    return output_path
+
+
+def convert_fp16(fp32_path: Path, output_path: Path) -> Path:
+    """把权重和中间计算转换为 FP16，输入输出仍保持 FP32，部署端的预处理无需改动。"""
+    import onnx
+    from onnxruntime.transformers.float16 import convert_float_to_float16
+
+    model = convert_float_to_float16(onnx.load(str(fp32_path)), keep_io_types=True)
+    # 同一个 FP32 常量 (如两个上采样层共用的 Resize scales) 被多个保持 FP32 的节点引用时，
+    # 转换器会为每个引用各插入一个完全相同的 Cast 节点，onnxruntime 会以重复定义为由拒绝加载，这里只保留一个
+    seen, nodes = set(), []
+    for node in model.graph.node:
+        key = (node.op_type, tuple(node.input), tuple(node.output))
+        if node.op_type == "Cast" and key in seen:
+            continue
+        seen.add(key)
+        nodes.append(node)
+    del model.graph.node[:]
+    model.graph.node.extend(nodes)
+    onnx.save(model, str(output_path))
+    return output_path
+
+
+def benchmark_latency(onnx_path: Path, images: list, runs: int = 50, warmup: int = 5, session_options=None) -> dict:
+    """在本机CPU上测量单帧推理延迟 (不含预处理)，返回毫秒级统计。session_options 为空时使用 onnxruntime 默认设置。"""
+    import onnxruntime as ort
+
+    session = ort.InferenceSession(str(onnx_path), sess_options=session_options, providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    input_h, input_w = model_input.shape[2], model_input.shape[3]
+    tensors = [letterbox(image, input_h, input_w) for image in (cv2.imread(str(p)) for p in images) if image is not None]
+    if not tensors:
+        tensors = [np.zeros((1, 3, input_h, input_w), dtype=np.float32)]
+    for i in range(warmup):
+        session.run(None, {model_input.name: tensors[i % len(tensors)]})
+    samples = []
+    for i in range(runs):
+        start = time.perf_counter()
+        session.run(None, {model_input.name: tensors[i % len(tensors)]})
+        samples.append((time.perf_counter() - start) * 1000)
+    return {"p50_ms": float(np.percentile(samples, 50)), "p95_ms": float(np.percentile(samples, 95)),
+            "mean_ms": float(np.mean(samples))}
+
+
+def _box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-7)
+
+
+def _match_predictions(pred_boxes, pred_cls, true_boxes, true_cls, iouv: np.ndarray) -> np.ndarray:
+    """与 Ultralytics DetectionValidator 相同的贪心匹配：每个IoU阈值下，一个真实框最多匹配一个预测框。"""
+    correct = np.zeros((len(pred_boxes), len(iouv)), dtype=bool)
+    if not len(pred_boxes) or not len(true_boxes):
+        return correct
+    iou = _box_iou(true_boxes, pred_boxes) * (true_cls[:, None] == pred_cls[None, :])
+    for i, threshold in enumerate(iouv):
+        matches = np.argwhere(iou >= threshold)
+        if matches.shape[0] > 1:
+            matches = matches[iou[matches[:, 0], matches[:, 1]].argsort()[::-1]]
+            matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+            matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+        correct[matches[:, 1], i] = True
+    return correct
+
+
+def evaluate_map(onnx_path: Path, images_dir: Path, conf: float = 0.001, iou: float = 0.7, max_det: int = 300) -> dict:
+    """
+    直接用 onnxruntime 在一个划分上评估 ONNX 模型，返回 mAP50 与 mAP50-95。
+    Ultralytics 的 val() 只能验证正方形输入的 ONNX 模型，这里按其验证流程 (相同的NMS参数、匹配规则与AP计算) 自行实现，
+    正方形与矩形输入的模型因此可以用同一把尺子比较。标签从同级的 labels/ 目录读取 (YOLO格式)。
+    预处理与部署端一致 (INTER_LINEAR 缩放)，而 val() 缩小图片时用 INTER_AREA，因此 mAP50-95 可能与其有千分之几的差别。
+    """
+    import onnxruntime as ort
+    import torch
+    from ultralytics.utils import ops
+    from ultralytics.utils.metrics import ap_per_class
+
+    session = ort.InferenceSession(str(onnx_path), providers=["CPUExecutionProvider"])
+    model_input = session.get_inputs()[0]
+    input_h, input_w = model_input.shape[2], model_input.shape[3]
+    labels_dir = Path(images_dir).parent / "labels"
+    iouv = np.linspace(0.5, 0.95, 10)
+    tp, confs, pred_cls, target_cls = [], [], [], []
+    for path in _list_images(Path(images_dir)):
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+        h, w = image.shape[:2]
+        labels = read_yolo_labels(labels_dir / f"{path.stem}.txt")
+        cx, cy, bw, bh = labels[:, 1] * w, labels[:, 2] * h, labels[:, 3] * w, labels[:, 4] * h
+        true_boxes = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+
+        output = session.run(None, {model_input.name: letterbox(image, input_h, input_w)})[0]
+        pred = ops.non_max_suppression(torch.from_numpy(output), conf, iou, multi_label=True, max_det=max_det)[0].numpy()
+        # 从 letterbox 坐标还原到原图坐标
+        scale, _, _, pad_x, pad_y = _letterbox_layout(h, w, input_h, input_w)
+        boxes = (pred[:, :4] - (pad_x, pad_y, pad_x, pad_y)) / scale
+        boxes[:, 0::2] = boxes[:, 0::2].clip(0, w)
+        boxes[:, 1::2] = boxes[:, 1::2].clip(0, h)
+
+        tp.append(_match_predictions(boxes, pred[:, 5], true_boxes, labels[:, 0], iouv))
+        confs.append(pred[:, 4])
+        pred_cls.append(pred[:, 5])
+        target_cls.append(labels[:, 0])
+    if not tp or not np.concatenate(target_cls).size:
+        raise ValueError(f"{images_dir} 中没有可用于评估的带标注图片。")
+    ap = ap_per_class(np.concatenate(tp), np.concatenate(confs), np.concatenate(pred_cls), np.concatenate(target_cls))[5]
+    return {"map50": float(ap[:, 0].mean()), "map50_95": float(ap.mean())}
+
+
+def _format_table(rows: list) -> str:
+    baseline = next((row for row in rows if row["variant"] == "fp32"), None)
+    lines = ["| 变体 | 文件大小 (MB) | 延迟 p50 (ms) | 延迟 p95 (ms) | 加速比 | mAP50 | mAP50-95 | ΔmAP50-95 |",
+             "|---|---|---|---|---|---|---|---|"]
+    for row in rows:
+        speedup = baseline["latency"]["p50_ms"] / row["latency"]["p50_ms"] if baseline else float("nan")
+        metrics = row.get("metrics") or {}
+        delta = (metrics["map50_95"] - baseline["metrics"]["map50_95"]
+                 if metrics and baseline and baseline.get("metrics") else None)
+        lines.append(
+            f"| {row['variant']} | {row['size_mb']:.2f} | {row['latency']['p50_ms']:.2f} | {row['latency']['p95_ms']:.2f} "
+            f"| {speedup:.2f}x | {metrics.get('map50', float('nan')):.4f} | {metrics.get('map50_95', float('nan')):.4f} "
+            f"| {'' if delta is None else f'{delta:+.4f}'} |"
+        )
+    return "\n".join(lines)
+
+
+def run(config_module: Type, fp32_path: Path, variants: list) -> Path:
+    """
+    为已导出的 FP32 模型生成量化变体 ('int8'、'fp16')，并在 test 划分上比较各变体的延迟与精度。
+    比较表写入 <模型名>_report.md，明细写入 <模型名>_report.json，返回报告路径。
+    """
+    export_cfg = getattr(config_module, "EXPORT_CONFIG", {})
+    real_root = Path(config_module.TRAINER_CONFIG["REAL_DATASET_DIR"])
+    fp32_path = Path(fp32_path)
+    output_dir = fp32_path.parent
+
+    for variant in variants:
+        target = variant_path(fp32_path, variant)
+        try:
+            if variant == "int8":
+                # 校准图片取自训练划分，避免与评估用的 test 划分重叠
+                calibration = _list_images(real_root / "train" / "images", export_cfg.get("CALIBRATION_IMAGES", 100))
+                if not calibration:
+                    print(f"[警告] 在 {real_root / 'train' / 'images'} 中找不到校准图片，跳过 INT8 量化。")
+                    target.unlink(missing_ok=True)  # 不保留上一次导出遗留的 INT8 模型
+                    continue
+                print(f"正在生成 INT8 模型 (使用 {len(calibration)} 张真实图片校准)...")
+                quantize_int8(fp32_path, target, calibration)
+            elif variant == "fp16":
+                print("正在生成 FP16 模型...")
+                convert_fp16(fp32_path, target)
+            elif variant != "fp32":
+                print(f"[警告] 未知的量化变体 '{variant}'，已跳过。")
+                continue
+        except Exception as e:
+            print(f"[警告] 生成 {variant} 变体失败: {e}")
+            target.unlink(missing_ok=True)
+            continue
+        print(f"  > {variant} 模型: {target}")
+
+    if not export_cfg.get("QUANT_REPORT", True):
+        return None
+
+    # --- 在 test 划分上比较各变体 ---
+    test_images = _list_images(real_root / "test" / "images")
+    if not test_images:
+        print(f"[警告] 找不到 test 划分 ({real_root / 'test' / 'images'})，报告中将只包含延迟。")
+
+    rows = []
+    for variant in ["fp32"] + [v for v in variants if v != "fp32"]:
+        path = variant_path(fp32_path, variant)
+        if not path.exists():
+            continue
+        print(f"\n正在评估 {variant} 变体...")
+        # 较新的 torch 导出器会把权重写到同名的 .onnx.data 外部数据文件中，大小一并计入
+        size = sum(p.stat().st_size for p in (path, path.with_name(path.name + ".data")) if p.exists())
+        row = {"variant": variant, "file": path.name, "size_mb": size / 2**20,
+               "latency": benchmark_latency(path, test_images[:20], runs=export_cfg.get("BENCHMARK_RUNS", 50))}
+        if test_images:
+            try:
+                row["metrics"] = evaluate_map(path, real_root / "test" / "images")
+            except Exception as e:
+                print(f"[警告] {variant} 变体的 mAP 评估失败: {e}")
+        rows.append(row)
+
+    table = _format_table(rows)
+    report_md = output_dir / f"{fp32_path.stem}_report.md"
+    report_md.write_text(f"# {fp32_path.stem} 量化对比 (CPU)\n\n{table}\n", encoding="utf-8")
+    with open(output_dir / f"{fp32_path.stem}_report.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"\n{table}\n")
+    print(f"  > 对比报告已保存至: {report_md}")
+    return report_md
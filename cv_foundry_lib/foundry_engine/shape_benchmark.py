@@ -0,0 +1,100 @@
+# cv_foundry/foundry_engine/shape_benchmark.py
+
+import json
+from pathlib import Path
+from typing import Type
+
+from . import exporter, quantizer, trainer
+from .tuner import _size_tag
+
+
+def _padding_ratio(images: list, input_h: int, input_w: int) -> float:
+    """letterbox 后输入张量中灰边填充所占的平均比例 (浪费的计算量)。"""
+    import cv2
+
+    ratios = []
+    for path in images:
+        image = cv2.imread(str(path))
+        if image is not None:
+            _, new_w, new_h, _, _ = quantizer._letterbox_layout(*image.shape[:2], input_h, input_w)
+            ratios.append(1 - new_w * new_h / (input_h * input_w))
+    return sum(ratios) / len(ratios) if ratios else float("nan")
+
+
+def _format_table(rows: list) -> str:
+    """rows[0] 为基准尺寸，在表中以 (基准) 标出。"""
+    baseline = rows[0]
+    lines = ["| 输入尺寸 (宽×高) | 像素数 | 填充占比 | 延迟 p50 (ms) | 加速比 | mAP50 | mAP50-95 | ΔmAP50-95 |",
+             "|---|---|---|---|---|---|---|---|"]
+    for row in rows:
+        h, w = row["input_size"]
+        metrics = row.get("metrics") or {}
+        delta = (metrics["map50_95"] - baseline["metrics"]["map50_95"]
+                 if metrics and baseline.get("metrics") else None)
+        lines.append(
+            f"| {w}×{h}{' (基准)' if row is baseline else ''} | {h * w} | {row['padding_ratio']:.0%} | {row['latency']['p50_ms']:.2f} "
+            f"| {baseline['latency']['p50_ms'] / row['latency']['p50_ms']:.2f}x "
+            f"| {metrics.get('map50', float('nan')):.4f} | {metrics.get('map50_95', float('nan')):.4f} "
+            f"| {'' if delta is None else f'{delta:+.4f}'} |"
+        )
+    return "\n".join(lines)
+
+
+def run(config_module: Type, shapes: list = None) -> Path:
+    """
+    输入尺寸对照实验：对 TRAINER_CONFIG["SHAPE_BENCHMARK"] 中的每个尺寸 (整数为正方形，[高, 宽] 为矩形)，
+    从同一个预训练模型出发重新微调并导出，然后在真实数据的 test 划分上比较CPU延迟与mAP。
+    第一个尺寸作为基准 (基准尺寸训练或导出失败时中止实验)，结果写入 shape_benchmark.md / shape_benchmark.json。
+    """
+    print("\n--- 启动输入尺寸对照实验 ---")
+    trainer_cfg = config_module.TRAINER_CONFIG
+    shapes = shapes or trainer_cfg.get("SHAPE_BENCHMARK", [])
+    if len(shapes) < 2:
+        print("[致命错误] 至少需要两个输入尺寸才能比较，请在蓝图的 TRAINER_CONFIG['SHAPE_BENCHMARK'] 中配置。")
+        return None
+
+    blueprint_name = config_module.BLUEPRINT_DIR.name
+    models_dir = Path(trainer_cfg["OUTPUT_MODELS_DIR"])
+    real_root = Path(trainer_cfg["REAL_DATASET_DIR"])
+    eval_dir = real_root / "test" / "images"
+    if not quantizer._list_images(eval_dir):
+        print(f"[警告] 找不到 test 划分，改用验证集 ({real_root / 'valid' / 'images'}) 评估。")
+        eval_dir = real_root / "valid" / "images"
+    eval_images = quantizer._list_images(eval_dir)
+    runs = getattr(config_module, "EXPORT_CONFIG", {}).get("BENCHMARK_RUNS", 50)
+
+    rows = []
+    for shape in shapes:
+        tag = _size_tag(shape)
+        print(f"\n===== 输入尺寸 {tag} =====")
+        # 只使用本次训练与导出的结果：失败时磁盘上可能残留以前运行的同名模型
+        onnx_path = None
+        if trainer.run(config_module, training_mode='finetune', img_size=shape, suffix=tag) is not None:
+            onnx_path = exporter.run(config_module, source_model=f"finetune_{tag}", img_size=shape, quantize=False)
+        if onnx_path is None:
+            if not rows:
+                print(f"[致命错误] 基准输入尺寸 {tag} 的微调或导出失败，其他尺寸无从比较，实验已中止。")
+                return None
+            print(f"[警告] 输入尺寸 {tag} 的微调或导出失败，已跳过。")
+            continue
+        _, input_h, input_w = quantizer._input_shape(onnx_path)
+        row = {"shape": shape, "baseline": not rows, "input_size": [input_h, input_w], "model": onnx_path.name,
+               "padding_ratio": _padding_ratio(eval_images, input_h, input_w),
+               "latency": quantizer.benchmark_latency(onnx_path, eval_images[:20], runs=runs)}
+        try:
+            row["metrics"] = quantizer.evaluate_map(onnx_path, eval_dir)
+        except Exception as e:
+            print(f"[警告] 输入尺寸 {tag} 的 mAP 评估失败: {e}")
+        rows.append(row)
+
+    table = _format_table(rows)
+    baseline_h, baseline_w = rows[0]["input_size"]
+    report_md = models_dir / "shape_benchmark.md"
+    report_md.write_text(f"# {blueprint_name} 输入尺寸对照 (CPU, 评估集: {eval_dir.parent.name})\n\n"
+                         f"加速比与 ΔmAP50-95 均相对于基准尺寸 {baseline_w}×{baseline_h}。\n\n{table}\n",
+                         encoding="utf-8")
+    with open(models_dir / "shape_benchmark.json", "w", encoding="utf-8") as f:
+        json.dump(rows, f, ensure_ascii=False, indent=2)
+    print(f"\n{table}\n")
+    print(f"  > 对照报告已保存至: {report_md}")
+    return report_md
@@ -0,0 +1,87 @@
+# cv_foundry/foundry_engine/synthesis_manifest.py
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Type
+
+MANIFEST_FILE = "manifest.json"
+MANIFEST_VERSION = 1
+# 每个分片完成后写出的记录文件所在的子目录 (位于各划分目录下)
+SHARD_RECORDS_DIR = ".shards"
+
+# 只影响样本数量、输出位置或任务划分、不影响每张图片内容的配置项，不参与配置哈希
+# (每张图片的种子由样本索引派生，SHARD_SIZE 只决定如何把索引区间分给工作进程；分片边界变化时旧分片会按记录被重新生成)
+_NON_CONTENT_KEYS = {"NUM_TRAIN_IMAGES", "NUM_VAL_IMAGES", "OUTPUT_DATASET_DIR", "ASSET_CACHE_DIR", "SHARD_SIZE"}
+
+
+def _atomic_write_json(path: Path, data: dict):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(path.suffix + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path: Path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def compute_fingerprint(config_module: Type) -> dict:
+    """计算决定合成结果的全部输入：内容相关配置的哈希、每个资产文件的哈希以及基础种子。"""
+    cfg = config_module.SYNTHESIS_CONFIG
+    content_cfg = {k: v for k, v in cfg.items() if k not in _NON_CONTENT_KEYS}
+    content_cfg["CLASSES"] = config_module.CLASSES
+    config_blob = json.dumps(content_cfg, sort_keys=True, default=str).encode()
+
+    asset_hashes = {
+        asset_file.name: hashlib.sha256(asset_file.read_bytes()).hexdigest()
+        for asset_file in sorted(config_module.ASSETS_PATH.glob("*.png"))
+    }
+    return {
+        "version": MANIFEST_VERSION,
+        "config_hash": hashlib.sha256(config_blob).hexdigest(),
+        "asset_hashes": asset_hashes,
+        "seed": cfg.get("SEED", 0),
+    }
+
+
+def load_manifest(dataset_root: Path):
+    return _read_json(dataset_root / MANIFEST_FILE)
+
+
+def save_manifest(dataset_root: Path, manifest: dict):
+    _atomic_write_json(dataset_root / MANIFEST_FILE, manifest)
+
+
+def fingerprint_matches(manifest, fingerprint: dict) -> bool:
+    """清单存在且记录的输入与当前输入完全一致时返回 True。"""
+    return bool(manifest) and all(manifest.get(k) == v for k, v in fingerprint.items())
+
+
+def shard_record_path(output_dir: Path, shard_id: int) -> Path:
+    return output_dir / SHARD_RECORDS_DIR / f"shard_{shard_id:05d}.json"
+
+
+def write_shard_record(output_dir: Path, shard_id: int, record: dict):
+    """分片全部输出写完后才写记录文件，因此记录存在即代表该分片已完整生成。"""
+    _atomic_write_json(shard_record_path(output_dir, shard_id), record)
+
+
+def load_shard_records(output_dir: Path) -> dict:
+    """读取某个划分下所有已完成分片的记录，返回 {shard_id: record}。"""
+    records = {}
+    for path in sorted((output_dir / SHARD_RECORDS_DIR).glob("shard_*.json")):
+        record = _read_json(path)
+        if record is not None:
+            records[int(path.stem.split("_")[1])] = record
+    return records
+
+
+def remove_shard_record(output_dir: Path, shard_id: int):
+    shard_record_path(output_dir, shard_id).unlink(missing_ok=True)
@@ -0,0 +1,181 @@
+# cv_foundry/foundry_engine/synthetic_stream.py
+
+import math
+import random
+from pathlib import Path
+from typing import Type
+
+import cv2
+import numpy as np
+import yaml
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from . import data_synthesizer
+
+
+class SyntheticStreamDataset(YOLODataset):
+    """
+    在内存中即时合成画布与标签的YOLO数据集，不读写任何磁盘文件。
+    - 训练集 (fresh=True): 每次取样都使用新的随机种子，每个epoch看到的都是全新样本。
+    - 验证集 (fresh=False): 每个索引使用固定的派生种子，保证各epoch的指标可比。
+    """
+
+    def __init__(self, *args, synth_cfg: dict, class_map: dict, asset_images: dict,
+                 num_samples: int, split: str, fresh: bool, **kwargs):
+        # 这些属性必须在父类 __init__ 之前设置，因为父类会调用 get_img_files / get_labels
+        self.synth_cfg = synth_cfg
+        self.class_map = class_map
+        self.compositor = data_synthesizer._build_compositor(synth_cfg, asset_images)
+        self.num_samples = num_samples
+        self.split = split
+        self.fresh = fresh
+        self.base_seed = synth_cfg.get("SEED", 0)
+        kwargs["cache"] = False  # 样本本身就是即时生成的，无需也无法缓存
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path):
+        """返回虚拟文件名，仅用于日志和评估时的标识。"""
+        return [f"{self.split}/synth_{i}.png" for i in range(self.num_samples)]
+
+    def get_labels(self):
+        """标签在取样时才生成，这里只提供形状一致的占位标签。"""
+        shape = (self.synth_cfg["IMAGE_HEIGHT"], self.synth_cfg["IMAGE_WIDTH"])
+        return [
+            {
+                "im_file": im_file,
+                "shape": shape,
+                "cls": np.zeros((0, 1), dtype=np.float32),
+                "bboxes": np.zeros((0, 4), dtype=np.float32),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            }
+            for im_file in self.im_files
+        ]
+
+    def _render(self, index: int) -> tuple:
+        """合成第 index 个样本，返回 (BGR图像, 标注列表)。"""
+        if self.fresh:
+            # random.Random() 以系统熵初始化，各 DataLoader 子进程之间不会产生重复样本
+            rng = random.Random()
+        else:
+            rng = random.Random(data_synthesizer._derive_seed(self.base_seed, self.split, index))
+        canvas, annotations = data_synthesizer._render_sample(rng, self.synth_cfg, self.class_map, self.compositor)
+        # cvtColor 会产生新数组，因此可以放心复用合成器的画布缓冲区
+        return cv2.cvtColor(canvas, cv2.COLOR_RGB2BGR), annotations
+
+    def get_image_and_label(self, index: int) -> dict:
+        """即时合成一张图片及其标签，输出格式与 YOLODataset 完全一致。"""
+        im, annotations = self._render(index)
+
+        # 与 BaseDataset.load_image 相同：长边缩放到 imgsz 并保持宽高比
+        h0, w0 = im.shape[:2]
+        r = self.imgsz / max(h0, w0)
+        if r != 1:
+            w, h = (min(math.ceil(w0 * r), self.imgsz), min(math.ceil(h0 * r), self.imgsz))
+            im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+
+        if annotations:
+            arr = np.array(annotations, dtype=np.float32)
+            cls, bboxes = arr[:, :1], arr[:, 1:]
+        else:
+            cls, bboxes = np.zeros((0, 1), dtype=np.float32), np.zeros((0, 4), dtype=np.float32)
+        if self.single_cls:
+            cls[:, 0] = 0
+
+        # Mosaic 等增强会从 buffer 中抽取其它索引，需要像 load_image 一样维护它
+        if self.augment:
+            self.buffer.append(index)
+            if len(self.buffer) > self.max_buffer_length:
+                self.buffer.pop(0)
+
+        label = {
+            "im_file": self.im_files[index],
+            "cls": cls,
+            "bboxes": bboxes,
+            "segments": [],
+            "keypoints": None,
+            "normalized": True,
+            "bbox_format": "xywh",
+            "img": im,
+            "ori_shape": (h0, w0),
+            "resized_shape": im.shape[:2],
+        }
+        label["ratio_pad"] = (
+            label["resized_shape"][0] / label["ori_shape"][0],
+            label["resized_shape"][1] / label["ori_shape"][1],
+        )
+        if self.rect:
+            label["rect_shape"] = self.batch_shapes[self.batch[index]]
+        return self.update_labels_info(label)
+
+
+def create_stream_dataset_yaml(config_module: Type) -> Path:
+    """
+    为流式数据集生成 dataset.yaml。
+    Ultralytics 会校验 'val' 路径是否存在，因此这里只创建空目录占位，目录中不会写入任何样本。
+    """
+    dataset_root = config_module.SYNTHESIS_CONFIG["OUTPUT_DATASET_DIR"]
+    for split in ("train", "val"):
+        (dataset_root / split / "images").mkdir(parents=True, exist_ok=True)
+
+    yaml_content = {
+        'path': str(dataset_root.resolve()),
+        'train': 'train/images',
+        'val': 'val/images',
+        'names': {i: name for i, name in enumerate(config_module.CLASSES.keys())}
+    }
+    yaml_path = dataset_root / "stream_dataset.yaml"
+    with open(yaml_path, 'w') as f:
+        yaml.dump(yaml_content, f, sort_keys=False)
+
+    print(f"动态生成流式数据集配置文件: {yaml_path}")
+    return yaml_path
+
+
+def build_stream_trainer(config_module: Type) -> type:
+    """
+    构造一个使用 SyntheticStreamDataset 的 DetectionTrainer 子类，供 model.train(trainer=...) 使用。
+    资产只在主进程中加载一次，随数据集对象分发给 DataLoader 子进程。
+    """
+    synth_cfg = config_module.SYNTHESIS_CONFIG
+    classes = config_module.CLASSES
+    asset_images = data_synthesizer._get_asset_images(config_module)
+
+    class SyntheticStreamTrainer(DetectionTrainer):
+        """训练集与验证集均在内存中即时合成的检测训练器。"""
+
+        def build_dataset(self, img_path, mode="train", batch=None):
+            gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+            is_train = mode == "train"
+            return SyntheticStreamDataset(
+                img_path=img_path,
+                imgsz=self.args.imgsz,
+                batch_size=batch,
+                augment=is_train,
+                hyp=self.args,
+                rect=self.args.rect or not is_train,
+                single_cls=self.args.single_cls or False,
+                stride=gs,
+                pad=0.0 if is_train else 0.5,
+                prefix=colorstr(f"{mode} (stream): "),
+                task=self.args.task,
+                classes=self.args.classes,
+                data=self.data,
+                synth_cfg=synth_cfg,
+                class_map=classes,
+                asset_images=asset_images,
+                num_samples=synth_cfg["NUM_TRAIN_IMAGES"] if is_train else synth_cfg["NUM_VAL_IMAGES"],
+                split="train" if is_train else "val",
+                fresh=is_train,
+            )
+
+        def plot_training_labels(self):
+            """流式数据集的标签在训练前并不存在，跳过标签分布图。"""
+            pass
+
+    return SyntheticStreamTrainer
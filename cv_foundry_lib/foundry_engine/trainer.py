@@ -8,11 +8,122 @@ from ultralytics import YOLO
 
 # cv_foundry/foundry_engine/trainer.py (黄金标准 V2.1 - 两阶段版)
 
+import math
+import os
 import yaml
 from pathlib import Path
 from typing import Type
 
 from ultralytics import YOLO
+from ultralytics.data import build_dataloader
+from ultralytics.data.build import PIN_MEMORY, InfiniteDataLoader, seed_worker
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils.torch_utils import torch_distributed_zero_first
+
+from . import training_control
+
+
+def resolve_img_size(img_size):
+    """
+    IMG_SIZE 可以是整数 (正方形输入) 或 [高, 宽] (矩形输入)。
+    返回 (训练用 imgsz, 是否矩形训练)：Ultralytics 训练只接受整数 imgsz，矩形输入通过 rect 模式实现，
+    此时 imgsz 为长边，批次形状由 _rect_trainer 固定为配置的 [高, 宽] (如 [160, 640])，与导出的模型输入一致。
+    """
+    if isinstance(img_size, int):
+        return img_size, False
+    return max(img_size), True
+
+
+def _rect_trainer(base: type, rect_shape) -> type:
+    """
+    Ultralytics 的 rect 模式按每批图片的宽高比自动决定批次形状 (如 711×295 的截图在长边 640 时为 288×640)，
+    与按 IMG_SIZE 导出的模型输入 (如 160×640) 不一致。这里把训练集与验证集的批次形状都固定为配置的 [高, 宽]
+    (向上取整到步长的倍数)，图片按该形状 letterbox，训练、验证与推理看到的输入完全相同。
+    所有批次形状相同后打乱是安全的，因此重新打开 rect 模式下被关闭的训练集打乱。
+    注意 rect 模式下 Mosaic/MixUp 增强仍会被 Ultralytics 关闭。
+    """
+
+    class RectTrainer(base):
+        def build_dataset(self, img_path, mode="train", batch=None):
+            dataset = super().build_dataset(img_path, mode, batch)
+            if getattr(dataset, "rect", False):
+                pinned = [math.ceil(x / dataset.stride) * dataset.stride for x in rect_shape]
+                natural = {tuple(shape) for shape in dataset.batch_shapes.tolist()}
+                if mode == "train" and natural != {tuple(pinned)}:
+                    print(f"提示: 按图片宽高比自动计算的批次形状为 {sorted(natural)}，"
+                          f"已固定为 IMG_SIZE 的 {pinned} (图片按该形状 letterbox)。")
+                dataset.batch_shapes[:] = pinned
+            return dataset
+
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode != "train":
+                return super().get_dataloader(dataset_path, batch_size, rank, mode)
+            with torch_distributed_zero_first(rank):
+                dataset = self.build_dataset(dataset_path, mode, batch_size)
+            return build_dataloader(dataset, batch_size, self.args.workers, True, rank)
+
+    return RectTrainer
+
+
+def _balanced_trainer(base: type, weights: dict) -> type:
+    """
+    训练集按类别均衡的权重有放回采样 (weights 为 {图片文件名去掉扩展名: 采样权重}，由 label_index 计算)。
+    每个epoch仍抽取与训练集等量的图片，只是稀有类别的图片被抽中的概率更高；验证集不受影响。
+    """
+    import torch
+
+    class BalancedTrainer(base):
+        def get_dataloader(self, dataset_path, batch_size=16, rank=0, mode="train"):
+            if mode != "train" or rank != -1:
+                return super().get_dataloader(dataset_path, batch_size, rank, mode)
+            with torch_distributed_zero_first(rank):
+                dataset = self.build_dataset(dataset_path, mode, batch_size)
+            if getattr(dataset, "rect", False) and len({tuple(s) for s in dataset.batch_shapes}) > 1:
+                print("[警告] rect 模式下训练图片的宽高比不一致，无法按权重采样，已改为顺序读取。")
+                return build_dataloader(dataset, batch_size, self.args.workers, False, rank)
+            image_weights = [weights.get(Path(f).stem, 1.0) for f in dataset.im_files]
+            sampler = torch.utils.data.WeightedRandomSampler(image_weights, len(image_weights), replacement=True)
+            generator = torch.Generator()
+            generator.manual_seed(6148914691236517205)  # 与 Ultralytics build_dataloader 使用相同的种子
+            return InfiniteDataLoader(
+                dataset=dataset,
+                batch_size=min(batch_size, len(dataset)),
+                num_workers=min(os.cpu_count() // max(torch.cuda.device_count(), 1), self.args.workers),
+                sampler=sampler,
+                pin_memory=PIN_MEMORY,
+                collate_fn=getattr(dataset, "collate_fn", None),
+                worker_init_fn=seed_worker,
+                generator=generator,
+            )
+
+    return BalancedTrainer
+
+
+def _check_labels(config_module: Type, data_source: str, training_mode: str, packed_root: Path = None):
+    """
+    训练前用标签索引检查训练集 (类别ID越界、没有样本的类别、坏行等)，并返回类别均衡的采样权重 {文件名: 权重}。
+    mixed 模式分别检查合成与真实训练集，权重在各自的数据集内计算。流式数据没有标签文件，返回 None。
+    """
+    from . import label_index
+
+    if data_source == 'stream':
+        return None
+    if data_source in ('packed', 'prepared'):
+        indexes = {'train': label_index.from_packed(packed_root / "train")}
+    else:
+        names = {'pretrain': ['synthetic'], 'finetune': ['real'], 'mixed': ['synthetic', 'real']}[training_mode]
+        indexes = {name: label_index.load(config_module, name, 'train') for name in names}
+    indexes = {name: index for name, index in indexes.items() if index is not None}
+    if not indexes:
+        return None
+    class_names = list(config_module.CLASSES.keys())
+    weights = {}
+    for name, index in indexes.items():
+        for problem in label_index.problems(label_index.summarize(index, class_names)):
+            print(f"[警告] {name} 训练集标签: {problem}")
+        index_weights = label_index.sampling_weights(index, len(class_names))
+        weights.update({Path(image): float(w) for image, w in zip(index.names, index_weights)})
+    return {image.stem: w for image, w in weights.items()}
 
 
 def _create_dataset_yaml(dataset_root: Path, config_module: Type) -> Path:
@@ -46,8 +157,17 @@ def _create_dataset_yaml(dataset_root: Path, config_module: Type) -> Path:
     return yaml_path
 
 
-def run(config_module: Type, training_mode: str):
-    """[重构] 模型训练引擎主入口，支持 'pretrain' 和 'finetune' 模式。"""
+def run(config_module: Type, training_mode: str, data_source: str = None, img_size=None, suffix: str = ""):
+    """
+    [重构] 模型训练引擎主入口，支持 'pretrain'、'finetune' 和 'mixed' 模式。
+    'mixed' 从基础模型出发，在一次训练中按 MIXED_CONFIG 的比例计划同时采样合成与真实训练集，并报告达到目标精度所用的时间。
+    pretrain 的数据来源 data_source 可为 'disk' (读取合成器输出)、'stream' (内存中即时合成)
+    或 'packed' (读取打包分片)，未指定时使用 TRAINER_CONFIG["PRETRAIN_DATA_SOURCE"]；
+    若合成器配置为打包输出，'disk' 会自动切换为 'packed'。
+    'disk'/'packed' 数据存在有效的 prepare 缓存 (与当前输入尺寸匹配) 时，自动改为读取预缩放的缓存 ('prepared')。
+    img_size 与 suffix 用于在不修改蓝图的情况下训练其他输入尺寸的对照模型 (产物为 <蓝图>_<模式>_<suffix>.pt)。
+    返回保存的最佳模型路径，失败时返回 None。
+    """
     print(f"\n--- 启动模型训练引擎 [{training_mode.upper()}] [V2.1] ---")
 
     trainer_cfg = config_module.TRAINER_CONFIG
@@ -62,6 +182,10 @@ def run(config_module: Type, training_mode: str):
         epochs = trainer_cfg['EPOCHS']
         batch_size = trainer_cfg['BATCH_SIZE']
         project_name = f"{blueprint_name}_pretrain"
+        mode_params = trainer_cfg
+        data_source = data_source or trainer_cfg.get("PRETRAIN_DATA_SOURCE", "disk")
+        if data_source == 'disk' and config_module.SYNTHESIS_CONFIG.get("OUTPUT_FORMAT") == "packed":
+            data_source = 'packed'
         
     elif training_mode == 'finetune':
         dataset_path = trainer_cfg["REAL_DATASET_DIR"]
@@ -76,42 +200,129 @@ def run(config_module: Type, training_mode: str):
         epochs = finetune_params['EPOCHS']
         batch_size = finetune_params['BATCH_SIZE']
         project_name = f"{blueprint_name}_finetune"
+        mode_params = finetune_params
+        data_source = 'disk'
+
+    elif training_mode == 'mixed':
+        # 混合训练同样从基础模型出发，取代 预训练 → 微调 两次完整训练
+        model_to_load = str(model_cfg['BASE_MODEL'])
+        mixed_params = trainer_cfg['MIXED_CONFIG']
+        epochs = mixed_params['EPOCHS']
+        batch_size = mixed_params['BATCH_SIZE']
+        project_name = f"{blueprint_name}_mixed"
+        mode_params = mixed_params
+        data_source = 'mixed'
+        dataset_path = None
     else:
         print(f"[致命错误] 未知的训练模式: {training_mode}")
         return
+    if suffix:
+        project_name = f"{project_name}_{suffix}"
+    img_size = img_size if img_size is not None else trainer_cfg['IMG_SIZE']
+    imgsz, rect = resolve_img_size(img_size)
+    prepared_root = None
+    if data_source in ('disk', 'packed') and trainer_cfg.get("USE_PREPARED_DATA", True):
+        from . import preparer
+        prepared_root = preparer.lookup(config_module, 'synthetic' if training_mode == 'pretrain' else 'real', imgsz)
+        if prepared_root is not None:
+            data_source = 'prepared'
+        else:
+            print(f"提示: 没有与当前数据集和 imgsz={imgsz} 匹配的预处理缓存，将直接解码原始图片 (可先执行 'prepare' 步骤)。")
 
     # --- 2. 创建数据集YAML并初始化模型 ---
+    extra_train_args = {}
+    packed_root = None
     try:
-        dataset_yaml_path = _create_dataset_yaml(dataset_path, config_module)
+        if data_source == 'stream':
+            # 流式模式：训练/验证样本都在 DataLoader 子进程中即时合成，不经过磁盘
+            from . import synthetic_stream
+            dataset_yaml_path = synthetic_stream.create_stream_dataset_yaml(config_module)
+            extra_train_args['trainer'] = synthetic_stream.build_stream_trainer(config_module)
+        elif data_source in ('packed', 'prepared'):
+            # 打包模式：图像来自可内存映射的分片，标签来自列式索引 (prepare 缓存使用同一格式，图像已缩放到训练分辨率)
+            from . import packed_yolo
+            packed_root = prepared_root if data_source == 'prepared' else dataset_path / "packed"
+            dataset_yaml_path = packed_yolo.create_packed_dataset_yaml(packed_root, config_module)
+            extra_train_args['trainer'] = packed_yolo.build_packed_trainer(packed_root)
+        elif data_source == 'mixed':
+            from . import mixed_training
+            dataset_yaml_path = mixed_training.create_mixed_dataset_yaml(config_module)
+            if dataset_yaml_path is None:
+                return
+        else:
+            dataset_yaml_path = _create_dataset_yaml(dataset_path, config_module)
         model = YOLO(str(model_to_load))
         print(f"成功加载模型: {Path(model_to_load).name}")
     except Exception as e:
         print(f"[致命错误] 初始化失败: {e}")
         return
+    if rect:
+        extra_train_args['rect'] = True
+        extra_train_args['trainer'] = _rect_trainer(extra_train_args.get('trainer', DetectionTrainer), img_size)
+    weights = _check_labels(config_module, data_source, training_mode, packed_root)
+    if data_source == 'mixed':
+        # 来源内部是否按类别均衡采样同样由 BALANCED_SAMPLING 决定
+        balanced = (weights or {}) if trainer_cfg.get("BALANCED_SAMPLING", False) else {}
+        extra_train_args['trainer'] = mixed_training.build_mixed_trainer(
+            config_module, extra_train_args.get('trainer', DetectionTrainer), balanced)
+    elif trainer_cfg.get("BALANCED_SAMPLING", False):
+        if weights is None:
+            print(f"提示: 数据来源 '{data_source}' 没有可索引的标签，BALANCED_SAMPLING 不生效。")
+        else:
+            extra_train_args['trainer'] = _balanced_trainer(extra_train_args.get('trainer', DetectionTrainer), weights)
 
-    # --- 3. 启动训练 ---
-    print(f"\n--- 开始 {training_mode} ---")
+    # --- 3. 断点续训与停止条件 ---
+    # PATIENCE / TIME_BUDGET_HOURS 可在 FINETUNE_CONFIG / MIXED_CONFIG 中单独覆盖
+    patience = mode_params.get("PATIENCE", trainer_cfg.get("PATIENCE", 100))
+    budget_hours = mode_params.get("TIME_BUDGET_HOURS", trainer_cfg.get("TIME_BUDGET_HOURS"))
+    results_dir = output_models_dir / f"{project_name}_results"
+    key = training_control.run_key(model_to_load, dataset_yaml_path, {
+        "mode": training_mode, "data_source": data_source, "epochs": epochs, "batch": batch_size, "imgsz": imgsz,
+        "rect": img_size if rect else False, "patience": patience, "balanced": trainer_cfg.get("BALANCED_SAMPLING", False),
+        "mixed": trainer_cfg.get("MIXED_CONFIG") if training_mode == 'mixed' else None,
+    })
+    resume_from = training_control.resumable_checkpoint(results_dir, key) if trainer_cfg.get("RESUME", True) else None
+    if resume_from is not None:
+        last_pt, completed = resume_from
+        model = YOLO(str(last_pt))
+        extra_train_args['resume'] = True
+        print(f"发现未完成的训练 (已完成 {completed}/{epochs} 个epoch)，将从检查点继续: {last_pt}")
+    state = training_control.start(results_dir, key, resume_from)
+    status = training_control.attach_time_budget(model, results_dir, state, budget_hours)
+
+    # --- 4. 启动训练 ---
+    print(f"\n--- 开始 {training_mode} (数据来源: {data_source}，输入尺寸: {imgsz}{' 矩形' if rect else ''}) ---")
     try:
         model.train(
             data=str(dataset_yaml_path),
             epochs=epochs,
             batch=batch_size,
-            imgsz=trainer_cfg['IMG_SIZE'],
+            imgsz=imgsz,
+            patience=patience or epochs,  # 0 表示关闭提前停止
             project=str(output_models_dir),
             name=f"{project_name}_results",
-            exist_ok=True
+            exist_ok=True,
+            workers=trainer_cfg.get("WORKERS", 8),
+            cache=trainer_cfg.get("CACHE", False),
+            **extra_train_args
         )
         print(f"\n✅ {training_mode.capitalize()} 成功完成！")
 
-        # --- 4. 保存最终模型 ---
-        best_model_path = output_models_dir / f"{project_name}_results/weights/best.pt"
+        # --- 5. 保存最终模型 (复制而不是移动，best.pt 保留在训练结果目录中) ---
         target_path = output_models_dir / f"{project_name}.pt"
-        
-        if best_model_path.exists():
-            best_model_path.rename(target_path)
+        if training_control.save_best(results_dir, target_path):
             print(f"  > 最佳模型已保存至: {target_path}")
         else:
-            print(f"[警告] 未找到训练产出的最佳模型。")
+            print(f"[致命错误] 未找到训练产出的最佳模型: {results_dir / 'weights' / 'best.pt'}")
+            return None
+        training_control.write_report(results_dir, output_models_dir / f"{project_name}_run_report.json",
+                                      training_mode, epochs, patience, budget_hours, state, status)
+
+        if training_mode == 'mixed':
+            mixed_training.write_report(config_module, results_dir, dataset_yaml_path, imgsz, epochs)
+        return target_path
 
     except Exception as e:
-        print(f"\n[致命错误] 训练过程中发生错误: {e}")
\ No newline at end of file
+        print(f"\n[致命错误] 训练过程中发生错误: {e}")
+        print("  > 已完成的epoch保存在检查点中，重新运行同一步骤即可从断点继续。")
+        return None
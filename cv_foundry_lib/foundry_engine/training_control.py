@@ -0,0 +1,194 @@
+# cv_foundry/foundry_engine/training_control.py
+
+import csv
+import json
+import os
+import shutil
+import time
+from pathlib import Path
+
+from .pipeline import _hash_json, file_fingerprint
+
+# 训练过程控制：断点续训、mAP 停滞时提前停止、墙钟时间预算，以及每次训练的 实际/配置 epoch 数报告。
+# 续训状态保存在 <训练结果目录>/run_state.json:
+#   {"key": 本次训练输入的哈希, "elapsed_seconds": 历次进程累计的训练用时, "resumed_from": [续训起点epoch, ...]}
+RUN_STATE_FILE = "run_state.json"
+
+
+def read_results(csv_path: Path) -> list:
+    """
+    读取 Ultralytics 的 results.csv (每个epoch一行)，不存在时返回空列表。
+    续训的进程会从0重新计时，这里把 "time" 列还原为跨越所有续训进程的累计用时。
+    """
+    if not Path(csv_path).exists():
+        return []
+    with open(csv_path, newline="") as f:
+        rows = [{k.strip(): float(v) for k, v in row.items()} for row in csv.DictReader(f)]
+    offset, previous = 0.0, 0.0
+    for row in rows:
+        if "time" in row:
+            if row["time"] < previous:
+                offset += previous
+            previous = row["time"]
+            row["time"] += offset
+    return rows
+
+
+def run_key(model_to_load, dataset_yaml_path: Path, train_args: dict) -> str:
+    """决定训练结果的全部输入：起点模型、数据集配置与训练参数。只有输入完全一致的中断训练才会被续训。"""
+    return _hash_json({
+        "model": str(model_to_load),
+        "model_file": file_fingerprint(model_to_load),
+        "dataset_yaml": Path(dataset_yaml_path).read_text(),
+        "args": train_args,
+    })
+
+
+def _load_state(results_dir: Path) -> dict:
+    try:
+        with open(Path(results_dir) / RUN_STATE_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_state(results_dir: Path, state: dict):
+    results_dir = Path(results_dir)
+    results_dir.mkdir(parents=True, exist_ok=True)
+    tmp_path = results_dir / f"{RUN_STATE_FILE}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, results_dir / RUN_STATE_FILE)
+
+
+def resumable_checkpoint(results_dir: Path, key: str):
+    """
+    若 results_dir 中有输入一致、尚未训练完成的 last.pt (仍带优化器状态)，返回 (检查点路径, 已完成的epoch数)，否则返回 None。
+    Ultralytics 在训练正常结束时会去掉优化器状态并把 epoch 记为 -1。
+    """
+    import torch
+
+    last_pt = Path(results_dir) / "weights" / "last.pt"
+    if not last_pt.exists() or _load_state(results_dir).get("key") != key:
+        return None
+    try:
+        ckpt = torch.load(last_pt, map_location="cpu", weights_only=False)
+    except Exception as e:
+        print(f"[警告] 无法读取检查点 {last_pt} ({e})，将重新开始训练。")
+        return None
+    if ckpt.get("optimizer") is None or ckpt.get("epoch", -1) < 0:
+        return None
+    return last_pt, ckpt["epoch"] + 1
+
+
+def start(results_dir: Path, key: str, resume_from) -> dict:
+    """
+    记录本次训练的开始。重新开始时清空上一次训练遗留的 results.csv (Ultralytics 会在已存在的文件后追加) 与累计用时；
+    续训时只保留检查点之前的 results.csv 行 (进程可能在写出指标之后、保存检查点之前被终止)，并记录续训的起点epoch。
+    返回续训状态。
+    """
+    results_dir = Path(results_dir)
+    csv_path = results_dir / "results.csv"
+    if resume_from is None:
+        csv_path.unlink(missing_ok=True)
+        state = {"key": key, "elapsed_seconds": 0.0, "resumed_from": []}
+    else:
+        _, completed = resume_from
+        if csv_path.exists():
+            lines = csv_path.read_text().splitlines(keepends=True)
+            csv_path.write_text("".join(lines[:completed + 1]))
+        state = _load_state(results_dir)
+        state["resumed_from"] = state.get("resumed_from", []) + [completed]
+    _save_state(results_dir, state)
+    return state
+
+
+def attach_time_budget(model, results_dir: Path, state: dict, budget_hours) -> dict:
+    """
+    注册墙钟时间预算回调：累计用时 (包括此前被中断的进程) 加上预计的下一个epoch用时将超出预算时，
+    在当前epoch验证并保存后停止训练。无论是否设置预算，都在每个epoch结束时把累计用时写入续训状态。
+    返回的状态字典在训练结束后包含 "budget_stopped"。
+    """
+    budget = budget_hours * 3600 if budget_hours else None
+    status = {"budget_stopped": False, "process_start": time.time(), "epoch_start": None}
+    prior = state.get("elapsed_seconds", 0.0)
+
+    def elapsed() -> float:
+        return prior + time.time() - status["process_start"]
+
+    def on_train_epoch_start(trainer):
+        status["epoch_start"] = time.time()
+
+    def on_train_epoch_end(trainer):
+        if budget is None or trainer.epoch + 1 >= trainer.epochs:
+            return
+        # 预计还需: 本epoch的验证 + 下一个完整epoch，以上一个完整epoch的用时估计
+        next_epoch = trainer.epoch_time or (time.time() - status["epoch_start"])
+        if elapsed() + next_epoch > budget:
+            print(f"\n⏱️  累计用时 {elapsed() / 3600:.2f} 小时，再训练一个epoch将超出 {budget_hours} 小时的时间预算，"
+                  f"本epoch结束后停止。")
+            trainer.stop = True
+            status["budget_stopped"] = True
+
+    def on_fit_epoch_end(trainer):
+        state["elapsed_seconds"] = elapsed()
+        _save_state(results_dir, state)
+
+    model.add_callback("on_train_epoch_start", on_train_epoch_start)
+    model.add_callback("on_train_epoch_end", on_train_epoch_end)
+    model.add_callback("on_fit_epoch_end", on_fit_epoch_end)
+    return status
+
+
+def save_best(results_dir: Path, target_path: Path) -> bool:
+    """
+    把训练产出的 best.pt 复制为正式模型 (先写临时文件再原子替换)。
+    best.pt 保留在训练结果目录中，续训或重复导出时仍然可用。
+    """
+    best_model_path = Path(results_dir) / "weights" / "best.pt"
+    if not best_model_path.exists():
+        return False
+    tmp_path = target_path.with_name(target_path.name + ".tmp")
+    shutil.copy2(best_model_path, tmp_path)
+    os.replace(tmp_path, target_path)
+    return True
+
+
+def write_report(results_dir: Path, report_path: Path, training_mode: str, epochs: int, patience: int,
+                 budget_hours, state: dict, status: dict) -> dict:
+    """
+    写出本次训练的 实际/配置 epoch 数报告 (<模型名>_run_report.json)，并返回报告内容。
+    最佳epoch按 Ultralytics 选择 best.pt 的适应度 (0.1 × mAP50 + 0.9 × mAP50-95) 从 results.csv 中取得。
+    """
+    rows = read_results(Path(results_dir) / "results.csv")
+    completed = len(rows)
+    if status.get("budget_stopped"):
+        reason = "time_budget"
+    elif completed < epochs:
+        reason = "plateau"
+    else:
+        reason = "completed"
+    best = max(rows, key=lambda r: 0.1 * r["metrics/mAP50(B)"] + 0.9 * r["metrics/mAP50-95(B)"]) if rows else {}
+    report = {
+        "mode": training_mode,
+        "epochs_configured": epochs,
+        "epochs_completed": completed,
+        "stop_reason": reason,
+        "best_epoch": int(best["epoch"]) if best else None,
+        "best_map50": best.get("metrics/mAP50(B)"),
+        "best_map50_95": best.get("metrics/mAP50-95(B)"),
+        "patience": patience,
+        "time_budget_hours": budget_hours,
+        "elapsed_seconds": state.get("elapsed_seconds"),
+        "resumed_from": state.get("resumed_from", []),
+    }
+    with open(report_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    reasons = {"completed": "完成全部epoch", "plateau": f"mAP 连续 {patience} 个epoch没有提升",
+               "time_budget": f"达到 {budget_hours} 小时的时间预算"}
+    print(f"  > 训练了 {completed}/{epochs} 个epoch (停止原因: {reasons[reason]})，最佳为第 {report['best_epoch']} 个epoch，"
+          f"累计用时 {(state.get('elapsed_seconds') or 0) / 60:.1f} 分钟"
+          + (f"，续训起点: {report['resumed_from']}" if report["resumed_from"] else ""))
+    print(f"  > 训练报告已保存至: {report_path}")
+    return report
@@ -0,0 +1,170 @@
+# cv_foundry/foundry_engine/tuner.py
+
+import itertools
+import json
+import os
+import platform
+import shutil
+from pathlib import Path
+from typing import Type
+
+from .quantizer import _input_shape, _list_images, benchmark_latency, evaluate_map
+
+# 注意：onnxruntime 只在真正测量时才导入，ultralytics 只在需要导出其他分辨率的候选模型时才导入。
+
+OPTIMIZATION_LEVELS = ["ORT_ENABLE_BASIC", "ORT_ENABLE_EXTENDED", "ORT_ENABLE_ALL"]
+# (执行模式, 算子间线程数)：并行模式只在图中存在可并行的分支时才有收益
+EXECUTION_MODES = [("ORT_SEQUENTIAL", 1), ("ORT_PARALLEL", 2)]
+
+
+def profile_path(onnx_path: Path) -> Path:
+    """调优结果保存在模型旁边: <模型名>_profile.json，部署端的 OnnxDetector 会自动读取。"""
+    onnx_path = Path(onnx_path)
+    return onnx_path.with_name(f"{onnx_path.stem}_profile.json")
+
+
+def host_info() -> dict:
+    """调优结果只对测量它的机器有效，随配置一起记录，部署端据此提示配置是否来自其他机器。"""
+    return {"machine": platform.machine(), "processor": platform.processor(), "cpu_count": os.cpu_count()}
+
+
+def _thread_candidates(configured: list) -> list:
+    if configured:
+        return sorted(set(configured))
+    cpu_count = os.cpu_count() or 1
+    candidates = {1, cpu_count, max(1, cpu_count // 2)}
+    candidates.update(n for n in (2, 4, 8) if n < cpu_count)
+    return sorted(candidates)
+
+
+def _size_tag(size) -> str:
+    return str(size) if isinstance(size, int) else f"{size[0]}x{size[1]}"
+
+
+def _session_options(settings: dict):
+    import onnxruntime as ort
+    options = ort.SessionOptions()
+    options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, settings["graph_optimization_level"])
+    options.execution_mode = getattr(ort.ExecutionMode, settings["execution_mode"])
+    options.intra_op_num_threads = settings["intra_op_num_threads"]
+    options.inter_op_num_threads = settings["inter_op_num_threads"]
+    return options
+
+
+def _export_resolution(pt_path: Path, size, export_cfg: dict) -> Path:
+    """从 .pt 模型导出另一个输入分辨率的 ONNX 候选模型 (<模型名>_<分辨率>.onnx)。"""
+    from ultralytics import YOLO
+
+    # Ultralytics 按 .pt 的文件名命名导出结果，先复制一份带分辨率后缀的 .pt，避免覆盖正式导出的模型
+    candidate_pt = pt_path.with_name(f"{pt_path.stem}_{_size_tag(size)}.pt")
+    shutil.copy2(pt_path, candidate_pt)
+    try:
+        onnx_path = YOLO(candidate_pt).export(
+            format="onnx", imgsz=size, opset=export_cfg.get("OPSET", 12), simplify=export_cfg.get("SIMPLIFY", False),
+        )
+    finally:
+        candidate_pt.unlink(missing_ok=True)
+    return Path(onnx_path)
+
+
+def _remove_model(onnx_path: Path):
+    for path in (onnx_path, onnx_path.with_name(onnx_path.name + ".data")):
+        path.unlink(missing_ok=True)
+
+
+def run(config_module: Type, source_model: str = 'finetune') -> Path:
+    """
+    运行时调优引擎主入口。
+    在本机CPU上对导出的模型测量 图优化级别 × 算子内线程数 × 执行模式 (× 可选的输入分辨率) 的所有组合，
+    把中位延迟最低的一组设置写入模型旁边的 <模型名>_profile.json。
+    降低分辨率的候选必须先通过 test 划分上的精度校验 (mAP50-95 下降不超过 MAX_MAP_DROP)。
+    """
+    print(f"\n--- 启动运行时调优引擎 (Tuning '{source_model}' on {platform.processor() or platform.machine()}) ---")
+
+    tune_cfg = getattr(config_module, "TUNE_CONFIG", {})
+    export_cfg = getattr(config_module, "EXPORT_CONFIG", {})
+    blueprint_name = config_module.BLUEPRINT_DIR.name
+    models_dir = Path(config_module.TRAINER_CONFIG["OUTPUT_MODELS_DIR"])
+    onnx_path = models_dir / f"{blueprint_name}_{source_model}.onnx"
+    pt_path = models_dir / f"{blueprint_name}_{source_model}.pt"
+    real_root = Path(config_module.TRAINER_CONFIG["REAL_DATASET_DIR"])
+
+    if not onnx_path.exists():
+        print(f"[致命错误] 找不到已导出的模型: {onnx_path}")
+        print("请先执行 'export' 步骤。")
+        return None
+
+    _, native_h, native_w = _input_shape(onnx_path)
+    test_images = _list_images(real_root / "test" / "images")
+    benchmark_images = test_images[:20] or _list_images(real_root / "valid" / "images", 20)
+    runs = tune_cfg.get("BENCHMARK_RUNS", 30)
+
+    # --- 1. 候选模型 (导出分辨率 + 可选的其他分辨率) ---
+    models = {(native_h, native_w): onnx_path}
+    extra_sizes = [s for s in tune_cfg.get("INPUT_SIZES", [])
+                   if (tuple(s) if not isinstance(s, int) else (s, s)) != (native_h, native_w)]
+    if extra_sizes and not test_images:
+        print(f"[警告] 找不到 test 划分 ({real_root / 'test' / 'images'})，无法校验降低分辨率后的精度，只调优导出分辨率。")
+        extra_sizes = []
+    if extra_sizes and not pt_path.exists():
+        print(f"[警告] 找不到 {pt_path.name}，无法导出其他分辨率的候选模型，只调优导出分辨率。")
+        extra_sizes = []
+    if extra_sizes:
+        baseline_map = evaluate_map(onnx_path, real_root / "test" / "images")["map50_95"]
+        max_drop = tune_cfg.get("MAX_MAP_DROP", 0.01)
+        for size in extra_sizes:
+            print(f"\n正在导出 {_size_tag(size)} 分辨率的候选模型...")
+            try:
+                candidate = _export_resolution(pt_path, size, export_cfg)
+                _, input_h, input_w = _input_shape(candidate)
+                drop = baseline_map - evaluate_map(candidate, real_root / "test" / "images")["map50_95"]
+            except Exception as e:
+                print(f"[警告] {_size_tag(size)} 分辨率的候选模型生成或评估失败: {e}")
+                continue
+            if drop > max_drop:
+                print(f"  > {input_w}x{input_h}: mAP50-95 下降 {drop:.4f} (> {max_drop})，不参与调优。")
+                _remove_model(candidate)
+                continue
+            print(f"  > {input_w}x{input_h}: mAP50-95 下降 {drop:.4f}，参与调优。")
+            models[(input_h, input_w)] = candidate
+
+    # --- 2. 在每个候选模型上测量全部会话设置组合 ---
+    threads = _thread_candidates(tune_cfg.get("THREADS", []))
+    grid = list(itertools.product(OPTIMIZATION_LEVELS, threads, EXECUTION_MODES))
+    print(f"\n共 {len(models)} 个输入分辨率 × {len(grid)} 组会话设置，每组测量 {runs} 次...")
+    baseline = {"graph_optimization_level": "ORT_ENABLE_ALL", "execution_mode": "ORT_SEQUENTIAL",
+                "intra_op_num_threads": 0, "inter_op_num_threads": 1}
+    baseline["latency"] = benchmark_latency(onnx_path, benchmark_images, runs=runs,
+                                            session_options=_session_options(baseline))
+    candidates = []
+    for (input_h, input_w), model_path in models.items():
+        for level, intra_threads, (mode, inter_threads) in grid:
+            settings = {"graph_optimization_level": level, "execution_mode": mode,
+                        "intra_op_num_threads": intra_threads, "inter_op_num_threads": inter_threads}
+            latency = benchmark_latency(model_path, benchmark_images, runs=runs, session_options=_session_options(settings))
+            candidates.append({"model": model_path.name, "input_size": [input_h, input_w], **settings, "latency": latency})
+            print(f"  > {input_w}x{input_h} {level:<19} {mode:<14} 线程 {intra_threads:>2}: p50 {latency['p50_ms']:7.2f} ms")
+
+    best = min(candidates, key=lambda c: c["latency"]["p50_ms"])
+    # 未被选中的其他分辨率候选模型不再需要
+    for model_path in models.values():
+        if model_path != onnx_path and model_path.name != best["model"]:
+            _remove_model(model_path)
+
+    profile = dict(best)
+    profile.update({
+        "baseline_latency": baseline["latency"],
+        "speedup": baseline["latency"]["p50_ms"] / best["latency"]["p50_ms"],
+        "host": host_info(),
+        "candidates": candidates,
+    })
+    output_path = profile_path(onnx_path)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(profile, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ 调优完成！最佳设置: {best['input_size'][1]}x{best['input_size'][0]}, {best['graph_optimization_level']}, "
+          f"{best['execution_mode']}, 算子内线程 {best['intra_op_num_threads']}")
+    print(f"  > 中位延迟 {best['latency']['p50_ms']:.2f} ms (默认设置 {baseline['latency']['p50_ms']:.2f} ms，"
+          f"加速 {profile['speedup']:.2f}x)")
+    print(f"  > 调优配置已保存至: {output_path.resolve()}")
+    return output_path
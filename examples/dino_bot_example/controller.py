@@ -1,31 +1,52 @@
-# controller.py (黄金标准最终版 V3.1 - 容错边距决策)
+# controller.py (黄金标准最终版 V4 - 碰撞时间决策)
 
-def get_action(boxes, class_map, frame_h):
+# 在智能冷却模式下，这个值可以适当调小一点，反应会更极限 (仅在速度未知时作为后备判据)
+REACTION_DISTANCE_THRESHOLD = 130
+# 预计碰撞时间 (秒) 低于该值时起跳/下蹲。与游戏速度无关：速度越快，触发距离自动越远
+TTC_THRESHOLD = 0.3
+# 低于该接近速度 (像素/秒) 时认为速度估计不可靠，退回距离判据
+MIN_CLOSING_SPEED = 50.0
+# 这个值意味着，只要小鸟的Y中心不比恐龙的Y中心高出15个像素，都判定为低飞/中飞，需要跳跃。
+Y_TOLERANCE = 15 # 可以根据实际情况微调
+
+def get_action(detections, class_map, frame_h, tracker=None, timestamp=None):
     """
     根据障碍物与恐龙的动态相对位置和相对高度来决策。
     增加了Y轴判断的容错边距，以应对临界情况。
+    detections 为检测器输出的普通数组 (xyxy, scores, class_ids)。
+
+    传入 tracker (utils.tracker.ObstacleTracker) 和 timestamp 时，先用本帧检测更新跟踪器，
+    再按预计碰撞时间 (距离 / 接近速度) 决策；detections 为 None 表示本帧未做检测，
+    直接使用跟踪器外推到 timestamp 的位置。
     """
+    if tracker is None:
+        xyxy, _, class_ids = detections
+        objects = [(class_map.get(int(class_id), 'unknown'), coords, None) for coords, class_id in zip(xyxy, class_ids)]
+    else:
+        if detections is not None:
+            tracker.update(detections, timestamp)
+        objects = [(track.label, box, track.velocity[0] if track.has_velocity else None)
+                   for track, box in tracker.predict(timestamp)]
+
     dino_box = None
     obstacles = []
-    
-    for box in boxes:
-        class_id = int(box.cls[0])
-        label = class_map.get(class_id, 'unknown')
+
+    for label, coords, vx in objects:
         if label == 'dino':
-            dino_box = box
+            dino_box = coords
         elif label in ['cactus', 'bird']:
-            obstacles.append(box)
-            
-    if not dino_box or not obstacles:
+            obstacles.append((coords, label, vx))
+
+    if dino_box is None or not obstacles:
         return None
-        
-    dino_x_center = (dino_box.xyxy[0].numpy()[0] + dino_box.xyxy[0].numpy()[2]) / 2
-    
+
+    dino_x_center = (dino_box[0] + dino_box[2]) / 2
+
     closest_obstacle = None
     min_distance = float('inf')
-    
+
     for obstacle in obstacles:
-        obs_coords = obstacle.xyxy[0].numpy()
+        obs_coords = obstacle[0]
         obs_x_center = (obs_coords[0] + obs_coords[2]) / 2
         distance = obs_x_center - dino_x_center
         if 0 < distance < min_distance:
@@ -34,29 +55,30 @@ def get_action(boxes, class_map, frame_h):
 
     if not closest_obstacle:
         return None
-        
-    # 在智能冷却模式下，这个值可以适当调小一点，反应会更极限
-    REACTION_DISTANCE_THRESHOLD = 130 
-    
-    if min_distance < REACTION_DISTANCE_THRESHOLD:
-        closest_obs_id = int(closest_obstacle.cls[0])
-        closest_obs_label = class_map.get(closest_obs_id, 'unknown')
-        
-        print(f">>> 危险! 最近的 {closest_obs_label} 距离仅剩 {min_distance:.2f} 像素! <<<")
+
+    closest_obs_coords, closest_obs_label, closest_obs_vx = closest_obstacle
+    closing_speed = -closest_obs_vx if closest_obs_vx is not None else 0.0
+    if closing_speed >= MIN_CLOSING_SPEED:
+        ttc = min_distance / closing_speed
+        in_danger = ttc < TTC_THRESHOLD
+        reason = f"预计 {ttc * 1000:.0f} ms 后碰撞 (距离 {min_distance:.2f} 像素，速度 {closing_speed:.0f} 像素/秒)"
+    else:
+        in_danger = min_distance < REACTION_DISTANCE_THRESHOLD
+        reason = f"距离仅剩 {min_distance:.2f} 像素"
+
+    if in_danger:
+        print(f">>> 危险! 最近的 {closest_obs_label} {reason}! <<<")
 
         if closest_obs_label == 'cactus':
             return "jump"
-        
+
         elif closest_obs_label == 'bird':
-            dino_y_center = (dino_box.xyxy[0].numpy()[1] + dino_box.xyxy[0].numpy()[3]) / 2
-            closest_obs_y_center = (closest_obstacle.xyxy[0].numpy()[1] + closest_obstacle.xyxy[0].numpy()[3]) / 2
-            
+            dino_y_center = (dino_box[1] + dino_box[3]) / 2
+            closest_obs_y_center = (closest_obs_coords[1] + closest_obs_coords[3]) / 2
+
             # [核心逻辑修正 V3.1]
             # 引入一个Y轴的容错边距。因为恐龙检测框较高，其中心点也高。
             # 即使小鸟中心点稍微高于恐龙中心点，也可能构成威胁。
-            # 这个值意味着，只要小鸟的Y中心不比恐龙的Y中心高出15个像素，都判定为低飞/中飞，需要跳跃。
-            Y_TOLERANCE = 15 # 可以根据实际情况微调
-            
             print(f"   > 决策依据: 鸟Y中心({closest_obs_y_center:.2f}) vs 龙Y危险区上限({dino_y_center - Y_TOLERANCE:.2f})")
 
             # 新逻辑：如果小鸟的Y中心 > (恐龙的Y中心 - 容错值)，就跳
@@ -64,5 +86,5 @@ def get_action(boxes, class_map, frame_h):
                 return "jump" # 应对低飞和中飞小鸟
             else:
                 return "duck" # 仅应对真正的高飞小鸟
-                
+
     return None
\ No newline at end of file
@@ -1,82 +1,179 @@
-# play_game.py (黄金标准 V7.1 - 最终修正版)
+# play_game.py (黄金标准 V10 - 按需推理版)
 
+import argparse
 import cv2
 import numpy as np
+import threading
 import time
 from pathlib import Path
 import sys
-from ultralytics import YOLO
 
 example_dir = Path(__file__).resolve().parent
 sys.path.append(str(example_dir))
 
+from utils.frame_buffer import LatestFrameBuffer
 from utils.keyboard_controller import KeyboardController
+from utils.frame_gate import FrameGate
+from utils.onnx_detector import OnnxDetector, draw_detections
+from utils.perception import Perception
 from utils.screen_capture import ScreenCapturer
-from controller import get_action
 
-def run_bot(model_path: Path):
-    """最终版机器人主函数 - 采用智能冷却逻辑"""
-    print("--- 启动Dino游戏机器人 (V7.2 - 智能冷却版) ---")
-    
+ACTION_COOLDOWN = 0.4 # 设置一个0.4秒的冷却时间，防止同一动作连发
+DEBUG_FPS = 10        # 调试窗口的最高刷新率，渲染在主线程中节流执行，不占用感知-动作的关键路径
+# 采集线程的最高截图频率：高于游戏本身的刷新率即可，不限速的截图循环会占满一个CPU核心，与推理线程争抢算力
+CAPTURE_FPS = 120
+WINDOW_NAME = "CV_Foundry Dino_Bot - DEBUG VIEW"
+CONF_THRESHOLD = 0.45
+# onnxruntime 的算子内线程数 (0 表示自动)。多个机器人共用一台机器时可以调小
+INTRA_OP_THREADS = 0
+# 检测器的最高运行频率 (0 表示每帧都检测)。两次检测之间由跟踪器外推障碍物位置并继续决策
+DETECT_FPS = 0
+# 变化门控：画面与上次检测时相比几乎没有变化时跳过检测、复用上次结果
+FRAME_GATE = True
+# 前方区域裁剪宽度 (像素，0 表示不裁剪)：只在恐龙前方这一段区域上运行检测器
+CROP_WIDTH = 0
+
+
+def _capture_loop(capturer, frames, stop_event, stats, capture_fps):
+    """采集线程：按 capture_fps 节流截图并发布到最新帧缓冲区，推理来不及处理的旧帧会被直接覆盖。"""
+    capturer.bind_to_current_thread()
+    interval = 1.0 / capture_fps if capture_fps > 0 else 0.0
+    next_capture = time.perf_counter()
+    while not stop_event.is_set():
+        # 按固定节拍截图；落后于节拍时 (截图本身较慢) 不追赶，直接从当前时刻重新计时
+        next_capture = max(next_capture + interval, time.perf_counter())
+        frame = capturer.capture_bgra()  # BGRA零拷贝视图，颜色转换由检测器的预处理一并完成
+        if frame is not None:
+            frames.publish((time.perf_counter(), frame))
+            stats["captured"] += 1
+        # 截图失败时同样等待到下一拍，避免空转；用 stop_event 等待以便退出时立即返回
+        stop_event.wait(max(next_capture - time.perf_counter(), 0.001))
+
+
+def _inference_loop(perception, keyboard, frames, results, stop_event, stats):
+    """推理线程：只处理最新一帧；动作直接提交给非阻塞的键盘执行器，检测结果交给调试渲染。"""
+    seq = 0
+    tracker = perception.tracker
+    while not stop_event.is_set():
+        seq, item = frames.get(seq, timeout=0.1)
+        if item is None: continue
+        captured_at, frame = item
+        action, detections = perception.step(frame, captured_at)
+        if detections is not None:
+            results.publish((frame, detections))
+
+        current_time = time.perf_counter()
+        if not perception.should_fire(action, current_time):
+            continue
+        latency_ms = (current_time - captured_at) * 1000
+        if action == "jump":
+            keyboard.jump()
+            print(f">>> JUMP! (跟踪 {len(tracker.tracks)} 个物体，截图到动作 {latency_ms:.1f} ms)")
+        elif action == "duck":
+            keyboard.duck()
+            print(f">>> DUCK! (跟踪 {len(tracker.tracks)} 个物体，截图到动作 {latency_ms:.1f} ms)")
+        stats["latency_ms"].append(latency_ms)
+
+
+def run_bot(model_path: Path, headless: bool = False, debug_fps: float = DEBUG_FPS, intra_op_threads: int = INTRA_OP_THREADS,
+            detect_fps: float = DETECT_FPS, frame_gate: bool = FRAME_GATE, crop_width: int = CROP_WIDTH,
+            use_profile: bool = True, capture_fps: float = CAPTURE_FPS):
+    """机器人主函数：采集、推理分别运行在独立线程上，通过“最新帧优先”缓冲区衔接；按键由执行器线程异步完成。"""
+    print("--- 启动Dino游戏机器人 (V10 - 按需推理版) ---")
+
     try:
-        model = YOLO(model_path, task='detect')
-        print(f"✅ 模型通过Ultralytics加载成功: {model_path.name}")
+        detector = OnnxDetector(model_path, conf=CONF_THRESHOLD, intra_op_threads=intra_op_threads, use_profile=use_profile)
+        print(f"✅ 模型通过onnxruntime加载成功: {detector.model_path.name} (输入 {detector.input_w}x{detector.input_h})")
     except Exception as e:
         print(f"[致命错误] 模型加载失败: {e}")
         return
-        
-    class_map = {0: 'bird', 1: 'cactus', 2: 'dino'} 
-    print(f"   > 识别类别: {class_map}")
+
+    print(f"   > 识别类别: {detector.class_map}")
+    if detector.profile:
+        print(f"   > 已应用本机调优配置: {detector.settings['graph_optimization_level']}, {detector.settings['execution_mode']}, "
+              f"算子内线程 {detector.settings['intra_op_num_threads']} (调优时中位延迟 {detector.profile['latency']['p50_ms']:.1f} ms)")
 
     capturer = ScreenCapturer()
     keyboard = KeyboardController()
     capturer.select_roi()
-    if capturer.roi is None: return 
+    if capturer.roi is None: return
+    # 预热一次推理，避免首帧的模型初始化耗时落在游戏过程中
+    detector.detect(np.zeros((capturer.roi["height"], capturer.roi["width"], 4), dtype=np.uint8))
     print("\n3秒后机器人将开始运行...")
     time.sleep(3)
-    
-    # [新] 初始化动作冷却相关变量
-    last_action_time = 0  # 记录上次执行动作的时间戳
-    ACTION_COOLDOWN = 0.4 # 设置一个0.4秒的冷却时间，防止按键连发
-
-    print("\n🤖 AI已接管！按 'q' 键退出机器人。")
-    while True:
-        frame = capturer.capture()
-        if frame is None: continue
-        
-        results = model(frame, verbose=False, conf=0.45) 
-        
-        result = results[0]
-        boxes = result.boxes
-        frame_h, frame_w, _ = frame.shape  
-
-        action = get_action(boxes, class_map, frame_h)
-        
-        # [核心修改] 引入智能冷却判断
-        current_time = time.time()
-        if action and (current_time - last_action_time > ACTION_COOLDOWN):
-            if action == "jump":
-                keyboard.jump()
-                print(f">>> JUMP! (检测到 {len(boxes)} 个物体)")
-            elif action == "duck":
-                keyboard.duck()  
-                print(f">>> DUCK! (检测到 {len(boxes)} 个物体)")
-            
-            last_action_time = current_time # 执行动作后，更新时间戳
-        
-        debug_frame = result.plot(conf=True)
-        
-        cv2.imshow("CV_Foundry Dino_Bot - DEBUG VIEW", debug_frame)
-        if cv2.waitKey(1) & 0xFF == ord('q'):
-            break
-            
-    cv2.destroyAllWindows()
+
+    frames, results = LatestFrameBuffer(), LatestFrameBuffer()
+    stop_event = threading.Event()
+    perception = Perception(detector, detect_fps=detect_fps, gate=FrameGate() if frame_gate else None,
+                            crop_width=crop_width, action_cooldown=ACTION_COOLDOWN)
+    stats = {"captured": 0, "latency_ms": []}
+    threads = [
+        threading.Thread(target=_capture_loop, args=(capturer, frames, stop_event, stats, capture_fps), daemon=True),
+        threading.Thread(target=_inference_loop, args=(perception, keyboard, frames, results, stop_event, stats), daemon=True),
+    ]
+    for thread in threads:
+        thread.start()
+    start = time.perf_counter()
+
+    if headless:
+        print("\n🤖 AI已接管 (无界面模式)！按 Ctrl+C 退出机器人。")
+    else:
+        print("\n🤖 AI已接管！按 'q' 键退出机器人。")
+    try:
+        rendered_seq = 0
+        while all(thread.is_alive() for thread in threads):
+            if headless:
+                time.sleep(0.2)
+                continue
+            # 调试渲染只读取最新的检测结果，并按 debug_fps 节流
+            seq, result = results.peek()
+            if result is not None and seq != rendered_seq:
+                frame, detections = result
+                cv2.imshow(WINDOW_NAME, draw_detections(frame, detections, detector.class_map))
+                rendered_seq = seq
+            if cv2.waitKey(max(1, int(1000 / debug_fps))) & 0xFF == ord('q'):
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        stop_event.set()
+        for buffer in (frames, results):
+            buffer.close()
+        for thread in threads:
+            thread.join(timeout=1.0)
+        keyboard.close()
+        if not headless:
+            cv2.destroyAllWindows()
+
+    elapsed = max(time.perf_counter() - start, 1e-6)
+    print("\n机器人已停止。")
+    print(f"  > 采集 {stats['captured']} 帧 ({stats['captured'] / elapsed:.1f} FPS)，"
+          f"推理 {perception.stats['inferred']} 帧 ({perception.stats['inferred'] / elapsed:.1f} FPS)，"
+          f"决策 {perception.stats['frames']} 次，未及处理而丢弃 {frames.dropped} 帧。")
+    print(f"  > 变化门控跳过 {perception.stats['gated']} 次检测，前方区域裁剪检测 {perception.stats['cropped']} 次。")
+    if keyboard.history:
+        issue_delays = [(issued_at - requested_at) * 1000 for _, requested_at, issued_at in keyboard.history]
+        print(f"  > 执行动作 {len(keyboard.history)} 次，截图到决策的中位延迟 {np.median(stats['latency_ms']):.1f} ms，"
+              f"决策到按键的中位延迟 {np.median(issue_delays):.2f} ms。")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="CV_Foundry Dino游戏机器人")
+    parser.add_argument('--headless', action='store_true', help="不显示调试窗口 (按 Ctrl+C 退出)，省下渲染开销。")
+    parser.add_argument('--capture-fps', type=float, default=CAPTURE_FPS, help=f"采集线程的最高截图频率 (默认 {CAPTURE_FPS}，0 表示不限速)。")
+    parser.add_argument('--debug-fps', type=float, default=DEBUG_FPS, help=f"调试窗口的最高刷新率 (默认 {DEBUG_FPS})。")
+    parser.add_argument('--threads', type=int, default=INTRA_OP_THREADS, help="onnxruntime 算子内线程数 (默认 0，即自动)。")
+    parser.add_argument('--detect-fps', type=float, default=DETECT_FPS, help="检测器的最高运行频率，两次检测之间由跟踪器外推 (默认 0，即每帧检测)。")
+    parser.add_argument('--no-gate', action='store_true', help="关闭变化门控，每次都运行检测器。")
+    parser.add_argument('--crop-width', type=int, default=CROP_WIDTH, help="只在恐龙前方这一宽度 (像素) 的区域上检测 (默认 0，即全画面)。")
+    parser.add_argument('--no-profile', action='store_true', help="忽略模型旁边的调优配置 (*_profile.json)，使用默认会话设置。")
+    args = parser.parse_args()
+
     project_root = Path(__file__).resolve().parent
     onnx_model_path = project_root / "models" / "dino_game_finetune.onnx"
-    
+
     if not onnx_model_path.exists():
         print(f"[致命错误] 找不到ONNX模型文件: {onnx_model_path}")
     else:
-        run_bot(onnx_model_path)
\ No newline at end of file
+        run_bot(onnx_model_path, headless=args.headless, debug_fps=args.debug_fps, intra_op_threads=args.threads,
+                detect_fps=args.detect_fps, frame_gate=not args.no_gate, crop_width=args.crop_width,
+                use_profile=not args.no_profile, capture_fps=args.capture_fps)
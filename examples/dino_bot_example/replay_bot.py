@@ -0,0 +1,190 @@
+# replay_bot.py (离线回放与延迟基准)
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import time
+from pathlib import Path
+import sys
+
+import cv2
+import numpy as np
+
+example_dir = Path(__file__).resolve().parent
+sys.path.append(str(example_dir))
+
+from utils.frame_gate import FrameGate
+from utils.keyboard_controller import KeyboardController
+from utils.onnx_detector import OnnxDetector
+from utils.perception import Perception
+
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+FALLBACK_FPS = 30  # 文件名不是 capture_tool.py 的纳秒时间戳时，按该帧率推算时间
+PERCENTILES = (50, 95, 99)
+
+
+class StubKeyboard:
+    """替身键盘：只记录按键事件，不向系统发送任何输入。"""
+
+    def __init__(self):
+        self.events = []
+
+    def press(self, key):
+        self.events.append(("press", str(key), time.perf_counter()))
+
+    def release(self, key):
+        self.events.append(("release", str(key), time.perf_counter()))
+
+
+class TimedDetector:
+    """包装检测器，记录每次 detect() 的耗时。"""
+
+    def __init__(self, detector):
+        self.detector = detector
+        self.class_map = detector.class_map
+        self.samples = []
+
+    def detect(self, frame):
+        start = time.perf_counter()
+        detections = self.detector.detect(frame)
+        self.samples.append(time.perf_counter() - start)
+        return detections
+
+
+def _list_frames(frames_dir: Path) -> list:
+    """按 capture_tool.py 的命名 (纳秒时间戳.png) 排序，返回 [(路径, 秒级时间戳)]。"""
+    paths = sorted((p for p in frames_dir.iterdir() if p.name.lower().endswith(IMAGE_EXTENSIONS)),
+                   key=lambda p: (not p.stem.isdigit(), int(p.stem) if p.stem.isdigit() else 0, p.name))
+    if paths and all(p.stem.isdigit() for p in paths):
+        t0 = int(paths[0].stem)
+        return [(p, (int(p.stem) - t0) / 1e9) for p in paths]
+    return [(p, i / FALLBACK_FPS) for i, p in enumerate(paths)]
+
+
+def _summarize(samples: list) -> dict:
+    if not samples:
+        return {"count": 0}
+    ms = np.asarray(samples) * 1000
+    summary = {"count": len(ms), "mean_ms": round(float(ms.mean()), 3), "max_ms": round(float(ms.max()), 3)}
+    for q, value in zip(PERCENTILES, np.percentile(ms, PERCENTILES)):
+        summary[f"p{q}_ms"] = round(float(value), 3)
+    return summary
+
+
+def run_replay(frames_dir: Path, model_path: Path, output_path: Path, detect_fps: float = 0, frame_gate: bool = True,
+               crop_width: int = 0, intra_op_threads: int = 0, realtime: bool = False, limit: int = 0,
+               verbose: bool = False, use_profile: bool = True):
+    """把录制的帧依次送入 检测器 → 跟踪/决策 → 替身键盘，统计各阶段延迟并写出JSON报告。"""
+    print("--- Dino机器人离线回放与延迟基准 ---")
+    frames = _list_frames(frames_dir) if frames_dir.is_dir() else []
+    if limit:
+        frames = frames[:limit]
+    if not frames:
+        print(f"[致命错误] 目录 '{frames_dir}' 不存在或其中没有图片。")
+        return None
+
+    try:
+        detector = TimedDetector(OnnxDetector(model_path, intra_op_threads=intra_op_threads, use_profile=use_profile))
+    except Exception as e:
+        print(f"[致命错误] 模型加载失败: {e}")
+        return None
+    stub = StubKeyboard()
+    keyboard = KeyboardController(keyboard=stub)
+    perception = Perception(detector, detect_fps=detect_fps, gate=FrameGate() if frame_gate else None, crop_width=crop_width)
+    print(f"共 {len(frames)} 帧，模型: {detector.detector.model_path.name}，回放方式: {'按录制节奏' if realtime else '尽可能快'}")
+
+    # 预热一次，避免把模型初始化计入延迟
+    warmup = cv2.imread(str(frames[0][0]))
+    if warmup is not None:
+        detector.detector.detect(warmup)
+
+    stages = {"load": [], "perceive": [], "actuate": [], "frame": []}
+    decisions = []
+    skipped = 0
+    start = time.perf_counter()
+    for index, (path, timestamp) in enumerate(frames):
+        if realtime:
+            delay = start + timestamp - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        t0 = time.perf_counter()
+        frame = cv2.imread(str(path))
+        t1 = time.perf_counter()
+        if frame is None:
+            skipped += 1
+            continue
+        # controller 的“危险”提示在回放中默认静音，避免刷屏
+        with contextlib.redirect_stdout(sys.stdout if verbose else io.StringIO()):
+            action, _ = perception.step(frame, timestamp)
+        t2 = time.perf_counter()
+        # 冷却按录制时间计算，决策结果只取决于帧内容和配置，便于回归比较
+        if perception.should_fire(action, timestamp):
+            getattr(keyboard, action)()
+            decisions.append({"frame": index, "file": path.name, "timestamp": round(timestamp, 6), "action": action})
+        t3 = time.perf_counter()
+        stages["load"].append(t1 - t0)
+        stages["perceive"].append(t2 - t1)
+        stages["actuate"].append(t3 - t2)
+        stages["frame"].append(t3 - t1)
+    elapsed = time.perf_counter() - start
+    keyboard.close()
+
+    processed = len(stages["frame"])
+    report = {
+        "frames_dir": str(frames_dir),
+        "model": detector.detector.model_path.name,
+        "platform": platform.platform(),
+        "config": {"detect_fps": detect_fps, "frame_gate": frame_gate, "crop_width": crop_width,
+                   "intra_op_threads": intra_op_threads, "realtime": realtime},
+        "session": detector.detector.settings,
+        "frames": processed,
+        "skipped_frames": skipped,
+        "wall_time_s": round(elapsed, 3),
+        "fps": round(processed / elapsed, 2) if elapsed > 0 else None,
+        # 不含磁盘读取的纯感知-决策吞吐量，更接近实时运行时的上限
+        "pipeline_fps": round(processed / sum(stages["frame"]), 2) if processed else None,
+        "stages": {name: _summarize(samples) for name, samples in stages.items()},
+        "perception": dict(perception.stats),
+        "decisions": decisions,
+        "key_events": len(stub.events),
+    }
+    report["stages"]["detect"] = _summarize(detector.samples)
+
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(output_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+
+    print(f"\n✅ 回放完成: {processed} 帧，用时 {elapsed:.2f} 秒 ({report['fps']} FPS，不含读盘 {report['pipeline_fps']} FPS)")
+    for name, summary in report["stages"].items():
+        if summary["count"]:
+            print(f"  > {name:<9} p50 {summary['p50_ms']:8.3f} ms | p95 {summary['p95_ms']:8.3f} ms | p99 {summary['p99_ms']:8.3f} ms ({summary['count']} 次)")
+    print(f"  > 检测 {perception.stats['inferred']} 次，门控跳过 {perception.stats['gated']} 次，决策出动作 {len(decisions)} 次")
+    print(f"  > 报告已保存至: {output_path.resolve()}")
+    return report
+
+
+if __name__ == "__main__":
+    project_root = Path(__file__).resolve().parent
+    parser = argparse.ArgumentParser(description="用录制的截图离线回放Dino机器人，测量各阶段延迟 (无需屏幕和键盘)。")
+    parser.add_argument('frames_dir', type=Path, help="录制帧所在目录 (capture_tool.py 的输出格式)。")
+    parser.add_argument('--model', type=Path, default=project_root / "models" / "dino_game_finetune.onnx", help="ONNX模型路径。")
+    parser.add_argument('-o', '--output', type=Path, default=Path("replay_report.json"), help="JSON报告的输出路径。")
+    parser.add_argument('--detect-fps', type=float, default=0, help="检测器的最高运行频率 (默认 0，即每帧检测)。")
+    parser.add_argument('--no-gate', action='store_true', help="关闭变化门控。")
+    parser.add_argument('--crop-width', type=int, default=0, help="前方区域裁剪宽度 (默认 0，即全画面)。")
+    parser.add_argument('--threads', type=int, default=0, help="onnxruntime 算子内线程数 (默认 0，即自动)。")
+    parser.add_argument('--no-profile', action='store_true', help="忽略模型旁边的调优配置，使用默认会话设置 (便于对比)。")
+    parser.add_argument('--realtime', action='store_true', help="按录制时的时间间隔回放，而不是尽可能快。")
+    parser.add_argument('--limit', type=int, default=0, help="最多回放的帧数 (默认 0，即全部)。")
+    parser.add_argument('-v', '--verbose', action='store_true', help="显示决策过程中的详细输出。")
+    args = parser.parse_args()
+
+    if not args.model.exists():
+        print(f"[致命错误] 找不到ONNX模型文件: {args.model}")
+        sys.exit(1)
+    if run_replay(args.frames_dir, args.model, args.output, detect_fps=args.detect_fps, frame_gate=not args.no_gate,
+                  crop_width=args.crop_width, intra_op_threads=args.threads, realtime=args.realtime,
+                  limit=args.limit, verbose=args.verbose, use_profile=not args.no_profile) is None:
+        sys.exit(1)
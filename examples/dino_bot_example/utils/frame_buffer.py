@@ -0,0 +1,54 @@
+# utils/frame_buffer.py
+
+import threading
+
+class LatestFrameBuffer:
+    """
+    线程间交换数据的“最新帧优先”缓冲区。
+    生产者总是覆盖旧数据而不会阻塞；消费者只拿到最新的一份，来不及处理的旧帧直接丢弃 (并计数)。
+    这样下游永远处理最新画面，延迟不会因为排队而累积。
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._item = None
+        self._seq = 0           # 已发布的数据编号
+        self._taken_seq = 0     # 最近一次被 get() 取走的数据编号
+        self._closed = False
+        self.dropped = 0        # 被覆盖、从未被 get() 取走的数据数量
+
+    def publish(self, item):
+        with self._cond:
+            if self._seq > self._taken_seq:
+                self.dropped += 1
+            self._item = item
+            self._seq += 1
+            self._cond.notify_all()
+
+    def get(self, last_seq: int = 0, timeout: float = None):
+        """
+        等待比 last_seq 更新的数据，返回 (seq, item)。
+        超时或缓冲区已关闭时返回 (last_seq, None)。
+        """
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._seq > last_seq or self._closed, timeout=timeout):
+                return last_seq, None
+            if self._seq <= last_seq:
+                return last_seq, None
+            self._taken_seq = self._seq
+            return self._seq, self._item
+
+    def peek(self):
+        """不等待、不计入消费，直接返回当前的 (seq, item)，用于调试渲染等旁路读取。"""
+        with self._cond:
+            return self._seq, self._item
+
+    def close(self):
+        """唤醒所有等待的消费者，之后 get() 不再阻塞。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
@@ -0,0 +1,57 @@
+# utils/frame_gate.py
+
+import cv2
+import numpy as np
+
+class FrameGate:
+    """
+    检测器之前的廉价变化门控 (沿用 tools/filter_tool.py 的SAD思路)。
+    帧先转灰度并用 INTER_AREA 降采样，再与上一次真正送去检测的帧逐格做绝对差。
+    注意这里不用整帧的平均SAD：障碍物只占画面很小一部分，平均值会把它们的移动淹没，
+    因此改为统计“差值超过 cell_threshold 的格子数”，达到 min_changed_cells 才视为画面有变化。
+    """
+
+    def __init__(self, downsample: int = 8, cell_threshold: float = 8.0, min_changed_cells: int = 2):
+        self.downsample = downsample
+        self.cell_threshold = cell_threshold
+        self.min_changed_cells = min_changed_cells
+        self._reference = None
+        self._small = None
+        self._gray = None
+
+    def _shrink(self, frame: np.ndarray) -> np.ndarray:
+        h, w = frame.shape[:2]
+        size = (max(1, w // self.downsample), max(1, h // self.downsample))
+        if self._small is None or self._small.shape[::-1] != size:
+            self._small = np.empty(size[::-1], dtype=np.uint8)
+            self._gray = np.empty((h, w), dtype=np.uint8)
+        code = cv2.COLOR_BGRA2GRAY if frame.shape[2] == 4 else cv2.COLOR_BGR2GRAY
+        cv2.cvtColor(frame, code, dst=self._gray)
+        cv2.resize(self._gray, size, dst=self._small, interpolation=cv2.INTER_AREA)
+        return self._small
+
+    def changed(self, frame: np.ndarray) -> bool:
+        """与参考帧相比画面是否有变化；有变化时当前帧成为新的参考帧。"""
+        small = self._shrink(frame)
+        if self._reference is None or self._reference.shape != small.shape:
+            self._reference = small.copy()
+            return True
+        changed_cells = cv2.countNonZero(cv2.threshold(cv2.absdiff(small, self._reference), self.cell_threshold, 255, cv2.THRESH_BINARY)[1])
+        if changed_cells < self.min_changed_cells:
+            return False
+        self._reference[:] = small
+        return True
+
+    def reset(self):
+        self._reference = None
+
+
+def crop_ahead(frame: np.ndarray, dino_box, width: int, margin: int = 20):
+    """
+    截取恐龙前方固定宽度的区域 (包含恐龙本身，保留全部高度以覆盖高飞的小鸟)，返回 (区域视图, x偏移)。
+    宽度固定，检测器的 letterbox 布局可以一直复用。
+    """
+    frame_w = frame.shape[1]
+    width = min(width, frame_w)
+    x0 = int(np.clip(dino_box[0] - margin, 0, frame_w - width))
+    return frame[:, x0:x0 + width], x0
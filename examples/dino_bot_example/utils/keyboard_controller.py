@@ -1,23 +1,101 @@
-# utils/keyboard_controller.py (功能升级版)
+# utils/keyboard_controller.py (非阻塞执行器版)
 
+import threading
 import time
-from pynput.keyboard import Controller, Key
+from collections import deque
+try:
+    from pynput.keyboard import Controller, Key
+except ImportError:  # 没有图形界面的环境 (如无桌面的Linux) 中 pynput 无法加载，此时只能注入替身键盘 (见 replay_bot.py)
+    Controller, Key = None, None
 
 class KeyboardController:
-    """一个用于模拟键盘按键的简单工具类。"""
-    
-    def __init__(self):
-        self.keyboard = Controller()
+    """
+    一个非阻塞的键盘执行器：jump()/duck() 只把命令放进队列后立即返回，
+    按键和定时松开都在独立的执行线程中完成，感知循环不会因为模拟按键而停顿。
+    - 替换: 新动作会先松开其他仍按住的键 (例如下蹲中途改为跳跃)。
+    - 去重: 同一个键仍按住时再次触发，只会延长松开时间，不会重复按下。
+    - history 记录每个动作的请求时刻和实际按下时刻 (time.perf_counter)。
+    """
+
+    def __init__(self, keyboard=None, history_size: int = 1000):
+        if keyboard is None and Controller is None:
+            raise ImportError("pynput 在当前环境中不可用，请传入一个提供 press/release 方法的替身键盘。")
+        self.keyboard = keyboard if keyboard is not None else Controller()  # 任何提供 press/release 的对象均可
+        self.history = deque(maxlen=history_size)  # (动作, 请求时刻, 按下时刻)
+        self._cond = threading.Condition()
+        self._commands = deque()
+        self._held = {}  # 键 -> 计划松开的时刻 (只由执行线程修改)
+        self._cancel_requested = False
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
 
     def jump(self, duration=0.1):
-        """模拟一次跳跃动作（按下并快速松开空格键）。"""
-        self.keyboard.press(Key.space)
-        time.sleep(duration)
-        self.keyboard.release(Key.space)
+        """模拟一次跳跃动作（按下空格键，duration 秒后由执行线程松开）。"""
+        self._submit("jump", Key.space if Key else "space", duration)
 
     # [新] 添加 duck 方法
     def duck(self, duration=0.3):
-        """模拟一次下蹲动作（按下并松开下箭头键）。"""
-        self.keyboard.press(Key.down)
-        time.sleep(duration)
-        self.keyboard.release(Key.down)
\ No newline at end of file
+        """模拟一次下蹲动作（按下下箭头键，duration 秒后由执行线程松开）。"""
+        self._submit("duck", Key.down if Key else "down", duration)
+
+    def cancel(self):
+        """立即松开所有仍按住的键，并丢弃尚未执行的命令。"""
+        with self._cond:
+            self._commands.clear()
+            self._cancel_requested = True
+            self._cond.notify()
+
+    def close(self):
+        """松开所有按键并停止执行线程。"""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join(timeout=1.0)
+
+    @property
+    def busy(self) -> bool:
+        """是否有键仍被按住或有命令待执行。"""
+        return bool(self._held or self._commands)
+
+    def _submit(self, action, key, duration):
+        with self._cond:
+            self._commands.append((action, key, duration, time.perf_counter()))
+            self._cond.notify()
+
+    def _release_all(self, except_key=None):
+        for key in [k for k in self._held if k != except_key]:
+            self.keyboard.release(key)
+            del self._held[key]
+
+    def _next_release_delay(self):
+        if not self._held:
+            return None
+        return max(0.0, min(self._held.values()) - time.perf_counter())
+
+    def _run(self):
+        while True:
+            with self._cond:
+                if not (self._commands or self._cancel_requested or self._closed):
+                    self._cond.wait(timeout=self._next_release_delay())
+                commands, self._commands = list(self._commands), deque()
+                cancel, self._cancel_requested = self._cancel_requested, False
+                closed = self._closed
+
+            # 按键模拟只在本线程、且在锁外进行，提交命令的线程永远不会等待
+            if cancel or closed:
+                self._release_all()
+            else:
+                now = time.perf_counter()
+                for key in [k for k, due in self._held.items() if due <= now]:
+                    self.keyboard.release(key)
+                    del self._held[key]
+            if closed:
+                return
+            for action, key, duration, requested_at in commands:
+                self._release_all(except_key=key)
+                if key not in self._held:
+                    self.keyboard.press(key)
+                issued_at = time.perf_counter()
+                self._held[key] = issued_at + duration
+                self.history.append((action, requested_at, issued_at))
@@ -0,0 +1,163 @@
+# utils/onnx_detector.py
+
+import ast
+import json
+import os
+import platform
+from pathlib import Path
+
+import cv2
+import numpy as np
+import onnxruntime as ort
+
+DEFAULT_CLASS_MAP = {0: 'bird', 1: 'cactus', 2: 'dino'}
+LETTERBOX_COLOR = 114  # 与 Ultralytics 训练时的填充灰度一致
+# 没有调优配置时使用的 onnxruntime 会话设置
+DEFAULT_SESSION_SETTINGS = {
+    "graph_optimization_level": "ORT_ENABLE_ALL",
+    "execution_mode": "ORT_SEQUENTIAL",
+    "intra_op_num_threads": 0,
+    "inter_op_num_threads": 1,
+}
+
+
+def load_profile(model_path):
+    """读取模型旁边的调优配置 (<模型名>_profile.json)，不存在或无法解析时返回 None。"""
+    model_path = Path(model_path)
+    path = model_path.with_name(f"{model_path.stem}_profile.json")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            profile = json.load(f)
+    except (OSError, ValueError):
+        return None
+    # 调优结果只对测量它的机器有效
+    host = profile.get("host", {})
+    if host and (host.get("cpu_count") != os.cpu_count() or host.get("machine") != platform.machine()):
+        print(f"[警告] {path.name} 是在另一台机器 ({host.get('processor') or host.get('machine')}, "
+              f"{host.get('cpu_count')} 核) 上调优的，建议在本机重新执行 tune 步骤。")
+    return profile
+
+
+class OnnxDetector:
+    """
+    直接用 onnxruntime 运行导出的 YOLOv8 检测模型，绕过 Ultralytics 的通用前后处理和 Results 对象 (部署端无需 torch)。
+    detect() 接受 BGR 或 BGRA (如 ScreenCapturer.capture_bgra 的零拷贝视图) 图像，
+    返回三个普通数组: xyxy (N,4 原图像素坐标), scores (N,), class_ids (N,)。
+    输入尺寸从模型读取，正方形和矩形 (如按游戏画面宽高比导出的 640×160) 模型都可直接使用。
+    模型旁边存在 `python main.py --step tune` 生成的 <模型名>_profile.json 时，自动采用其中的会话设置 (和输入分辨率)；
+    显式传入的 intra_op_threads (> 0) 优先于调优结果。
+    """
+
+    def __init__(self, model_path, conf: float = 0.45, iou: float = 0.7, intra_op_threads: int = 0, max_det: int = 100,
+                 use_profile: bool = True):
+        self.profile = load_profile(model_path) if use_profile else None
+        settings = dict(DEFAULT_SESSION_SETTINGS)
+        if self.profile:
+            settings.update({key: self.profile[key] for key in DEFAULT_SESSION_SETTINGS if key in self.profile})
+            # 调优时选中了另一个输入分辨率的模型 (与原模型放在同一目录)
+            tuned_model = Path(model_path).with_name(self.profile.get("model", Path(model_path).name))
+            if tuned_model.exists():
+                model_path = tuned_model
+            else:
+                print(f"[警告] 调优配置指定的模型 {tuned_model.name} 不存在，继续使用 {Path(model_path).name}。")
+        if intra_op_threads:
+            settings["intra_op_num_threads"] = intra_op_threads
+        self.settings = settings
+        self.model_path = Path(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = getattr(ort.GraphOptimizationLevel, settings["graph_optimization_level"])
+        options.execution_mode = getattr(ort.ExecutionMode, settings["execution_mode"])
+        options.intra_op_num_threads = settings["intra_op_num_threads"]  # 0 表示由 onnxruntime 自行决定
+        options.inter_op_num_threads = settings["inter_op_num_threads"]
+        self.session = ort.InferenceSession(str(model_path), sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.input_h, self.input_w = model_input.shape[2], model_input.shape[3]
+        self.conf, self.iou, self.max_det = conf, iou, max_det
+        self.class_map = self._read_class_map()
+
+        # 预分配的输入张量和缩放缓冲区，每帧复用，避免重复分配
+        self._input = np.full((1, 3, self.input_h, self.input_w), LETTERBOX_COLOR / 255.0, dtype=np.float32)
+        self._resized = None
+        self._layout = None  # (原图尺寸, 缩放比例, 左/上填充, 缩放后尺寸)
+
+    def _read_class_map(self) -> dict:
+        """Ultralytics 导出时会把类别名写入模型元数据；读取失败时退回默认类别表。"""
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        try:
+            return {int(k): v for k, v in ast.literal_eval(names).items()}
+        except (ValueError, SyntaxError, AttributeError):
+            return dict(DEFAULT_CLASS_MAP)
+
+    def _letterbox(self, frame: np.ndarray):
+        """等比缩放到模型输入尺寸并居中填充，直接写入预分配的输入张量 (填充区域在布局变化时才重写)。"""
+        h, w, channels = frame.shape
+        if self._layout is None or self._layout[0] != (h, w) or self._resized.shape[2] != channels:
+            scale = min(self.input_h / h, self.input_w / w)
+            new_w, new_h = round(w * scale), round(h * scale)
+            pad_x, pad_y = (self.input_w - new_w) // 2, (self.input_h - new_h) // 2
+            self._input[:] = LETTERBOX_COLOR / 255.0
+            self._resized = np.empty((new_h, new_w, channels), dtype=np.uint8)
+            self._layout = ((h, w), scale, (pad_x, pad_y), (new_w, new_h))
+        _, scale, (pad_x, pad_y), (new_w, new_h) = self._layout
+        cv2.resize(frame, (new_w, new_h), dst=self._resized, interpolation=cv2.INTER_LINEAR)
+        # 丢弃Alpha通道、BGR→RGB、HWC→CHW 与归一化合并为一次写入 ([..., 2::-1] 对3通道和4通道都只取 R,G,B)
+        region = self._input[0, :, pad_y:pad_y + new_h, pad_x:pad_x + new_w]
+        np.multiply(self._resized[..., 2::-1].transpose(2, 0, 1), 1 / 255.0, out=region, casting='unsafe')
+
+    def detect(self, frame: np.ndarray):
+        self._letterbox(frame)
+        output = self.session.run(None, {self.input_name: self._input})[0][0]  # (4 + 类别数, 候选数)
+        return self._postprocess(output)
+
+    def _postprocess(self, output: np.ndarray):
+        class_scores = output[4:]
+        class_ids = class_scores.argmax(axis=0)
+        scores = class_scores[class_ids, np.arange(class_scores.shape[1])]
+        keep = scores > self.conf
+        if not keep.any():
+            return np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, np.int64)
+        cx, cy, bw, bh = output[:4, keep]
+        scores, class_ids = scores[keep], class_ids[keep]
+        xyxy = np.stack([cx - bw / 2, cy - bh / 2, cx + bw / 2, cy + bh / 2], axis=1)
+        keep = nms(xyxy, scores, class_ids, self.iou)[:self.max_det]
+        xyxy, scores, class_ids = xyxy[keep], scores[keep], class_ids[keep]
+
+        # NMS 之后再从 letterbox 坐标还原到原图坐标并裁剪到画面内
+        (h, w), scale, (pad_x, pad_y), _ = self._layout
+        xyxy -= (pad_x, pad_y, pad_x, pad_y)
+        xyxy /= scale
+        np.clip(xyxy[:, 0::2], 0, w, out=xyxy[:, 0::2])
+        np.clip(xyxy[:, 1::2], 0, h, out=xyxy[:, 1::2])
+        return xyxy.astype(np.float32), scores, class_ids
+
+
+def nms(xyxy: np.ndarray, scores: np.ndarray, class_ids: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """按类别的非极大值抑制 (给不同类别的框加上互不重叠的偏移，一次完成所有类别)，返回保留下来的索引。"""
+    offset = class_ids[:, None] * (xyxy.max() + 1)
+    boxes = xyxy + offset
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    order = scores.argsort()[::-1]
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        inter_w = np.clip(np.minimum(boxes[i, 2], boxes[rest, 2]) - np.maximum(boxes[i, 0], boxes[rest, 0]), 0, None)
+        inter_h = np.clip(np.minimum(boxes[i, 3], boxes[rest, 3]) - np.maximum(boxes[i, 1], boxes[rest, 1]), 0, None)
+        inter = inter_w * inter_h
+        iou = inter / (areas[i] + areas[rest] - inter + 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def draw_detections(frame: np.ndarray, detections, class_map: dict) -> np.ndarray:
+    """在帧的副本上绘制检测框，用于调试窗口。"""
+    canvas = cv2.cvtColor(frame, cv2.COLOR_BGRA2BGR) if frame.shape[2] == 4 else frame.copy()
+    xyxy, scores, class_ids = detections
+    for (x1, y1, x2, y2), score, class_id in zip(xyxy.astype(int), scores, class_ids):
+        cv2.rectangle(canvas, (x1, y1), (x2, y2), (0, 255, 0), 2)
+        label = f"{class_map.get(int(class_id), 'unknown')} {score:.2f}"
+        cv2.putText(canvas, label, (x1, max(y1 - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.45, (0, 255, 0), 1)
+    return canvas
@@ -0,0 +1,71 @@
+# utils/perception.py
+
+import numpy as np
+
+from controller import get_action
+from utils.frame_gate import FrameGate, crop_ahead
+from utils.tracker import ObstacleTracker
+
+class Perception:
+    """
+    机器人的“感知-决策”一步：按需检测 (频率限制、变化门控、前方区域裁剪)，更新跟踪器，输出动作。
+    不涉及截图和按键，实时运行 (play_game.py) 与离线回放共用同一套逻辑。
+    """
+
+    def __init__(self, detector, detect_fps: float = 0, gate: FrameGate = None,
+                 crop_width: int = 0, full_frame_every: int = 10, action_cooldown: float = 0.4):
+        self.detector = detector
+        self.tracker = ObstacleTracker(detector.class_map)
+        self.detect_interval = 1 / detect_fps if detect_fps > 0 else 0
+        self.gate = gate
+        self.crop_width = crop_width              # 0 表示不裁剪
+        self.full_frame_every = full_frame_every  # 裁剪模式下每隔多少次检测做一次全画面检测，以免漏掉区域外的恐龙
+        self.action_cooldown = action_cooldown    # 同一动作连发的冷却时间 (秒)；换成不同的动作时立即替换
+        self.last_detections = None
+        self._last_action, self._last_action_time = None, float('-inf')
+        self.stats = {"frames": 0, "inferred": 0, "gated": 0, "cropped": 0}
+        self._last_detect_time = float('-inf')
+
+    def _dino_box(self):
+        for track in self.tracker.tracks:
+            if track.label == 'dino':
+                return track.box
+        return None
+
+    def _detect(self, frame):
+        dino_box = self._dino_box()
+        if self.crop_width and dino_box is not None and self.stats["inferred"] % self.full_frame_every:
+            region, x0 = crop_ahead(frame, dino_box, self.crop_width)
+            xyxy, scores, class_ids = self.detector.detect(region)
+            xyxy[:, 0::2] += x0
+            self.stats["cropped"] += 1
+            return xyxy, scores, class_ids
+        return self.detector.detect(frame)
+
+    def step(self, frame: np.ndarray, timestamp: float):
+        """处理一帧，返回 (动作或None, 本帧新跑出的检测结果或None)。"""
+        self.stats["frames"] += 1
+        frame_h, frame_w, _ = frame.shape
+        # 未到检测时刻的帧不跑模型，只用跟踪器外推的位置决策
+        detections, fresh = None, None
+        if timestamp - self._last_detect_time >= self.detect_interval:
+            self._last_detect_time = timestamp
+            if self.gate is not None and self.last_detections is not None and not self.gate.changed(frame):
+                # 画面几乎没有变化：复用上一次的检测结果 (跟踪器据此把速度衰减到0)
+                detections = self.last_detections
+                self.stats["gated"] += 1
+            else:
+                if self.gate is not None and self.last_detections is None:
+                    self.gate.changed(frame)  # 以首次检测的帧作为门控的参考帧
+                detections = fresh = self._detect(frame)
+                self.last_detections = detections
+                self.stats["inferred"] += 1
+        action = get_action(detections, self.detector.class_map, frame_h, tracker=self.tracker, timestamp=timestamp)
+        return action, fresh
+
+    def should_fire(self, action, now: float) -> bool:
+        """冷却只用于防止同一动作连发；换成不同的动作 (如下蹲改为跳跃) 时立即放行。放行时记录动作与时刻。"""
+        if not action or (action == self._last_action and now - self._last_action_time <= self.action_cooldown):
+            return False
+        self._last_action, self._last_action_time = action, now
+        return True
@@ -40,12 +40,29 @@ class ScreenCapturer:
             "height": h
         }
         print(f"✅ 游戏区域选择成功: {self.roi}")
-            
+
+    def bind_to_current_thread(self):
+        """mss 的截图句柄与创建它的线程绑定；在独立的采集线程中使用前，需要在该线程内重新创建。"""
+        self.sct = mss.mss()
+
     def capture(self) -> np.ndarray:
         """捕获已选定区域的屏幕截图。"""
+        return cv2.cvtColor(self.capture_bgra(), cv2.COLOR_BGRA2BGR)
+
+    def capture_bgra(self, out: np.ndarray = None) -> np.ndarray:
+        """
+        捕获已选定区域，返回 (高, 宽, 4) 的 BGRA 数组，不做颜色转换。
+        - 不传 out: 直接返回 mss 截图缓冲区的零拷贝视图。mss 每次截图都会新建缓冲区，
+          因此这个视图可以安全地交给其他线程，而不会被下一次截图覆盖。
+        - 传入 out: 把像素写入调用方预分配、可反复使用的缓冲区 (适合单线程循环)，返回 out。
+        检测器的预处理可以直接消费 BGRA 数组，丢弃 Alpha 通道与缩放合并在一步中完成。
+        """
         if not self.roi:
             raise ValueError("必须先调用 select_roi() 来选择一个区域。")
-        
+
         sct_img = self.sct.grab(self.roi)
-        img = np.array(sct_img)
-        return cv2.cvtColor(img, cv2.COLOR_BGRA2BGR)
\ No newline at end of file
+        view = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+        if out is None:
+            return view
+        np.copyto(out, view)
+        return out
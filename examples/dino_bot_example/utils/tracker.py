@@ -0,0 +1,106 @@
+# utils/tracker.py
+
+import itertools
+import numpy as np
+
+class Track:
+    """一个被跟踪的物体：最近一次观测到的框、匀速运动模型的速度 (像素/秒) 和观测次数。"""
+
+    __slots__ = ("track_id", "label", "box", "velocity", "updated_at", "hits")
+
+    def __init__(self, track_id, label, box, updated_at):
+        self.track_id = track_id
+        self.label = label
+        self.box = np.asarray(box, dtype=np.float64)
+        self.velocity = np.zeros(2)
+        self.updated_at = updated_at
+        self.hits = 1
+
+    @property
+    def has_velocity(self) -> bool:
+        """至少被观测两次后速度估计才可用。"""
+        return self.hits >= 2
+
+    def predict(self, t: float) -> np.ndarray:
+        """按匀速模型外推到时刻 t 的框 (xyxy)。"""
+        vx, vy = self.velocity * (t - self.updated_at)
+        return self.box + (vx, vy, vx, vy)
+
+
+def _centers(boxes):
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    return np.stack([(boxes[:, 0] + boxes[:, 2]) / 2, (boxes[:, 1] + boxes[:, 3]) / 2], axis=1)
+
+
+class ObstacleTracker:
+    """
+    轻量的多目标跟踪器 (匀速模型 + 指数平滑的速度估计)。
+    检测结果按类别与各轨迹的外推位置做贪心最近邻关联，从而在帧间保持物体身份和速度；
+    没有新检测时，predict() 可以把所有轨迹外推到任意时刻，允许检测器以更低的频率运行。
+    """
+
+    def __init__(self, class_map: dict, max_match_distance: float = 120.0, max_backward_motion: float = 15.0,
+                 max_age: float = 0.5, velocity_smoothing: float = 0.5, static_labels=('dino',)):
+        self.class_map = class_map
+        self.static_labels = set(static_labels)         # 这些类别不做外推 (恐龙只做上下跳跃，外推反而会漂移)
+        self.max_match_distance = max_match_distance    # 外推位置与检测中心的最大关联距离 (像素)
+        self.max_backward_motion = max_backward_motion  # 障碍物只会向左移动，向右跳变超过该值的关联视为无效
+        self.max_age = max_age                          # 轨迹超过该时长 (秒) 未被观测到即删除
+        self.velocity_smoothing = velocity_smoothing    # 新速度观测的权重 (0~1)
+        self.tracks = []
+        self._ids = itertools.count()
+
+    def update(self, detections, t: float) -> list:
+        """用一帧检测结果 (xyxy, scores, class_ids) 更新轨迹，返回当前所有轨迹。"""
+        xyxy, _, class_ids = detections
+        labels = [self.class_map.get(int(class_id), 'unknown') for class_id in class_ids]
+        det_centers = _centers(xyxy)
+        unmatched = set(range(len(labels)))
+        matched_tracks = set()
+
+        if self.tracks and labels:
+            track_centers = _centers([box for _, box in self._positions(self.tracks, t)])
+            cost = np.linalg.norm(track_centers[:, None, :] - det_centers[None, :, :], axis=2)
+            dx = det_centers[None, :, 0] - track_centers[:, None, 0]
+            same_label = np.array([[track.label == label for label in labels] for track in self.tracks])
+            is_obstacle = np.array([track.label not in self.static_labels for track in self.tracks])[:, None]
+            valid = same_label & (cost <= self.max_match_distance) & ~(is_obstacle & (dx > self.max_backward_motion))
+            cost = np.where(valid, cost, np.inf)
+            # 贪心关联：每次取全局代价最小的一对
+            for flat in np.argsort(cost, axis=None):
+                ti, di = np.unravel_index(flat, cost.shape)
+                if not np.isfinite(cost[ti, di]):
+                    break
+                if di not in unmatched or ti in matched_tracks:
+                    continue
+                self._correct(self.tracks[ti], xyxy[di], t)
+                unmatched.discard(di)
+                matched_tracks.add(ti)
+
+        for di in sorted(unmatched):
+            self.tracks.append(Track(next(self._ids), labels[di], xyxy[di], t))
+        self.tracks = [track for track in self.tracks if t - track.updated_at <= self.max_age]
+        return self.tracks
+
+    def _correct(self, track: Track, box, t: float):
+        dt = t - track.updated_at
+        if dt > 0:
+            measured = (_centers(box)[0] - _centers(track.box)[0]) / dt
+            if track.has_velocity:
+                a = self.velocity_smoothing
+                track.velocity = a * measured + (1 - a) * track.velocity
+            else:
+                track.velocity = measured
+        track.box = np.asarray(box, dtype=np.float64)
+        track.updated_at = t
+        track.hits += 1
+
+    def predict(self, t: float) -> list:
+        """返回所有轨迹外推到时刻 t 的 [(轨迹, 框)]。"""
+        return self._positions([track for track in self.tracks if t - track.updated_at <= self.max_age], t)
+
+    def _positions(self, tracks, t: float) -> list:
+        return [(track, track.box if track.label in self.static_labels else track.predict(t)) for track in tracks]
+
+    def reset(self):
+        self.tracks = []
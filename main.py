@@ -1,7 +1,6 @@
 # main.py 
 
 import argparse
-import importlib
 import sys
 from pathlib import Path
 
@@ -22,59 +21,136 @@ def main():
     parser.add_argument(
         "-b", "--blueprint",
         type=str,
-        required=True,
         help="指定要使用的蓝图名称 (例如: 'dino_game')"
     )
     
     parser.add_argument(
         "-s", "--step",
         type=str,
-        required=True,
-        choices=['synthesize', 'pretrain', 'finetune', 'export', 'all'],
+        choices=['synthesize', 'prepare', 'pretrain', 'finetune', 'mixed', 'export', 'tune', 'all', 'unpack', 'stats', 'benchmark-shapes'],
         help="""选择要执行的铸造步骤:
   - synthesize: (重新)生成合成数据
+  - prepare:    把合成与真实数据集预缩放到训练分辨率并缓存，加速训练时的数据读取
   - pretrain:   使用合成数据进行预训练
   - finetune:   使用真实数据进行微调
+  - mixed:      (可选) 按比例计划同时采样合成与真实数据，一次训练取代 pretrain + finetune，并报告达到目标精度的时间
   - export:     导出最终的微调模型为ONNX
-  - all:        执行从合成到导出的所有步骤"""
+  - tune:       在本机CPU上调优导出模型的onnxruntime运行设置
+  - all:        执行从合成到调优的所有步骤
+  - unpack:     将打包格式的合成数据集还原为YOLO目录结构
+  - stats:      索引合成与真实数据集的全部标签，报告类别分布、框尺寸、空图片及与 CLASSES 不一致之处
+  - benchmark-shapes: 按 SHAPE_BENCHMARK 中的各输入尺寸分别微调并导出，比较延迟与mAP"""
+    )
+
+    parser.add_argument(
+        "-w", "--workers",
+        type=int,
+        default=1,
+        help="synthesize 与 stats 步骤使用的并行工作进程数 (默认: 1)。\n输出与工作进程数无关，结果完全一致。"
+    )
+
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="pretrain 时在内存中即时合成训练数据，不读写磁盘。\n与 --step all 同用时会跳过 synthesize 步骤。"
+    )
+
+    parser.add_argument(
+        "-f", "--force",
+        action="store_true",
+        help="强制重新执行所选步骤，即使其输入与产物均未变化。"
+    )
+
+    parser.add_argument(
+        "--list-blueprints",
+        action="store_true",
+        help="列出并校验所有可用的蓝图，然后退出 (不会加载任何训练引擎)。"
+    )
+
+    parser.add_argument(
+        "--dry-run",
+        action="store_true",
+        help="只打印解析后的执行计划 (每个步骤是否会执行及原因)，不实际执行。"
     )
 
     args = parser.parse_args()
 
-    # 2. 动态加载指定的蓝图配置模块
+    # 注意：本文件只在步骤真正执行时才导入 ultralytics/torch 等重量级引擎，
+    # 因此 --list-blueprints 与 --dry-run 可以在脚本和健康检查中被快速调用。
+    from foundry_engine import blueprint_registry
+
+    if args.list_blueprints:
+        results = blueprint_registry.describe_all()
+        print(f"发现 {len(results)} 个蓝图 (位于 {blueprint_registry.BLUEPRINTS_DIR}):")
+        for name, problems in results:
+            print(f"  {'✅' if not problems else '❌'} {name}")
+            for problem in problems:
+                print(f"      - {problem}")
+        sys.exit(0 if all(not problems for _, problems in results) else 1)
+
+    if not args.blueprint or not args.step:
+        parser.error("必须同时指定 --blueprint 和 --step (或使用 --list-blueprints)。")
+
+    # 2. 通过蓝图注册表加载并校验指定的蓝图配置模块
     blueprint_name = args.blueprint
-    try:
-        # 动态导入类似 'blueprints.dino_game.config' 的模块
-        config_module_path = f"blueprints.{blueprint_name}.config"
-        config_module = importlib.import_module(config_module_path)
-        print(f"✅ 成功加载蓝图: {blueprint_name}")
-    except ImportError:
-        print(f"[致命错误] 找不到指定的蓝图 '{blueprint_name}'。")
+    config_module = blueprint_registry.load(blueprint_name)
+    if config_module is None:
+        available = ", ".join(blueprint_registry.discover()) or "无"
+        print(f"[致命错误] 找不到指定的蓝图 '{blueprint_name}' (可用蓝图: {available})。")
         print(f"  请确保 'cv_foundry_lib/blueprints/{blueprint_name}/' 目录和 config.py 文件存在。")
         sys.exit(1)
+    problems = blueprint_registry.validate(config_module)
+    if problems:
+        print(f"[致命错误] 蓝图 '{blueprint_name}' 的配置不完整:")
+        for problem in problems:
+            print(f"  - {problem}")
+        sys.exit(1)
+    print(f"✅ 成功加载蓝图: {blueprint_name}")
 
-    # 3. 根据步骤参数，调用相应的引擎模块
+    # 3. 根据步骤参数，通过流水线引擎调用相应的引擎模块
+    #    每个阶段声明自己的输入 (配置片段、数据集/模型指纹) 与产物，已是最新的阶段会被跳过
     step = args.step
-    
-    if step in ['synthesize', 'all']:
-        from foundry_engine import data_synthesizer
-        data_synthesizer.run(config_module)
-
-    # [新] 处理 pretrain
-    if step in ['pretrain', 'all']:
-        from foundry_engine import trainer
-        trainer.run(config_module, training_mode='pretrain')
-
-    # [新] 处理 finetune
-    if step in ['finetune', 'all']:
-        from foundry_engine import trainer
-        trainer.run(config_module, training_mode='finetune')
-
-    if step in ['export', 'all']:
-        from foundry_engine import exporter
-        # [修改] 导出器现在需要知道导出的源是微调模型
-        # (我们需要对exporter.py做个小修改)
-        exporter.run(config_module, source_model='finetune')
+
+    if step == 'unpack':
+        if args.dry_run:
+            print("\n📋 执行计划: 将打包格式的合成数据集还原为YOLO目录结构。")
+            return
+        from foundry_engine import packed_dataset
+        dataset_root = config_module.SYNTHESIS_CONFIG["OUTPUT_DATASET_DIR"]
+        packed_dataset.unpack_to_yolo(dataset_root / "packed", dataset_root)
+    elif step == 'stats':
+        if args.dry_run:
+            print("\n📋 执行计划: 增量索引合成与真实数据集的标签，输出统计报告。")
+            return
+        from foundry_engine import label_index
+        if label_index.run(config_module, workers=args.workers) is None:
+            sys.exit(1)
+    elif step == 'benchmark-shapes':
+        shapes = config_module.TRAINER_CONFIG.get("SHAPE_BENCHMARK", [])
+        if args.dry_run:
+            print(f"\n📋 执行计划: 对输入尺寸 {shapes} 分别微调、导出，并在真实数据上比较延迟与mAP。")
+            return
+        from foundry_engine import shape_benchmark
+        if shape_benchmark.run(config_module, shapes) is None:
+            sys.exit(1)
+    else:
+        from foundry_engine import pipeline
+        if step == 'all':
+            # 流式预训练不需要磁盘上的合成数据集
+            targets = [s for s in pipeline.STAGE_ORDER if not (args.stream and s == 'synthesize')]
+        else:
+            targets = [step]
+        foundry_pipeline = pipeline.build_pipeline(
+            config_module, workers=args.workers, stream=args.stream, force=args.force
+        )
+        if args.dry_run:
+            print(f"\n📋 执行计划 (蓝图 '{blueprint_name}', 步骤 '{step}'):")
+            for name, will_run, reason in foundry_pipeline.plan(targets, force=args.force):
+                label = {True: '▶️  执行', False: '⏭️  跳过', None: '❔ 可能执行'}[will_run]
+                print(f"  {label}  {name:<11} ({reason})")
+            return
+        if not foundry_pipeline.run(targets, force=args.force):
+            sys.exit(1)
 
     print(f"\n🎉 蓝图 '{blueprint_name}' 的步骤 '{step}' 已成功执行完毕！")
 
@@ -1,5 +1,7 @@
 # tools/capture_tool.py (Windows版)
 
+import queue
+import threading
 import time
 from pathlib import Path
 import cv2
@@ -9,8 +11,18 @@ from pynput import keyboard
 
 # [路径修改] 输出到用户桌面下的一个新文件夹，非常直观
 OUTPUT_DIR = Path.home() / "Desktop" / "cv_foundry_capture" / "raw_screenshots"
+# 采集间隔 (秒)。采集时钟按固定节拍运行并自动补偿漂移，编码和写盘在后台线程中完成，
+# 不会拉长实际间隔；快节奏阶段可设为 0.05 (20 FPS) 或更小。
 CAPTURE_INTERVAL_SECONDS = 0.2
 STOP_KEY = keyboard.Key.esc
+# 编码/写盘线程数与帧队列容量：队列满时新帧会被丢弃并计入丢帧数，而不是阻塞采集时钟
+WRITER_THREADS = 4
+QUEUE_SIZE = 64
+# PNG 压缩级别 (0-9，无损)。级别越低编码越快、文件越大
+PNG_COMPRESSION = 1
+# 采集时内联的SAD去冗余：与上一张保留帧的逐像素平均绝对差不超过该值时不写盘 (与 filter_tool.py 的判定一致)。
+# 设为 None 则保留所有帧。
+INLINE_SAD_THRESHOLD_PER_PIXEL = None
 
 # ... (其余代码与之前的WSL版本完全相同) ...
 capturing = True
@@ -35,31 +47,103 @@ def select_roi(sct):
     x, y, w, h = roi_coords
     return {"top": monitor["top"] + y, "left": monitor["left"] + x, "width": w, "height": h}
 
+def _is_redundant(last_frame, frame):
+    if INLINE_SAD_THRESHOLD_PER_PIXEL is None or last_frame is None or last_frame.shape != frame.shape:
+        return False
+    sad = sum(cv2.sumElems(cv2.absdiff(last_frame, frame)))
+    return sad / frame.size <= INLINE_SAD_THRESHOLD_PER_PIXEL
+
+def _producer(frame_queue, stats):
+    """按固定节拍采集：第 k 帧的目标时刻为 start + k * 间隔，睡眠时间扣除采集耗时，落后超过一个节拍时跳过错过的节拍。"""
+    last_kept = None
+    try:
+        # mss 的句柄与线程绑定，因此采集线程使用自己的实例
+        with mss.mss() as sct:
+            start = time.perf_counter()
+            tick = 0
+            while capturing:
+                delay = start + tick * CAPTURE_INTERVAL_SECONDS - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                frame = cv2.cvtColor(np.asarray(sct.grab(roi)), cv2.COLOR_BGRA2BGR)
+                timestamp = time.time_ns()
+                stats["grabbed"] += 1
+                # 计算下一节拍；如果本帧耗时超过一个间隔，错过的节拍直接跳过，不做补拍
+                next_tick = int((time.perf_counter() - start) / CAPTURE_INTERVAL_SECONDS) + 1
+                stats["missed_ticks"] += max(0, next_tick - tick - 1)
+                tick = next_tick
+                if _is_redundant(last_kept, frame):
+                    stats["gated"] += 1
+                    continue
+                try:
+                    frame_queue.put_nowait((timestamp, frame))
+                    last_kept = frame
+                except queue.Full:
+                    stats["dropped"] += 1
+    except Exception as e:
+        # 截图区域超出屏幕、显示器配置变化等：记录错误，由 main() 报告
+        stats["error"] = e
+    finally:
+        # 无论采集是否异常结束，都要通知写盘线程退出，否则 main() 会一直等待它们
+        for _ in range(WRITER_THREADS):
+            frame_queue.put(None)
+
+def _writer(frame_queue, stats, lock):
+    params = [cv2.IMWRITE_PNG_COMPRESSION, PNG_COMPRESSION]
+    while True:
+        item = frame_queue.get()
+        if item is None:
+            return
+        timestamp, frame = item
+        ok = cv2.imwrite(str(OUTPUT_DIR / f"{timestamp}.png"), frame, params)
+        with lock:
+            stats["written" if ok else "write_errors"] += 1
+
 def main():
     global roi
     print("--- CV_Foundry 真实数据采集工具 (Windows版) ---")
     OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
     with mss.mss() as sct:
         roi = select_roi(sct)
-        if roi is None:
-            print("[错误] 未选择任何区域，程序退出。")
-            return
-        print(f"✅ 区域选择成功: {roi}")
-        print(f"将在3秒后开始高频截图，请切换到游戏窗口...")
-        print(f"采集过程中，按 'ESC' 键可随时停止。")
-        time.sleep(3)
-        listener = keyboard.Listener(on_press=on_press)
-        listener.start()
-        count = 0
-        while capturing:
-            sct_img = sct.grab(roi)
-            img_bgr = cv2.cvtColor(np.array(sct_img), cv2.COLOR_BGRA2BGR)
-            timestamp = time.time_ns()
-            cv2.imwrite(str(OUTPUT_DIR / f"{timestamp}.png"), img_bgr)
-            count += 1
-            print(f"已采集 {count} 帧...", end='\r')
-            time.sleep(CAPTURE_INTERVAL_SECONDS)
-    print(f"\n采集结束。共采集 {count} 帧到目录: {OUTPUT_DIR}")
+    if roi is None:
+        print("[错误] 未选择任何区域，程序退出。")
+        return
+    print(f"✅ 区域选择成功: {roi}")
+    print(f"将在3秒后开始高频截图 (目标 {1 / CAPTURE_INTERVAL_SECONDS:.1f} FPS)，请切换到游戏窗口...")
+    print(f"采集过程中，按 'ESC' 键可随时停止。")
+    time.sleep(3)
+    listener = keyboard.Listener(on_press=on_press)
+    listener.start()
+
+    stats = {"grabbed": 0, "gated": 0, "dropped": 0, "missed_ticks": 0, "written": 0, "write_errors": 0}
+    lock = threading.Lock()
+    frame_queue = queue.Queue(maxsize=QUEUE_SIZE)
+    writers = [threading.Thread(target=_writer, args=(frame_queue, stats, lock), daemon=True) for _ in range(WRITER_THREADS)]
+    for thread in writers:
+        thread.start()
+    producer = threading.Thread(target=_producer, args=(frame_queue, stats), daemon=True)
+    start = time.perf_counter()
+    producer.start()
+    while producer.is_alive():
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        print(f"已采集 {stats['grabbed']} 帧 ({stats['grabbed'] / elapsed:.1f} FPS)，已写入 {stats['written']} 帧，"
+              f"队列 {frame_queue.qsize()}/{QUEUE_SIZE}...", end='\r')
+        producer.join(timeout=0.5)
+    elapsed = time.perf_counter() - start
+    print("\n正在等待剩余帧写入磁盘...")
+    for thread in writers:
+        thread.join()
+
+    if stats.get("error") is not None:
+        print(f"\n[错误] 采集线程异常终止: {stats['error']!r}，已保存此前采集的帧。")
+    print(f"\n采集结束。共采集 {stats['grabbed']} 帧，写入 {stats['written']} 帧到目录: {OUTPUT_DIR}")
+    print(f"  > 实际采集速率: {stats['grabbed'] / max(elapsed, 1e-6):.2f} FPS (目标 {1 / CAPTURE_INTERVAL_SECONDS:.2f} FPS)")
+    print(f"  > 错过的节拍: {stats['missed_ticks']} (单帧采集耗时超过采集间隔)")
+    print(f"  > 丢弃的帧: {stats['dropped']} (写盘队列已满)")
+    if INLINE_SAD_THRESHOLD_PER_PIXEL is not None:
+        print(f"  > SAD去冗余跳过: {stats['gated']} 帧")
+    if stats["write_errors"]:
+        print(f"[警告] 有 {stats['write_errors']} 帧写入失败。")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
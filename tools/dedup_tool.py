@@ -0,0 +1,183 @@
+# tools/dedup_tool.py (Windows版)
+
+import cv2
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+import numpy as np
+from tqdm import tqdm
+
+# [路径] 与 filter_tool.py 保持一致：默认对其输出做全局去重
+BASE_DIR = Path.home() / "Desktop" / "cv_foundry_capture"
+INPUT_DIRS = [BASE_DIR / "filtered_for_annotation/"]
+# 输出目录由工具完全管理：每次运行后只包含当前保留的图片，不在保留集合中的图片会被删除
+OUTPUT_DIR = BASE_DIR / "deduplicated_for_annotation/"
+# 持久化的感知哈希索引：记录每个文件的哈希与去重结论，新增采集批次时旧文件无需重新计算
+INDEX_PATH = BASE_DIR / "phash_index.json"
+# 两帧感知哈希 (64位) 的汉明距离不超过该值即视为近似重复
+HAMMING_THRESHOLD = 6
+HASH_THREADS = 4
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
+
+
+def phash(img_gray) -> int:
+    """64位DCT感知哈希：缩放到32x32，取低频8x8系数，与中位数比较得到每一位。"""
+    small = cv2.resize(img_gray, (32, 32), interpolation=cv2.INTER_AREA).astype(np.float32)
+    low_freq = cv2.dct(small)[:8, :8].flatten()
+    median = np.median(low_freq[1:])  # 排除直流分量，避免整体亮度主导结果
+    bits = low_freq > median
+    return int("".join("1" if b else "0" for b in bits), 2)
+
+
+def hamming(a: int, b: int) -> int:
+    return (a ^ b).bit_count()
+
+
+class BKTree:
+    """基于汉明距离的BK树，支持在整个语料库中快速查找近似重复的哈希。"""
+
+    def __init__(self):
+        self.root = None  # 节点结构: [哈希, 条目, {距离: 子节点}]
+
+    def add(self, value: int, item):
+        if self.root is None:
+            self.root = [value, item, {}]
+            return
+        node = self.root
+        while True:
+            dist = hamming(value, node[0])
+            child = node[2].get(dist)
+            if child is None:
+                node[2][dist] = [value, item, {}]
+                return
+            node = child
+
+    def find_within(self, value: int, max_dist: int):
+        """返回距离最近且不超过 max_dist 的 (距离, 条目)，没有则返回 None。"""
+        if self.root is None:
+            return None
+        best = None
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            dist = hamming(value, node[0])
+            if dist <= max_dist and (best is None or dist < best[0]):
+                best = (dist, node[1])
+            # 三角不等式剪枝：只有距离落在 [dist - max_dist, dist + max_dist] 的子树可能命中
+            for child_dist, child in node[2].items():
+                if dist - max_dist <= child_dist <= dist + max_dist:
+                    stack.append(child)
+        return best
+
+
+def _load_index() -> dict:
+    try:
+        with open(INDEX_PATH, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _save_index(index: dict):
+    INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = INDEX_PATH.with_suffix(".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, ensure_ascii=False)
+    os.replace(tmp_path, INDEX_PATH)
+
+
+def _hash_file(path: Path):
+    img = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
+    return None if img is None else phash(img)
+
+
+def main():
+    print("--- CV_Foundry 全局近似重复去重工具 (感知哈希 + BK树) ---")
+    files = sorted(
+        path for input_dir in INPUT_DIRS if input_dir.exists()
+        for path in input_dir.iterdir() if path.name.endswith(IMAGE_EXTENSIONS)
+    )
+    if not files:
+        print(f"[错误] 输入目录 {[str(d) for d in INPUT_DIRS]} 中没有找到图片。")
+        print("请先运行 'capture_tool.py' 和 'filter_tool.py'。")
+        return
+    OUTPUT_DIR.mkdir(parents=True, exist_ok=True)
+
+    # 1. 增量计算感知哈希：文件大小和修改时间都未变的条目直接复用；已不存在的文件从索引中移除
+    index = _load_index()
+    removed = [key for key in index if not Path(key).exists()]
+    for key in removed:
+        del index[key]
+    keys = {path: str(path.resolve()) for path in files}
+    stale = []
+    for path in files:
+        st = path.stat()
+        entry = index.get(keys[path])
+        if entry is None or entry["size"] != st.st_size or entry["mtime_ns"] != st.st_mtime_ns:
+            index[keys[path]] = {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "hash": None, "duplicate_of": None}
+            stale.append(path)
+    print(f"共 {len(files)} 张图片，其中 {len(stale)} 张需要计算哈希 (其余来自索引)，索引中移除了 {len(removed)} 个已不存在的文件。")
+    with ThreadPoolExecutor(max_workers=HASH_THREADS) as pool:
+        for path, value in zip(stale, tqdm(pool.map(_hash_file, stale), total=len(stale), desc="计算感知哈希")):
+            index[keys[path]]["hash"] = None if value is None else f"{value:016x}"
+
+    # 2. 先用所有已有结论且被保留的图片建BK树，再对新图片 (以及原先保留的图片已被删除的近似重复) 逐一查询；
+    #    这样新图片与排序在其后的已保留图片之间的重复也能被发现
+    stale_set = set(stale)
+    for path in files:
+        entry = index[keys[path]]
+        if path not in stale_set and entry["duplicate_of"] is not None and entry["duplicate_of"] not in index:
+            entry["duplicate_of"] = None
+            stale_set.add(path)
+    tree = BKTree()
+    kept = []
+    duplicate_count = 0
+
+    def keep(path, value):
+        tree.add(value, keys[path])
+        kept.append(path)
+
+    queries = []
+    for path in files:
+        entry = index[keys[path]]
+        if entry["hash"] is None:
+            print(f"\n[警告] 无法解码图片 '{path.name}'，已跳过。")
+        elif path in stale_set:
+            queries.append(path)
+        elif entry["duplicate_of"] is None:
+            keep(path, int(entry["hash"], 16))
+        else:
+            duplicate_count += 1
+    for path in tqdm(queries, desc="全局去重"):
+        entry = index[keys[path]]
+        value = int(entry["hash"], 16)
+        match = tree.find_within(value, HAMMING_THRESHOLD)
+        if match is None:
+            keep(path, value)
+        else:
+            entry["duplicate_of"] = match[1]
+            duplicate_count += 1
+
+    # 3. 输出目录与保留集合保持一致：复制新保留 (或内容已变化) 的图片，删除源文件已不存在或已被判定为重复的旧副本
+    kept_names = {path.name for path in kept}
+    removed_outputs = 0
+    for target in OUTPUT_DIR.iterdir():
+        if target.name.endswith(IMAGE_EXTENSIONS) and target.name not in kept_names:
+            target.unlink()
+            removed_outputs += 1
+    for path in kept:
+        target = OUTPUT_DIR / path.name
+        st = path.stat()
+        if not target.exists() or (target.stat().st_size, target.stat().st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+            shutil.copy2(path, target)
+
+    _save_index(index)
+    print("\n✅ 去重完成！")
+    print(f"  > 保留 {len(kept)} 张图片，判定 {duplicate_count} 张为近似重复 (汉明距离 <= {HAMMING_THRESHOLD})。")
+    print(f"  > 去重后的数据集已保存至: {OUTPUT_DIR} (从输出目录中移除了 {removed_outputs} 张不再保留的图片)")
+    print(f"  > 感知哈希索引: {INDEX_PATH}")
+
+if __name__ == "__main__":
+    main()
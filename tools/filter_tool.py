@@ -2,8 +2,10 @@
 
 import cv2
 import os
+import shutil
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-import numpy as np
 from tqdm import tqdm
 
 # [路径修改] 从用户桌面读取和写入
@@ -11,11 +13,45 @@ BASE_DIR = Path.home() / "Desktop" / "cv_foundry_capture"
 INPUT_DIR = BASE_DIR / "raw_screenshots/"
 OUTPUT_DIR = BASE_DIR / "filtered_for_annotation/"
 SAD_THRESHOLD_PER_PIXEL = 1.5
+# SAD 计算前的降采样倍数：1 表示在原始分辨率上精确计算 (与旧版判定完全一致)，
+# 大于1时先用 INTER_AREA 缩小再比较，速度更快但判定结果可能与精确计算略有差异。
+SAD_DOWNSAMPLE = 1
+# 解码预取线程数与预取窗口 (cv2.imread 会释放GIL，多线程解码可以真正并行)
+DECODE_THREADS = 4
+PREFETCH_WINDOW = 32
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg')
 
 
 def calculate_sad(img1, img2):
-    if img1.shape != img2.shape: return float('inf') 
-    return np.sum(np.abs(img1.astype("float") - img2.astype("float")))
+    """两帧之间的绝对差之和 (整数运算，cv2.absdiff 不会溢出，结果与 float64 版本完全一致)。"""
+    if img1.shape != img2.shape: return float('inf')
+    return sum(cv2.sumElems(cv2.absdiff(img1, img2)))
+
+
+def _prepare(img):
+    """按 SAD_DOWNSAMPLE 对帧做降采样，返回用于比较的数组。"""
+    if img is None or SAD_DOWNSAMPLE <= 1:
+        return img
+    h, w = img.shape[:2]
+    return cv2.resize(img, (max(1, w // SAD_DOWNSAMPLE), max(1, h // SAD_DOWNSAMPLE)), interpolation=cv2.INTER_AREA)
+
+
+def _decode(path):
+    return _prepare(cv2.imread(str(path)))
+
+
+def _prefetch(pool, paths):
+    """在线程池中提前解码后续帧，按原顺序逐个产出 (路径, 图像)，同时最多保留 PREFETCH_WINDOW 个在途任务。"""
+    pending = deque()
+    for path in paths:
+        pending.append((path, pool.submit(_decode, path)))
+        if len(pending) >= PREFETCH_WINDOW:
+            done_path, future = pending.popleft()
+            yield done_path, future.result()
+    while pending:
+        done_path, future = pending.popleft()
+        yield done_path, future.result()
+
 
 def main():
     print("--- CV_Foundry 冗余数据智能过滤工具 (SAD黄金标准版) ---")
@@ -28,25 +64,28 @@ def main():
     if not image_files:
         print("[警告] 输入目录中没有找到图片。")
         return
+    image_paths = [INPUT_DIR / filename for filename in image_files if filename.endswith(IMAGE_EXTENSIONS)]
     last_accepted_image = None
     accepted_count = 0
     print(f"正在从 {len(image_files)} 张原始图片中过滤精华...")
-    for filename in tqdm(image_files, desc="过滤进度"):
-        if not filename.endswith(('.png', '.jpg', '.jpeg')): continue
-        img_path = INPUT_DIR / filename
-        current_image = cv2.imread(str(img_path))
-        if last_accepted_image is None:
-            cv2.imwrite(str(OUTPUT_DIR / filename), current_image)
-            last_accepted_image = current_image
-            accepted_count += 1
-            continue
-        sad = calculate_sad(last_accepted_image, current_image)
-        height, width, _ = current_image.shape
-        sad_per_pixel = sad / (height * width * 3)
-        if sad_per_pixel > SAD_THRESHOLD_PER_PIXEL:
-            cv2.imwrite(str(OUTPUT_DIR / filename), current_image)
+    with ThreadPoolExecutor(max_workers=DECODE_THREADS) as pool:
+        copy_jobs = []
+        for img_path, current_image in tqdm(_prefetch(pool, image_paths), total=len(image_paths), desc="过滤进度"):
+            if current_image is None:
+                print(f"\n[警告] 无法解码图片 '{img_path.name}'，已跳过。")
+                continue
+            if last_accepted_image is not None:
+                sad = calculate_sad(last_accepted_image, current_image)
+                height, width, _ = current_image.shape
+                sad_per_pixel = sad / (height * width * 3)
+                if sad_per_pixel <= SAD_THRESHOLD_PER_PIXEL:
+                    continue
+            # 直接复制原始文件，避免重新编码 (更快，且保留原始字节)
+            copy_jobs.append(pool.submit(shutil.copy2, img_path, OUTPUT_DIR / img_path.name))
             last_accepted_image = current_image
             accepted_count += 1
+        for job in copy_jobs:
+            job.result()
     print("\n✅ 过滤完成！")
     print(f"  > 共处理 {len(image_files)} 张原始图片。")
     print(f"  > 筛选出 {accepted_count} 张具有显著变化的图片。")